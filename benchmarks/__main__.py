@@ -0,0 +1,100 @@
+""" Run the benchmark suite, optionally comparing it with a baseline
+
+    python -m benchmarks [--only NAME [NAME ...]] [--output FILE] [--baseline FILE] [--tolerance RATIO]
+
+Results are written as JSON to --output. With --baseline, every metric is
+compared with the same metric of an earlier --output file and the run
+fails when one got worse by more than the tolerance. What the suites
+measure only for reference, the legacy models and the pickle and JSON
+codec timings, is not compared: it says nothing about a change to sleepi.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+from . import bench_codec, bench_models, bench_refresh
+
+DEFAULT_TOLERANCE = 0.2
+# Metrics where a larger value is better, every other one is a cost
+HIGHER_IS_BETTER = ("refreshes_per_second", "refreshes_per_cpu_second")
+# Settings recorded along with the results rather than measured
+NOT_COMPARED = ("rtt_ms",)
+# Metrics of code other than sleepi's, measured to compare it with
+REFERENCE_PREFIX = "legacy_"
+REFERENCE_FORMATS = ("pickle", "json")
+
+SUITES = {
+    "models": lambda args: bench_models.run(args.number, args.count),
+    "codec": lambda args: bench_codec.run(args.number),
+    "refresh": lambda args: bench_refresh.run(args.rtt, args.rounds, args.fleet_rounds, args.beds),
+}
+
+
+def flatten(results: dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """ Every numeric metric with its dotted path """
+    for name, value in results.items():
+        path = f"{prefix}.{name}" if prefix else name
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def is_compared(path: str) -> bool:
+    """ Whether a metric measures sleepi rather than a setting or a reference """
+    parts = path.split(".")
+    if parts[-1] in NOT_COMPARED or parts[-1].startswith(REFERENCE_PREFIX):
+        return False
+    # codec.<model>.<format>.<metric>
+    return not (parts[0] == "codec" and len(parts) > 2 and parts[-2] in REFERENCE_FORMATS)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """ The metrics that regressed by more than tolerance """
+    previous: Dict[str, float] = dict(flatten(baseline))
+    regressions = []
+    for path, value in flatten(results):
+        name = path.rsplit(".", 1)[-1]
+        if path not in previous or not is_compared(path) or not previous[path]:
+            continue
+        change = (value - previous[path]) / previous[path]
+        if name in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{path}: {previous[path]:.6g} -> {value:.6g} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=sorted(SUITES), default=sorted(SUITES), help="suites to run")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed regression ratio")
+    parser.add_argument("--number", type=int, default=5000, help="calls per timing run of models and codec")
+    parser.add_argument("--count", type=int, default=10000, help="objects held for the models memory measurement")
+    parser.add_argument("--rtt", type=float, default=bench_refresh.DEFAULT_RTT, help="injected round trip time")
+    parser.add_argument("--rounds", type=int, default=bench_refresh.DEFAULT_ROUNDS, help="refreshes of the single bed")
+    parser.add_argument("--fleet-rounds", type=int, default=bench_refresh.DEFAULT_FLEET_ROUNDS, help="refreshes of each fleet")
+    parser.add_argument("--beds", type=int, nargs="*", default=bench_refresh.DEFAULT_BEDS, help="fleet sizes")
+    args = parser.parse_args()
+
+    results = {name: SUITES[name](args) for name in args.only}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+""" Size and speed of sleepi.codec snapshots, compared with pickle and JSON
+
+    python -m benchmarks.bench_codec [--number N] [--json]
+
+JSON encodes attr.asdict of the models and its decode stops at dicts, it
+doesn't rebuild the models, so it flatters JSON.
+"""
+import argparse
+import json
+import pickle
+import timeit
+
+import attr
+
+from sleepi import codec, models
+
+from .payloads import BED_RESPONSE, FOUNDATION_STATUS, FOUNDATION_SYSTEM, OUTLET, SIDE, SLEEPER
+
+
+def full_bed() -> models.Bed:
+    """ A bed with everything fetch_homeassistant_data attaches to it """
+    bed = models.Bed.from_dict(BED_RESPONSE)
+    sleeper = models.Sleeper.from_dict(SLEEPER)
+    bed.left_side = models.Side.from_dict(SIDE, "left", sleeper)
+    bed.right_side = models.Side.from_dict(SIDE, "right", sleeper)
+    bed.foundation = models.Foundation.from_dict(FOUNDATION_SYSTEM)
+    bed.foundation.foundation_status = models.Foundation_Status.from_dict(FOUNDATION_STATUS)
+    bed.lights = [
+        models.Light.from_dict(dict(OUTLET, outlet=outlet), f"Sleep Number light {outlet}", 30, True)
+        for outlet in range(1, 5)
+    ]
+    return bed
+
+
+def cases() -> list:
+    """ The objects measured """
+    bed = full_bed()
+    return [
+        ("Bed", bed),
+        ("Side", bed.left_side),
+        ("Foundation_Status", bed.foundation.foundation_status),
+        ("Light", bed.lights[0]),
+    ]
+
+
+def _json_dumps(value) -> bytes:
+    return json.dumps(attr.asdict(value)).encode()
+
+
+FORMATS = [
+    ("codec", codec.encode, codec.decode),
+    ("pickle", lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL), pickle.loads),
+    ("json", _json_dumps, json.loads),
+]
+
+
+def best_time(function, argument, number: int) -> float:
+    """ Best of five runs, in seconds per call """
+    timer = timeit.Timer(lambda: function(argument))
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def run(number: int) -> dict:
+    """ Measure every object in every format """
+    results = {}
+    for name, value in cases():
+        results[name] = {}
+        for format_name, dumps, loads in FORMATS:
+            data = dumps(value)
+            results[name][format_name] = {
+                "bytes": len(data),
+                "encode_ns": best_time(dumps, value, number) * 1e9,
+                "decode_ns": best_time(loads, data, number) * 1e9,
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=5000, help="calls per timing run")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    results = run(args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'model':<20}{'format':<10}{'bytes':>8}{'encode ns':>12}{'decode ns':>12}")
+    for name, formats in results.items():
+        for format_name, result in formats.items():
+            print(
+                f"{name:<20}{format_name:<10}{result['bytes']:>8}"
+                f"{result['encode_ns']:>12.0f}{result['decode_ns']:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
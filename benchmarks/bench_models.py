@@ -0,0 +1,79 @@
+""" Memory and construction time of the models, compared with the legacy classes
+
+    python -m benchmarks.bench_models [--number N] [--count N] [--json]
+"""
+import argparse
+import gc
+import json
+import timeit
+import tracemalloc
+
+from sleepi import models
+
+from . import legacy_models as legacy
+from .payloads import BED_RESPONSE, FOUNDATION_STATUS, SIDE, SLEEPER
+
+CASES = [
+    ("Sleeper", models.Sleeper.from_dict, legacy.Sleeper.from_dict, (SLEEPER,)),
+    ("Side", models.Side.from_dict, legacy.Side.from_dict, (SIDE, "left")),
+    ("Foundation_Status", models.Foundation_Status.from_dict, legacy.Foundation_Status.from_dict, (FOUNDATION_STATUS,)),
+    ("Bed", models.Bed.from_dict, legacy.Bed.from_dict, (BED_RESPONSE,)),
+]
+
+
+def construction_time(from_dict, args, number: int) -> float:
+    """ Best of five runs, in seconds per object """
+    timer = timeit.Timer(lambda: from_dict(*args))
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def memory_per_object(from_dict, args, count: int) -> float:
+    """ Bytes allocated per object while holding count of them """
+    objects = [None] * count
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for index in range(count):
+            objects[index] = from_dict(*args)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / count
+
+
+def run(number: int, count: int) -> dict:
+    """ Measure every case """
+    results = {}
+    for name, current, previous, args in CASES:
+        results[name] = {
+            "construct_ns": construction_time(current, args, number) * 1e9,
+            "legacy_construct_ns": construction_time(previous, args, number) * 1e9,
+            "bytes": memory_per_object(current, args, count),
+            "legacy_bytes": memory_per_object(previous, args, count),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="constructions per timing run")
+    parser.add_argument("--count", type=int, default=10000, help="objects held for the memory measurement")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    results = run(args.number, args.count)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'model':<20}{'ns/object':>12}{'legacy':>12}{'bytes':>10}{'legacy':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<20}{result['construct_ns']:>12.0f}{result['legacy_construct_ns']:>12.0f}"
+            f"{result['bytes']:>10.0f}{result['legacy_bytes']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
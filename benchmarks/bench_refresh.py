@@ -0,0 +1,193 @@
+""" Refresh latency, requests, throughput and allocation against a local fake server
+
+    python -m benchmarks.bench_refresh [--rtt SECONDS] [--rounds N] [--beds N [N ...]] [--json]
+
+The fake server runs in its own process with the given round trip time,
+so the CPU time measured is the client's alone.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+import tracemalloc
+from typing import Dict, List
+
+from aiohttp import ClientSession, TraceConfig
+
+from sleepi import SleepIQ, SleepIQFleet
+from sleepi.fake import FakeSleepIQ
+from sleepi.fleet import tuned_connector
+
+DEFAULT_RTT = 0.02
+DEFAULT_ROUNDS = 30
+DEFAULT_FLEET_ROUNDS = 3
+DEFAULT_BEDS = [1, 100, 10000]
+PASSWORD = "password"
+
+
+def _serve(conn, rtt: float, accounts: int):
+    """ Run the fake server until the parent says stop """
+    async def serve():
+        fake = FakeSleepIQ(latency=rtt)
+        for index in range(accounts):
+            fake.add_account(f"user{index}", PASSWORD)
+        conn.send(await fake.start())
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await fake.close()
+
+    asyncio.run(serve())
+
+
+class FakeServerProcess:
+    """ A FakeSleepIQ with one bed per account, in a child process """
+    def __init__(self, rtt: float, accounts: int):
+        """ Initialize """
+        context = multiprocessing.get_context("spawn")
+        self._conn, child = context.Pipe()
+        self._process = context.Process(target=_serve, args=(child, rtt, accounts), daemon=True)
+
+    def __enter__(self) -> str:
+        self._process.start()
+        return self._conn.recv()
+
+    def __exit__(self, *exc_info):
+        self._conn.send(None)
+        self._process.join()
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """ p50, p95 and p99 of samples in seconds, in milliseconds """
+    ordered = sorted(samples)
+    result = {}
+    for percentile in (50, 95, 99):
+        index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))
+        result[f"p{percentile}_ms"] = ordered[index] * 1e3
+    return result
+
+
+def counting_session(counts: Dict[str, int], limit: int) -> ClientSession:
+    """ A session counting the requests it sends """
+    async def on_request_start(session, context, params):
+        counts["requests"] += 1
+
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    return ClientSession(connector=tuned_connector(limit), trace_configs=[trace_config])
+
+
+async def allocated_per_call(call) -> float:
+    """ Peak bytes allocated while a call runs """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        await call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+async def bench_single_bed(base_url: str, rounds: int) -> dict:
+    """ One client, one bed: latency and cost of a full refresh and of the lights """
+    counts = {"requests": 0}
+    async with counting_session(counts, 100) as session:
+        api = SleepIQ("user0", PASSWORD, session, base_url=base_url)
+        await api.fetch_homeassistant_data()
+
+        refresh, lights = [], []
+        counts["requests"] = 0
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await api.fetch_homeassistant_data()
+            refresh.append(time.perf_counter() - started)
+        requests = counts["requests"] / rounds
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await api.get_light_status()
+            lights.append(time.perf_counter() - started)
+
+        return {
+            "refresh": percentiles(refresh),
+            "light_status": percentiles(lights),
+            "requests_per_refresh": requests,
+            "bytes_per_poll": await allocated_per_call(api.fetch_homeassistant_data),
+        }
+
+
+async def bench_fleet(base_url: str, beds: int, rounds: int) -> dict:
+    """ Every bed of a fleet at once: throughput per second and per CPU second """
+    counts = {"requests": 0}
+    session = counting_session(counts, 100)
+    fleet = SleepIQFleet(websession=session, base_url=base_url)
+    try:
+        for index in range(beds):
+            fleet.add_account(f"user{index}", PASSWORD)
+        await fleet.refresh()
+
+        wall, cpu = [], []
+        counts["requests"] = 0
+        for _ in range(rounds):
+            started, started_cpu = time.perf_counter(), time.process_time()
+            results = await fleet.refresh()
+            wall.append(time.perf_counter() - started)
+            cpu.append(time.process_time() - started_cpu)
+            failed = sum(result.error is not None for result in results.values())
+            if failed:
+                raise RuntimeError(f"{failed} of {beds} beds failed to refresh")
+
+        return {
+            "round": percentiles(wall),
+            "requests_per_refresh": counts["requests"] / rounds / beds,
+            "refreshes_per_second": beds * rounds / sum(wall),
+            "refreshes_per_cpu_second": beds * rounds / sum(cpu),
+            "bytes_per_poll": await allocated_per_call(fleet.refresh) / beds,
+        }
+    finally:
+        await fleet.close()
+        await session.close()
+
+
+def run(rtt: float, rounds: int, fleet_rounds: int, beds: List[int]) -> dict:
+    """ Measure a single bed, then fleets of the given sizes """
+    results = {"rtt_ms": rtt * 1e3}
+    with FakeServerProcess(rtt, max(beds + [1])) as base_url:
+        results["single_bed"] = asyncio.run(bench_single_bed(base_url, rounds))
+        for count in beds:
+            results[f"fleet_{count}"] = asyncio.run(bench_fleet(base_url, count, fleet_rounds))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt", type=float, default=DEFAULT_RTT, help="injected round trip time, in seconds")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="refreshes of the single bed")
+    parser.add_argument("--fleet-rounds", type=int, default=DEFAULT_FLEET_ROUNDS, help="refreshes of each fleet")
+    parser.add_argument("--beds", type=int, nargs="*", default=DEFAULT_BEDS, help="fleet sizes")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    results = run(args.rtt, args.rounds, args.fleet_rounds, args.beds)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    single = results["single_bed"]
+    print(f"round trip time {results['rtt_ms']:.0f} ms")
+    print(
+        f"single bed: refresh p50/p95/p99 {single['refresh']['p50_ms']:.1f}/{single['refresh']['p95_ms']:.1f}/"
+        f"{single['refresh']['p99_ms']:.1f} ms, light status p50 {single['light_status']['p50_ms']:.1f} ms, "
+        f"{single['requests_per_refresh']:.1f} requests and {single['bytes_per_poll']:.0f} bytes per refresh"
+    )
+    print(f"{'beds':>8}{'round p50 ms':>14}{'requests':>10}{'per s':>10}{'per cpu s':>11}{'bytes':>10}")
+    for count in args.beds:
+        fleet = results[f"fleet_{count}"]
+        print(
+            f"{count:>8}{fleet['round']['p50_ms']:>14.0f}{fleet['requests_per_refresh']:>10.1f}"
+            f"{fleet['refreshes_per_second']:>10.0f}{fleet['refreshes_per_cpu_second']:>11.0f}"
+            f"{fleet['bytes_per_poll']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
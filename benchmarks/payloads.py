@@ -0,0 +1,103 @@
+""" Sample SleepIQ responses used by the benchmarks """
+
+BED = {
+    "registrationDate": "2020-01-01T00:00:00Z",
+    "sleeperRightId": "-9223372036854775807",
+    "base": "FlexFit",
+    "returnRequestStatus": 0,
+    "size": "KING",
+    "name": "Bed",
+    "serial": "",
+    "isKidsBed": False,
+    "dualSleep": True,
+    "bedId": "-9223372036854775800",
+    "status": 1,
+    "sleeperLeftId": "-9223372036854775806",
+    "version": "",
+    "accountId": "-9223372036854775801",
+    "timezone": "US/Central",
+    "generation": "360",
+    "model": "P6",
+    "purchaseDate": "2020-01-01T00:00:00Z",
+    "macAddress": "64DBA0000000",
+    "sku": "QP6",
+    "zipcode": "55401",
+    "reference": "95000794555-1",
+}
+BED_RESPONSE = {"beds": [BED]}
+
+SLEEPER = {
+    "firstName": "Pat",
+    "active": True,
+    "emailValidated": True,
+    "gender": 1,
+    "isChild": False,
+    "bedId": BED["bedId"],
+    "birthYear": "1980",
+    "zipCode": "55401",
+    "timezone": "US/Central",
+    "privacyPolicyVersion": 1,
+    "duration": None,
+    "weight": 150,
+    "sleeperId": BED["sleeperLeftId"],
+    "firstSessionRecorded": "2020-01-01T00:00:00Z",
+    "height": 70,
+    "licenseVersion": 6,
+    "username": "pat@example.com",
+    "birthMonth": 1,
+    "sleepGoal": 480,
+    "accountId": BED["accountId"],
+    "isAccountOwner": True,
+    "email": "pat@example.com",
+    "lastLogin": "2020-01-01 00:00:00 CST",
+    "side": 0,
+}
+
+SIDE = {
+    "isInBed": True,
+    "alertDetailedMessage": "No Alert",
+    "sleepNumber": 40,
+    "alertId": 0,
+    "lastLink": "00:00:00",
+    "pressure": 1053,
+}
+
+FOUNDATION_SYSTEM = {
+    "fsBedType": 2,
+    "fsBoardFaults": 0,
+    "fsBoardFeatures": 31,
+    "fsBoardHWRevisionCode": 1,
+    "fsBoardStatus": 0,
+    "fsLeftUnderbedLightPWM": 30,
+    "fsRightUnderbedLightPWM": 30,
+}
+
+FOUNDATION_STATUS = {
+    "fsCurrentPositionPresetRight": "Flat",
+    "fsNeedsHoming": False,
+    "fsRightFootPosition": "00",
+    "fsLeftPositionTimerLSB": "00",
+    "fsTimerPositionPresetLeft": "No timer running, thus no preset to active",
+    "fsCurrentPositionPresetLeft": "Flat",
+    "fsLeftPositionTimerMSB": "00",
+    "fsRightFootActuatorMotorStatus": "00",
+    "fsCurrentPositionPreset": "00",
+    "fsTimerPositionPresetRight": "No timer running, thus no preset to active",
+    "fsType": "Split King",
+    "fsOutletsOn": False,
+    "fsLeftHeadPosition": "09",
+    "fsIsMoving": False,
+    "fsRightHeadActuatorMotorStatus": "00",
+    "fsStatusSummary": "42",
+    "fsTimerPositionPreset": "00",
+    "fsLeftFootPosition": "00",
+    "fsRightPositionTimerLSB": "00",
+    "fsTimedOutletsOn": False,
+    "fsRightHeadPosition": "0c",
+    "fsConfigured": True,
+    "fsRightPositionTimerMSB": "00",
+    "fsLeftHeadActuatorMotorStatus": "00",
+    "fsLeftFootActuatorMotorStatus": "00",
+}
+
+OUTLET = {"bedId": BED["bedId"], "outlet": 1, "setting": 0, "timer": ""}
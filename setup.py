@@ -40,6 +40,7 @@ setup(
     description="An async library for SleepIQ (Sleep Number)",
     include_package_data=True,
     install_requires=["aiohttp>=3.0.0"],
+    extras_require={"fast": ["orjson"], "tracing": ["opentelemetry-api"]},
     keywords=["sleepiq", "sleep number", "async", "client"],
     license="MIT license",
     long_description=readme,
@@ -1,6 +1,17 @@
 """ Module-level Imports """
 from .sleepiq import SleepIQ #noqa
+from .cache import ResponseCache #noqa
+from .commands import CommandCoalescer #noqa
+from .fleet import BedResult, SleepIQFleet #noqa
+from .metrics import Metrics #noqa
+from .ratelimit import RateLimiter, TokenBucket #noqa
+from .retry import CircuitBreaker, RetryPolicy #noqa
+from .scheduler import PollGroup, PollScheduler #noqa
+from .sharding import ShardedRunner #noqa
+from .wheel import WheelScheduler #noqa
+from .watch import Change, diff #noqa
 from .exceptions import ( #noqa
+    SleepiCircuitOpenError,
     SleepiConnectionError,
     SleepiError,
     SleepiGenericError
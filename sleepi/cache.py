@@ -0,0 +1,115 @@
+""" Response cache for Sleepi """
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .helpers import endpoint_group
+
+DEFAULT_CACHE_SIZE = 256
+
+# Seconds a GET response stays valid, by endpoint group. Endpoints that are
+# not listed use the cache's default TTL, which is 0 (not cached).
+DEFAULT_CACHE_TTLS = {
+    "bed": 300,
+    "sleeper": 300,
+    "sleepNumberFavorite": 300,
+    "foundation/system": 60,
+    "responsiveAir": 60,
+    "pauseMode": 30,
+}
+
+# A write to the key also changes what the listed endpoint groups report
+DEFAULT_INVALIDATIONS = {
+    "foundation/adjustment/micro": ["foundation/status"],
+    "foundation/preset": ["foundation/status"],
+    "sleepNumber": ["bed/familyStatus"],
+}
+
+
+class ResponseCache:
+    """ A size bounded LRU cache of decoded GET responses with per endpoint TTLs """
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 0,
+        invalidations: Optional[Dict[str, List[str]]] = None,
+        ):
+        """ Initialize """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._max_size = max_size
+        self._ttls = DEFAULT_CACHE_TTLS if ttls is None else ttls
+        self._default_ttl = default_ttl
+        self._invalidations = DEFAULT_INVALIDATIONS if invalidations is None else invalidations
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # Invalidations so far, of every endpoint and related endpoint group
+        self._invalidated: Counter = Counter()
+        self._invalidated_groups: Counter = Counter()
+        self._cleared = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(endpoint: str, params: Optional[dict] = None) -> Hashable:
+        """ Cache key of a request, the session key is not part of it """
+        params = params or {}
+        return (
+            endpoint.strip("/"),
+            tuple(sorted((name, str(value)) for name, value in params.items() if name != "_k")),
+        )
+
+    def ttl(self, endpoint: str) -> float:
+        """ Seconds a response of this endpoint stays valid """
+        return self._ttls.get(endpoint_group(endpoint), self._default_ttl)
+
+    def generation(self, endpoint: str) -> Tuple[int, int, int]:
+        """ Changes whenever the responses of an endpoint are invalidated
+
+        Read it before sending a GET and only put its response if it is
+        still the same, a write may have changed what the GET read.
+        """
+        endpoint = endpoint.strip("/")
+        return (self._cleared, self._invalidated[endpoint], self._invalidated_groups[endpoint_group(endpoint)])
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """ Return (found, value) for a key """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, value
+            del self._entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, key: Hashable, value: Any):
+        """ Store a response, if its endpoint is cached at all """
+        ttl = self.ttl(key[0])
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, endpoint: str):
+        """ Drop every response of an endpoint and of the endpoints a write to it affects """
+        endpoint = endpoint.strip("/")
+        related = self._invalidations.get(endpoint_group(endpoint), [])
+        self._invalidated[endpoint] += 1
+        for group in related:
+            self._invalidated_groups[group] += 1
+        for key in list(self._entries):
+            if key[0] == endpoint or endpoint_group(key[0]) in related:
+                del self._entries[key]
+
+    def clear(self):
+        """ Drop every response """
+        self._entries.clear()
+        self._cleared += 1
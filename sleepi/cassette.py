@@ -0,0 +1,157 @@
+""" Record SleepIQ sessions into cassettes and replay them offline
+
+    recorder = CassetteRecorder("session.json")
+    api = SleepIQ(username, password, websession, base_url=await recorder.start())
+    ...
+    await recorder.close()  # writes the cassette
+
+    player = CassettePlayer("session.json")
+    api = SleepIQ(username, password, websession, base_url=await player.start())
+
+The recorder is a local proxy to the real servers. Cassettes hold neither
+the password nor session keys: login requests are stored without a body,
+the key of a login response is replaced and the key parameter of every
+other request is dropped.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, web
+
+from .fake import FakeServer
+from .sleepiq import BASE_URL
+
+CASSETTE_VERSION = 1
+REPLAYED_KEY = "cassette"
+# Response headers kept in a cassette
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def _request_key(method: str, endpoint: str, query: Dict[str, str], body: Any) -> Tuple:
+    """ What a replayed request is matched on """
+    query = tuple(sorted((name, value) for name, value in query.items() if name != "_k"))
+    return method, endpoint, query, json.dumps(body, sort_keys=True)
+
+
+class CassetteRecorder(FakeServer):
+    """ A proxy to the SleepIQ servers recording every exchange """
+    def __init__(self, path: str, upstream: str = BASE_URL):
+        """ Initialize """
+        super().__init__()
+        self._path = path
+        self._upstream = upstream.rstrip("/")
+        self._session: Optional[ClientSession] = None
+        self.interactions: List[Dict[str, Any]] = []
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """ Start proxying, returns the base url to give SleepIQ """
+        self._session = ClientSession()
+        return await super().start(host, port)
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """ Forward a request upstream and record the exchange """
+        endpoint = request.match_info["endpoint"]
+        body = await request.read()
+        headers = {
+            name: value for name, value in request.headers.items()
+            if name.lower() not in ("host", "content-length")
+        }
+        started = time.monotonic()
+        async with self._session.request(
+            request.method,
+            f"{self._upstream}/{endpoint}",
+            params=request.query,
+            data=body or None,
+            headers=headers,
+        ) as response:
+            response_body = await response.read()
+            elapsed = time.monotonic() - started
+            status = response.status
+            kept = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+            cookies = response.headers.getall("Set-Cookie", [])
+
+        recorded_body = response_body.decode("utf-8", "replace")
+        request_body = json.loads(body) if body else None
+        if endpoint == "login":
+            request_body = None
+            if status == 200:
+                login = json.loads(response_body)
+                login["key"] = REPLAYED_KEY
+                recorded_body = json.dumps(login)
+        self.interactions.append({
+            "method": request.method,
+            "endpoint": endpoint,
+            "query": {name: value for name, value in request.query.items() if name != "_k"},
+            "body": request_body,
+            "status": status,
+            "headers": kept,
+            "response": recorded_body,
+            "elapsed": round(elapsed, 6),
+        })
+
+        proxied = web.Response(status=status, body=response_body, headers=kept)
+        for cookie in cookies:
+            proxied.headers.add("Set-Cookie", cookie)
+        return proxied
+
+    def save(self):
+        """ Write the cassette """
+        with open(self._path, "w") as cassette:
+            json.dump({"version": CASSETTE_VERSION, "interactions": self.interactions}, cassette, indent=1)
+
+    async def close(self):
+        """ Stop proxying and write the cassette """
+        await super().close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        await asyncio.get_running_loop().run_in_executor(None, self.save)
+
+
+class CassettePlayer(FakeServer):
+    """ Serve a recorded session
+
+    Requests are matched on method, endpoint, query and body. Matching
+    responses are served in recorded order, the last one again once they
+    run out. Unknown requests get a 501. With replay_latency every response
+    takes as long as it did when recorded.
+    """
+    def __init__(self, path: str, replay_latency: bool = False):
+        """ Initialize """
+        super().__init__()
+        with open(path) as cassette:
+            data = json.load(cassette)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version {data.get('version')}, expected {CASSETTE_VERSION}")
+        self._replay_latency = replay_latency
+        self._responses: Dict[Tuple, Deque[Dict[str, Any]]] = {}
+        for interaction in data["interactions"]:
+            key = _request_key(
+                interaction["method"], interaction["endpoint"], interaction["query"], interaction["body"]
+            )
+            self._responses.setdefault(key, deque()).append(interaction)
+        # Requests that matched nothing in the cassette
+        self.misses: List[Tuple] = []
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """ Answer with the next recorded response """
+        endpoint = request.match_info["endpoint"]
+        body = await request.read()
+        data = None if endpoint == "login" or not body else json.loads(body)
+        key = _request_key(request.method, endpoint, dict(request.query), data)
+        responses = self._responses.get(key)
+        if not responses:
+            self.misses.append(key)
+            return web.Response(status=501, text="Not in the cassette")
+
+        interaction = responses.popleft() if len(responses) > 1 else responses[0]
+        if self._replay_latency:
+            await asyncio.sleep(interaction["elapsed"])
+        return web.Response(
+            status=interaction["status"],
+            body=interaction["response"].encode(),
+            headers=interaction["headers"],
+        )
@@ -0,0 +1,347 @@
+""" Compact binary snapshots of the Sleepi models
+
+A snapshot is the magic b"SQ" and a version byte followed by one value.
+Every value starts with a tag byte:
+
+    NONE, FALSE, TRUE
+    INT     zigzag varint
+    FLOAT   8 byte little endian double
+    STR     varint byte length and UTF-8 bytes, then interned
+    REF     varint index of an interned string
+    LIST    varint length and the items
+    DICT    varint length and the key, value pairs
+    RECORD  varint model id and the fields in attrs field order
+
+Interned strings are the STRINGS table followed by every new string of the
+snapshot, in order, so a repeated value like a side name or light level
+costs two bytes. Model ids are positions in MODELS. Changing either table,
+or the fields of a model, changes the format and needs a new VERSION.
+"""
+import struct
+from typing import Any, Callable, Dict, List, Union
+
+import attr
+
+from .models import (
+    Bed,
+    FamilyStatus,
+    FootWarming,
+    Foundation,
+    Foundation_Status,
+    Light,
+    PrivacyMode,
+    Responsive_Air,
+    Side,
+    Sleeper,
+    SleepNumberFavorite,
+    Status,
+    UnderbedLight,
+)
+
+MAGIC = b"SQ"
+VERSION = 2
+
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT = 3
+FLOAT = 4
+STR = 5
+REF = 6
+LIST = 7
+DICT = 8
+RECORD = 9
+
+MODELS = (
+    Sleeper,
+    Side,
+    Status,
+    SleepNumberFavorite,
+    FamilyStatus,
+    FootWarming,
+    PrivacyMode,
+    UnderbedLight,
+    Light,
+    Foundation_Status,
+    Responsive_Air,
+    Foundation,
+    Bed,
+)
+
+# Values that show up in almost every snapshot
+STRINGS = (
+    "left",
+    "right",
+    "high",
+    "medium",
+    "low",
+    "off",
+    "on",
+    "No Alert",
+    "00",
+    "Flat",
+    "No timer running, thus no preset to active",
+    "Sleep Number light 1",
+    "Sleep Number light 2",
+    "Sleep Number light 3",
+    "Sleep Number light 4",
+)
+
+_DOUBLE = struct.Struct("<d")
+_Buffer = Union[bytes, memoryview]
+_MODEL_IDS = {model: index for index, model in enumerate(MODELS)}
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class _Encoder:
+    """ State of one encode call """
+    __slots__ = ("out", "strings")
+
+    def __init__(self):
+        self.out = bytearray(MAGIC)
+        self.out.append(VERSION)
+        self.strings: Dict[str, int] = {string: index for index, string in enumerate(STRINGS)}
+
+    def value(self, value: Any):
+        out = self.out
+        kind = type(value)
+        if value is None:
+            out.append(NONE)
+        elif kind is bool:
+            out.append(TRUE if value else FALSE)
+        elif kind is str:
+            index = self.strings.get(value)
+            if index is None:
+                self.strings[value] = len(self.strings)
+                data = value.encode()
+                out.append(STR)
+                _write_varint(out, len(data))
+                out += data
+            elif index < 0x80:
+                out += bytes((REF, index))
+            else:
+                out.append(REF)
+                _write_varint(out, index)
+        elif kind is int:
+            out.append(INT)
+            _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+        elif kind in _MODEL_IDS:
+            _RECORD_ENCODERS[_MODEL_IDS[kind]](self, value)
+        elif kind is list or kind is tuple:
+            out.append(LIST)
+            _write_varint(out, len(value))
+            for item in value:
+                self.value(item)
+        elif kind is dict:
+            out.append(DICT)
+            _write_varint(out, len(value))
+            for key, item in value.items():
+                self.value(key)
+                self.value(item)
+        elif kind is float:
+            out.append(FLOAT)
+            out += _DOUBLE.pack(value)
+        else:
+            raise TypeError(f"Cannot encode {kind.__name__} values")
+
+
+def _record_encoder(model):
+    """ Generate the encoder of a record from its field table
+
+    Like _record_decoder, a field is written inline when it is None, a
+    bool, a small int or a string seen before, and through the encoder's
+    value otherwise.
+    """
+    namespace = {"header": bytes((RECORD, _MODEL_IDS[model]))}
+    lines = [
+        "def encode(encoder, record):",
+        "    out = encoder.out",
+        "    strings = encoder.strings",
+        "    value = encoder.value",
+        "    out += header",
+    ]
+    for field in attr.fields(model):
+        lines += [
+            f"    item = record.{field.name}",
+            "    kind = type(item)",
+            "    if item is None:",
+            f"        out.append({NONE})",
+            "    elif kind is str:",
+            "        index = strings.get(item)",
+            "        if index is not None and index < 0x80:",
+            f"            out.append({REF})",
+            "            out.append(index)",
+            "        else:",
+            "            value(item)",
+            "    elif kind is bool:",
+            f"        out.append({TRUE} if item else {FALSE})",
+            "    elif kind is int and 0 <= item < 0x40:",
+            f"        out.append({INT})",
+            "        out.append(item << 1)",
+            "    else:",
+            "        value(item)",
+        ]
+
+    exec("\n".join(lines), namespace)  # pylint: disable=exec-used
+    encode = namespace["encode"]
+    encode.__qualname__ = f"_encode_{model.__name__}"
+    return encode
+
+
+# Encoders of the records by model id
+_RECORD_ENCODERS = [_record_encoder(model) for model in MODELS]
+
+
+def _read_varint(data: _Buffer, position: int):
+    """ A varint and the position after it """
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+# Values of the one byte tags, and of the ints that fit in one varint byte
+_SMALL = (None, False, True)
+_ZIGZAG = tuple(-((count + 1) >> 1) if count & 1 else count >> 1 for count in range(0x80))
+
+
+def _value(data: _Buffer, position: int, strings: List[str]):
+    """ The value at a position and the position after it """
+    tag = data[position]
+    if tag <= TRUE:
+        return _SMALL[tag], position + 1
+    if tag == FLOAT:
+        return _DOUBLE.unpack_from(data, position + 1)[0], position + 1 + _DOUBLE.size
+
+    # Nearly every length, index and int fits in one varint byte
+    count = data[position + 1]
+    if count < 0x80:
+        position += 2
+    else:
+        count, position = _read_varint(data, position + 1)
+
+    if tag == REF:
+        return strings[count], position
+    if tag == INT:
+        return -((count + 1) >> 1) if count & 1 else count >> 1, position
+    if tag == RECORD:
+        return _RECORDS[count](data, position, strings)
+    if tag == STR:
+        end = position + count
+        string = str(data[position:end], "utf-8")
+        strings.append(string)
+        return string, end
+    if tag == LIST:
+        result = []
+        append = result.append
+        for _ in range(count):
+            item, position = _value(data, position, strings)
+            append(item)
+        return result, position
+    if tag == DICT:
+        result = {}
+        for _ in range(count):
+            key, position = _value(data, position, strings)
+            result[key], position = _value(data, position, strings)
+        return result, position
+    raise ValueError(f"Unknown tag {tag} at offset {position}")
+
+
+def _record_decoder(model):
+    """ Generate the decoder of a record's fields from its field table
+
+    Every field is read inline when it is a one byte value, a small int, a
+    short string or a record, which covers nearly all of them, and through
+    _value otherwise. Frozen records are filled through their slot
+    descriptors like from_dict does, mutable ones through __init__.
+    """
+    fields = attr.fields(model)
+    namespace = {
+        "model": model,
+        "new": object.__new__,
+        "value": _value,
+        "SMALL": _SMALL,
+        "ZIGZAG": _ZIGZAG,
+        "records": _RECORDS,
+    }
+    lines = ["def decode(data, position, strings):"]
+    for index in range(len(fields)):
+        lines += [
+            "    tag = data[position]",
+            f"    if tag <= {TRUE}:",
+            f"        v{index} = SMALL[tag]",
+            "        position += 1",
+            "    else:",
+            "        small = data[position + 1]",
+            f"        if tag == {REF} and small < 0x80:",
+            f"            v{index} = strings[small]",
+            "            position += 2",
+            f"        elif tag == {INT} and small < 0x80:",
+            f"            v{index} = ZIGZAG[small]",
+            "            position += 2",
+            f"        elif tag == {STR} and small < 0x80:",
+            "            position += 2 + small",
+            f"            v{index} = str(data[position - small:position], 'utf-8')",
+            f"            strings.append(v{index})",
+            f"        elif tag == {RECORD}:",
+            f"            v{index}, position = records[small](data, position + 2, strings)",
+            "        else:",
+            f"            v{index}, position = value(data, position, strings)",
+        ]
+    if model._frozen:
+        lines.append("    self = new(model)")
+        for index, field in enumerate(fields):
+            namespace[f"set_{index}"] = model.__dict__[field.name].__set__
+            lines.append(f"    set_{index}(self, v{index})")
+    else:
+        lines.append("    self = model(" + ", ".join(f"v{index}" for index in range(len(fields))) + ")")
+    lines.append("    return self, position")
+
+    exec("\n".join(lines), namespace)  # pylint: disable=exec-used
+    decode = namespace["decode"]
+    decode.__qualname__ = f"_decode_{model.__name__}"
+    return decode
+
+
+# Decoders of the records by model id
+_RECORDS: List[Callable] = []
+_RECORDS += [_record_decoder(model) for model in MODELS]
+
+
+def encode(value: Any) -> bytes:
+    """ Encode models, and the lists, dicts and scalars they hold, into a snapshot """
+    encoder = _Encoder()
+    encoder.value(value)
+    return bytes(encoder.out)
+
+
+def decode(data: Union[bytes, bytearray, memoryview]) -> Any:
+    """ Decode a snapshot, reading other buffers than bytes in place through a memoryview
+
+    Only the strings are copied out of the buffer.
+    """
+    if not isinstance(data, bytes):
+        # Indexing bytes is a little faster, but copying them costs more
+        data = memoryview(data).cast("B")
+    if len(data) <= len(MAGIC) or data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a Sleepi snapshot")
+    if data[len(MAGIC)] != VERSION:
+        raise ValueError(f"Unsupported snapshot version {data[len(MAGIC)]}, expected {VERSION}")
+    try:
+        value, position = _value(data, len(MAGIC) + 1, list(STRINGS))
+    except IndexError:
+        raise ValueError("Truncated snapshot") from None
+    if position != len(data):
+        raise ValueError(f"{len(data) - position} trailing bytes after the snapshot")
+    return value
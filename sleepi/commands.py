@@ -0,0 +1,80 @@
+""" Write coalescing for Sleepi """
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Batch:
+    """ Writes to one key collected during a window """
+    def __init__(self, send: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.send = send
+        self.future = future
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class CommandCoalescer:
+    """ Send only the latest of the writes to the same target within a window
+
+    The first write to a key opens a window. Writes arriving before it
+    closes replace the pending one. When it closes the latest write is
+    sent, and every caller of the batch gets its result (or error, or
+    CancelledError when the send is cancelled).
+    Writes to one key are sent one after the other, in order.
+    """
+    def __init__(self, window: float):
+        """ Initialize """
+        if window <= 0:
+            raise ValueError("window must be positive")
+        self.window = window
+        self._pending: Dict[Hashable, _Batch] = {}
+        self._sending: Dict[Hashable, asyncio.Future] = {}
+        # Writes that never reached the servers because a later one replaced them
+        self.superseded = 0
+
+    async def submit(self, key: Hashable, send: Callable[[], Awaitable[Any]]) -> Any:
+        """ Queue a write, returns once the latest write of its batch was sent """
+        batch = self._pending.get(key)
+        if batch is None:
+            loop = asyncio.get_running_loop()
+            batch = self._pending[key] = _Batch(send, loop.create_future())
+            batch.timer = loop.call_later(self.window, self.__flush, key)
+        else:
+            batch.send = send
+            self.superseded += 1
+        # Shielded so a caller giving up doesn't cancel the write for the others
+        return await asyncio.shield(batch.future)
+
+    async def drain(self):
+        """ Send every pending write now and wait for all of them """
+        for key in list(self._pending):
+            self._pending[key].timer.cancel()
+            self.__flush(key)
+        if self._sending:
+            await asyncio.wait(list(self._sending.values()))
+
+    def __flush(self, key: Hashable):
+        batch = self._pending.pop(key)
+        previous = self._sending.get(key)
+        task = asyncio.ensure_future(self.__send(batch, previous))
+        self._sending[key] = task
+        task.add_done_callback(lambda done: self.__sent(key, done))
+
+    async def __send(self, batch: _Batch, previous: Optional[asyncio.Future]):
+        try:
+            if previous is not None:
+                # Keep the writes to a key in order
+                await asyncio.wait([previous])
+            result = await batch.send()
+        except Exception as exception:  # pylint: disable=broad-except
+            batch.future.set_exception(exception)
+            # Every caller got it, don't warn when nobody is left to retrieve it
+            batch.future.exception()
+        else:
+            batch.future.set_result(result)
+        finally:
+            if not batch.future.done():
+                # The send was cancelled, e.g. on shutdown, the callers mustn't wait forever
+                batch.future.cancel()
+
+    def __sent(self, key: Hashable, task: asyncio.Future):
+        if self._sending.get(key) is task:
+            del self._sending[key]
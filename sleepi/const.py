@@ -8,4 +8,12 @@ BED_LIGHTS = [
         LEFT_NIGHT_STAND,
         RIGHT_NIGHT_LIGHT,
         LEFT_NIGHT_LIGHT
-    ]
\ No newline at end of file
+    ]
+
+# Foundation feature the underbed light outlets need, see
+# helpers.foundation_features. Nothing says which feature the night stand
+# outlets need, they are only skipped once SleepIQ reports them missing.
+OUTLET_FEATURES = {
+        RIGHT_NIGHT_LIGHT: "hasUnderbedLight",
+        LEFT_NIGHT_LIGHT: "hasUnderbedLight",
+    }
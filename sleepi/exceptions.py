@@ -10,4 +10,8 @@ class SleepiConnectionError(SleepiError):
 
 
 class SleepiGenericError(Exception):
-    """Generic Sleepi exception."""
\ No newline at end of file
+    """Generic Sleepi exception."""
+
+
+class SleepiCircuitOpenError(SleepiConnectionError):
+    """Sleepi exception raised while SleepIQ keeps failing."""
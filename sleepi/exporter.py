@@ -0,0 +1,360 @@
+""" Prometheus exporter for Sleepi
+
+    SLEEPIQ_USERNAME=... SLEEPIQ_PASSWORD=... python -m sleepi.exporter [--port PORT] [--interval SECONDS]
+    python -m sleepi.exporter --accounts accounts.json
+
+Beds are polled on their own schedule, spread over the interval, and a
+scrape of /metrics is answered from the last values polled: scrapes never
+reach the SleepIQ servers and their frequency doesn't change the load on
+them. accounts.json maps usernames to passwords.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+
+from .fleet import SleepIQFleet
+from .metrics import Sample, format_header, format_sample
+from .models import Bed
+from .sleepiq import SUBSYSTEMS
+from .wheel import DEFAULT_INTERVAL, WheelScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 9753
+DEFAULT_DISCOVER_INTERVAL = 3600.0
+# Client metrics can change without a poll finishing, e.g. when one fails
+RENDER_MAX_AGE = 1.0
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+SIDES = ("left", "right")
+ACTUATORS = ("head", "foot")
+
+
+def _number(value: Any) -> Optional[float]:
+    """ A model value as a gauge value, None when it isn't a number """
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def _hex(value: Any) -> Optional[int]:
+    """ A foundation position, the API reports them as bare hex such as "0c" """
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+Samples = Callable[[Bed], Iterable[Tuple[Dict[str, str], Any]]]
+
+
+def _bed(attribute: str) -> Samples:
+    """ Samples of a field of the bed """
+    return lambda bed: [({}, getattr(bed, attribute))]
+
+
+def _side(attribute: str) -> Samples:
+    """ Samples of a field of each side """
+    def samples(bed: Bed):
+        for name, side in zip(SIDES, (bed.left_side, bed.right_side)):
+            if side is not None:
+                yield {"side": name}, getattr(side, attribute)
+    return samples
+
+
+def _foundation_status(attribute: str) -> Samples:
+    """ Samples of a field of the foundation status """
+    def samples(bed: Bed):
+        status = bed.foundation.foundation_status if bed.foundation is not None else None
+        if status is not None:
+            yield {}, getattr(status, attribute)
+    return samples
+
+
+def _foundation_positions(bed: Bed):
+    """ Samples of the position of every actuator """
+    status = bed.foundation.foundation_status if bed.foundation is not None else None
+    if status is None:
+        return
+    for side in SIDES:
+        for actuator in ACTUATORS:
+            position = getattr(status, f"fs{side.title()}{actuator.title()}Position")
+            yield {"side": side, "actuator": actuator}, _hex(position)
+
+
+def _light(attribute: str) -> Samples:
+    """ Samples of a field of each light """
+    def samples(bed: Bed):
+        for light in bed.lights:
+            yield {"outlet": str(light.outlet), "name": light.name or ""}, getattr(light, attribute)
+    return samples
+
+
+# Name, help and samples of every gauge
+GAUGES: List[Tuple[str, str, Samples]] = [
+    ("bed_status", "Status code of the bed", _bed("status")),
+    ("bed_dual_sleep", "1 when the bed has a sleeper on each side", _bed("dualSleep")),
+    ("side_in_bed", "1 when someone is in bed on the side", _side("isInBed")),
+    ("side_sleep_number", "Sleep number setting of the side", _side("sleepNumber")),
+    ("side_pressure", "Air pressure measured on the side", _side("pressure")),
+    ("side_alert_id", "Id of the side's current alert, 0 for none", _side("alertId")),
+    ("foundation_position", "Position of a foundation actuator", _foundation_positions),
+    ("foundation_moving", "1 while the foundation is moving", _foundation_status("fsIsMoving")),
+    ("foundation_needs_homing", "1 when the foundation needs homing", _foundation_status("fsNeedsHoming")),
+    ("foundation_outlets_on", "1 when the foundation outlets are on", _foundation_status("fsOutletsOn")),
+    ("light_setting", "Setting of a light outlet, 0 when off", _light("setting")),
+]
+
+
+# Name, type, help and unit of every family of the bed state, in order
+FAMILIES: List[Tuple[str, str, str, Optional[str]]] = [
+    ("bed", "info", "The bed", None),
+    *((name, "gauge", help_text, None) for name, help_text, _ in GAUGES),
+    ("bed_last_refresh_timestamp_seconds", "gauge", "When the bed was last polled successfully", "seconds"),
+]
+
+
+def bed_headers(prefix: str = "sleepi") -> List[str]:
+    """ The header lines of every family of FAMILIES, one string per family """
+    return [
+        "".join(line + "\n" for line in format_header(f"{prefix}_{name}", kind, help_text, unit))
+        for name, kind, help_text, unit in FAMILIES
+    ]
+
+
+def bed_chunks(bed_id: str, bed: Bed, refreshed: Optional[float], prefix: str = "sleepi") -> List[str]:
+    """ The sample lines of a bed in every family of FAMILIES, one string per family """
+    info = {"bed_id": bed_id, "name": bed.name or "", "model": bed.model or "", "size": bed.size or ""}
+    chunks = [_lines(f"{prefix}_bed", [("_info", info, 1)])]
+    for name, _, samples in GAUGES:
+        chunks.append(_lines(f"{prefix}_{name}", _gauge_samples(bed_id, bed, samples)))
+    chunks.append(_lines(
+        f"{prefix}_bed_last_refresh_timestamp_seconds",
+        [("", {"bed_id": bed_id}, refreshed)] if refreshed is not None else [],
+    ))
+    return chunks
+
+
+def bed_families(beds: Dict[str, Bed], refreshed: Dict[str, float], prefix: str = "sleepi") -> List[str]:
+    """ The OpenMetrics lines of the state of every bed, without the EOF marker """
+    chunks = [bed_chunks(bed_id, bed, refreshed.get(bed_id), prefix) for bed_id, bed in sorted(beds.items())]
+    return "".join(
+        header + "".join(bed[index] for bed in chunks) for index, header in enumerate(bed_headers(prefix))
+    ).splitlines()
+
+
+def _lines(name: str, samples: Iterable[Sample]) -> str:
+    return "".join(format_sample(name, *sample) + "\n" for sample in samples)
+
+
+def _gauge_samples(bed_id: str, bed: Bed, samples: Samples) -> Iterator[Sample]:
+    for labels, value in samples(bed):
+        value = _number(value)
+        if value is not None:
+            yield "", dict(bed_id=bed_id, **labels), value
+
+
+class Exporter:
+    """ Poll the beds of a fleet on a schedule and serve their last state
+
+    Every bed is refreshed once on start, then every interval seconds,
+    spread over the interval by a WheelScheduler. The accounts' beds are
+    listed again every discover_interval seconds. /metrics serves the
+    gauges of the last values polled along with the fleet's request
+    metrics. The lines of a bed are formatted when its poll lands and the
+    request metrics at most every RENDER_MAX_AGE seconds, so a scrape only
+    joins bytes rendered beforehand.
+    """
+    def __init__(
+        self,
+        fleet: SleepIQFleet,
+        interval: float = DEFAULT_INTERVAL,
+        subsystems: Iterable[str] = SUBSYSTEMS,
+        discover_interval: float = DEFAULT_DISCOVER_INTERVAL,
+        prefix: str = "sleepi",
+        ):
+        """ Initialize """
+        self._fleet = fleet
+        self._interval = interval
+        self._subsystems = frozenset(subsystems)
+        self._discover_interval = discover_interval
+        self._prefix = prefix
+        self._scheduler = WheelScheduler(interval, on_result=self.__polled)
+        self._beds: Dict[str, Bed] = {}
+        self._refreshed: Dict[str, float] = {}
+        self._headers = [header.encode() for header in bed_headers(prefix)]
+        # Lines of every bed in every family, and the bed ids in the order served
+        self._chunks: Dict[str, List[bytes]] = {}
+        self._order: List[str] = []
+        self._client_metrics = b""
+        self._body: Optional[bytes] = None
+        self._rendered: Optional[float] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._discover_task: Optional[asyncio.Future] = None
+        self.url: Optional[str] = None
+
+    @property
+    def beds(self) -> Dict[str, Bed]:
+        """ The beds being polled, keyed by bed id """
+        return dict(self._beds)
+
+    def __polled(self, bed_id: str, changes):
+        self._refreshed[bed_id] = time.time()
+        if bed_id in self._beds:
+            self.__render_bed(bed_id)
+            self._body = None
+
+    def __render_bed(self, bed_id: str):
+        chunks = bed_chunks(bed_id, self._beds[bed_id], self._refreshed.get(bed_id), self._prefix)
+        self._chunks[bed_id] = [chunk.encode() for chunk in chunks]
+
+    def __track_beds(self):
+        """ Poll the beds the fleet found and stop polling the ones gone """
+        beds = self._fleet.beds
+        for bed_id in list(self._beds):
+            if bed_id not in beds:
+                self._scheduler.remove(bed_id)
+                del self._beds[bed_id]
+                del self._chunks[bed_id]
+                self._refreshed.pop(bed_id, None)
+        for bed_id, bed in beds.items():
+            if bed_id not in self._beds:
+                self._beds[bed_id] = bed
+                self.__render_bed(bed_id)
+                self._scheduler.add_bed(
+                    self._fleet.client(self._fleet.owner(bed_id)), bed, self._interval, self._subsystems
+                )
+        self._order = sorted(self._beds)
+        self._body = None
+
+    async def __discover(self):
+        """ List the beds of every account again every discover_interval """
+        while True:
+            await asyncio.sleep(self._discover_interval)
+            await self._fleet.discover()
+            self.__track_beds()
+
+    def render(self) -> bytes:
+        """ The body of a scrape """
+        now = time.monotonic()
+        if self._rendered is None or now - self._rendered > RENDER_MAX_AGE:
+            self._client_metrics = "\n".join(self._fleet.metrics.families(self._prefix) + ["# EOF", ""]).encode()
+            self._rendered = now
+            self._body = None
+        if self._body is None:
+            parts = []
+            for index, header in enumerate(self._headers):
+                parts.append(header)
+                parts += [self._chunks[bed_id][index] for bed_id in self._order]
+            parts.append(self._client_metrics)
+            self._body = b"".join(parts)
+        return self._body
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """ Answer a scrape """
+        response = web.Response(body=self.render())
+        response.headers["Content-Type"] = CONTENT_TYPE
+        return response
+
+    def app(self) -> web.Application:
+        """ The application to serve """
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        return app
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> str:
+        """ Poll every bed once, then start polling and serving; returns the metrics url """
+        results = await self._fleet.refresh(self._subsystems)
+        now = time.time()
+        for bed_id, result in results.items():
+            if result.error is None:
+                self._refreshed[bed_id] = now
+        self.__track_beds()
+        self._scheduler.start()
+        self._discover_task = asyncio.ensure_future(self.__discover())
+
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}/metrics"
+        return self.url
+
+    async def close(self):
+        """ Stop serving and polling """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._discover_task is not None:
+            self._discover_task.cancel()
+            try:
+                await self._discover_task
+            except asyncio.CancelledError:
+                pass
+            self._discover_task = None
+        await self._scheduler.stop()
+
+
+def _accounts(path: Optional[str]) -> Dict[str, str]:
+    """ Passwords by username, from the accounts file or the environment """
+    if path is not None:
+        with open(path) as accounts:
+            return json.load(accounts)
+    username = os.environ.get("SLEEPIQ_USERNAME")
+    password = os.environ.get("SLEEPIQ_PASSWORD")
+    return {username: password} if username and password else {}
+
+
+async def serve(accounts: Dict[str, str], host: str, port: int, interval: float, subsystems: Iterable[str]):
+    """ Run the exporter until SIGINT or SIGTERM """
+    # Runs until stopped, keys are renewed before they expire
+    fleet = SleepIQFleet(auto_refresh_session=True)
+    for username, password in accounts.items():
+        fleet.add_account(username, password)
+    exporter = Exporter(fleet, interval, subsystems)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:  # pragma: no cover
+            pass
+    try:
+        url = await exporter.start(host, port)
+        _LOGGER.info("Serving %s beds on %s", len(exporter.beds), url)
+        await stop.wait()
+    finally:
+        await exporter.close()
+        await fleet.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", help="JSON file mapping usernames to passwords")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between polls of a bed")
+    parser.add_argument(
+        "--subsystems", nargs="+", choices=sorted(SUBSYSTEMS), default=sorted(SUBSYSTEMS), help="what to poll"
+    )
+    args = parser.parse_args()
+
+    accounts = _accounts(args.accounts)
+    if not accounts:
+        parser.error("give --accounts or set SLEEPIQ_USERNAME and SLEEPIQ_PASSWORD")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(accounts, args.host, args.port, args.interval, args.subsystems))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+""" An in-process fake of the SleepIQ servers, for exercising Sleepi offline
+
+    fake = FakeSleepIQ(latency=0.05)
+    fake.add_account("user", "password", beds=2)
+    base_url = await fake.start()
+    api = SleepIQ("user", "password", websession, base_url=base_url)
+    ...
+    await fake.close()
+
+The fake serves the endpoints SleepIQ uses and keeps the state of every
+bed, so writes show up in later reads. Responses carry an ETag and honour
+If-None-Match. Latency, jitter and errors can be injected, and every
+request is counted per endpoint group.
+"""
+import abc
+import asyncio
+import hashlib
+import json
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from .const import BED_LIGHTS
+from .helpers import endpoint_group
+
+# fsType of each fsBedType value
+FS_TYPES = ("Single", "Split Head", "Split King", "Eastern King")
+NO_TIMER = "No timer running, thus no preset to active"
+
+
+class FakeServer(abc.ABC):
+    """ An aiohttp server on a free local port """
+    def __init__(self):
+        """ Initialize """
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+    def app(self) -> web.Application:
+        """ The application to serve """
+        app = web.Application()
+        app.router.add_route("*", "/rest/{endpoint:.*}", self.handle)
+        return app
+
+    @abc.abstractmethod
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """ Answer a request """
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """ Start serving, returns the base url to give SleepIQ """
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}/rest"
+        return self.base_url
+
+    async def close(self):
+        """ Stop serving """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _side(sleep_number: int) -> Dict[str, Any]:
+    return {
+        "isInBed": False,
+        "alertDetailedMessage": "No Alert",
+        "sleepNumber": sleep_number,
+        "alertId": 0,
+        "lastLink": "00:00:00",
+        "pressure": 1000,
+    }
+
+
+class FakeBed:
+    """ The state of one fake bed """
+    def __init__(self, bed_id: str, account_id: str, outlets=BED_LIGHTS, board_features: int = 0x1F, bed_type: int = 2):
+        """ Initialize """
+        self.bed_id = bed_id
+        self.account_id = account_id
+        self.sleepers = {
+            side: {
+                "firstName": f"{side.title()} sleeper",
+                "active": True,
+                "emailValidated": True,
+                "gender": 0,
+                "isChild": False,
+                "bedId": bed_id,
+                "birthYear": "1980",
+                "zipCode": "55401",
+                "timezone": "US/Central",
+                "privacyPolicyVersion": 1,
+                "duration": None,
+                "weight": 150,
+                "sleeperId": f"{bed_id}-{side}",
+                "firstSessionRecorded": "2020-01-01T00:00:00Z",
+                "height": 70,
+                "licenseVersion": 1,
+                "username": f"{bed_id}-{side}",
+                "birthMonth": 1,
+                "sleepGoal": 480,
+                "accountId": account_id,
+                "isAccountOwner": side == "left",
+                "email": f"{bed_id}-{side}@example.com",
+                "lastLogin": "2020-01-01T00:00:00Z",
+                "side": 0 if side == "left" else 1,
+            }
+            for side in ("left", "right")
+        }
+        self.bed = {
+            "registrationDate": "2020-01-01T00:00:00Z",
+            "sleeperRightId": f"{bed_id}-right",
+            "base": "FlexFit",
+            "returnRequestStatus": 0,
+            "size": "KING",
+            "name": f"Bed {bed_id}",
+            "serial": "",
+            "isKidsBed": False,
+            "dualSleep": True,
+            "bedId": bed_id,
+            "status": 1,
+            "sleeperLeftId": f"{bed_id}-left",
+            "version": "",
+            "accountId": account_id,
+            "timezone": "US/Central",
+            "generation": "360",
+            "model": "P6",
+            "purchaseDate": "2020-01-01T00:00:00Z",
+            "macAddress": "64DBA0000000",
+            "sku": "QP6",
+            "zipcode": "55401",
+            "reference": "95000794555-1",
+        }
+        self.sides = {"left": _side(40), "right": _side(50)}
+        self.favorites = {"left": 40, "right": 50}
+        self.system = {
+            "fsBedType": bed_type,
+            "fsBoardFaults": 0,
+            "fsBoardFeatures": board_features,
+            "fsBoardHWRevisionCode": 1,
+            "fsBoardStatus": 0,
+            "fsLeftUnderbedLightPWM": 30,
+            "fsRightUnderbedLightPWM": 30,
+        }
+        # Shaped like the real responses: positions are bare hex, presets and type are names
+        self.status = {
+            "fsCurrentPositionPresetRight": "Flat",
+            "fsNeedsHoming": False,
+            "fsRightFootPosition": "00",
+            "fsLeftPositionTimerLSB": "00",
+            "fsTimerPositionPresetLeft": NO_TIMER,
+            "fsCurrentPositionPresetLeft": "Flat",
+            "fsLeftPositionTimerMSB": "00",
+            "fsRightFootActuatorMotorStatus": "00",
+            "fsCurrentPositionPreset": "00",
+            "fsTimerPositionPresetRight": NO_TIMER,
+            "fsType": FS_TYPES[bed_type] if 0 <= bed_type < len(FS_TYPES) else "Single",
+            "fsOutletsOn": False,
+            "fsLeftHeadPosition": "00",
+            "fsIsMoving": False,
+            "fsRightHeadActuatorMotorStatus": "00",
+            "fsStatusSummary": "42",
+            "fsTimerPositionPreset": "00",
+            "fsLeftFootPosition": "00",
+            "fsRightPositionTimerLSB": "00",
+            "fsTimedOutletsOn": False,
+            "fsRightHeadPosition": "00",
+            "fsConfigured": True,
+            "fsRightPositionTimerMSB": "00",
+            "fsLeftHeadActuatorMotorStatus": "00",
+            "fsLeftFootActuatorMotorStatus": "00",
+        }
+        self.outlets = {outlet: 0 for outlet in outlets}
+        self.underbed_light = {"bedId": bed_id, "enableAuto": False, "prefSyncState": "Unsynced"}
+        self.foot_warming = {
+            "footWarmingStatusLeft": 0,
+            "footWarmingStatusRight": 0,
+            "footWarmingTimerLeft": 0,
+            "footWarmingTimerRight": 0,
+        }
+        self.responsive_air = {
+            "adjustmentThreshold": 5,
+            "inBedTimeout": 300,
+            "leftSideEnabled": False,
+            "outOfBedTimeout": 300,
+            "pollFrequency": 5,
+            "prefSyncState": "Unsynced",
+            "rightSideEnabled": False,
+        }
+        self.pause_mode = "off"
+
+    def family_status(self) -> Dict[str, Any]:
+        """ The bed's entry of a familyStatus response """
+        return {
+            "bedId": self.bed_id,
+            "status": 1,
+            "leftSide": self.sides["left"],
+            "rightSide": self.sides["right"],
+        }
+
+
+class FakeSleepIQ(FakeServer):
+    """ A fake SleepIQ server holding any number of accounts and beds
+
+    latency, plus a uniform random jitter, delays every response.
+    error_rate is the share of requests answered with one of errors, and
+    fail queues exact statuses for the next requests of an endpoint group,
+    e.g. fail("foundation/system", 503, 503). delay holds the answers of
+    an endpoint group once they are read, like a slow network would. seed
+    makes the jitter and the random errors repeatable.
+    """
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        errors=(500, 503),
+        seed: Optional[int] = None,
+        ):
+        """ Initialize """
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = tuple(errors)
+        self._random = random.Random(seed)
+        self._passwords: Dict[str, str] = {}
+        self._account_beds: Dict[str, List[str]] = {}
+        self._keys: Dict[str, str] = {}
+        self._failures: Dict[str, List[int]] = {}
+        self._delays: Dict[str, float] = {}
+        self._next_bed = 0
+        self.beds: Dict[str, FakeBed] = {}
+        # Requests received per "METHOD endpoint group"
+        self.requests: Counter = Counter()
+        self.logins = 0
+
+    def add_account(self, username: str, password: str, beds: int = 1, **bed_options) -> List[FakeBed]:
+        """ Add an account with its beds, see FakeBed for the options """
+        self._passwords[username] = password
+        account_id = f"account-{len(self._passwords)}"
+        added = []
+        for _ in range(beds):
+            self._next_bed += 1
+            bed = FakeBed(str(100000 + self._next_bed), account_id, **bed_options)
+            self.beds[bed.bed_id] = bed
+            self._account_beds.setdefault(username, []).append(bed.bed_id)
+            added.append(bed)
+        return added
+
+    def fail(self, group: str, *statuses: int):
+        """ Answer the next requests of an endpoint group with these statuses """
+        self._failures.setdefault(group, []).extend(statuses)
+
+    def delay(self, group: str, seconds: float):
+        """ Hold the answers of an endpoint group for seconds after reading the state they report """
+        self._delays[group] = seconds
+
+    def expire_sessions(self):
+        """ Forget every session key, as the servers do from time to time """
+        self._keys.clear()
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """ Answer a request """
+        endpoint = request.match_info["endpoint"]
+        group = endpoint_group(endpoint)
+        self.requests[f"{request.method} {group}"] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        response = await self.__answer(request, endpoint, group)
+        if self._delays.get(group):
+            await asyncio.sleep(self._delays[group])
+        return response
+
+    async def __answer(self, request: web.Request, endpoint: str, group: str) -> web.StreamResponse:
+        """ The response to a request, from the state of the beds now """
+        if self._failures.get(group):
+            return web.Response(status=self._failures[group].pop(0), text="Injected error")
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.Response(status=self._random.choice(self.errors), text="Injected error")
+
+        body = await request.read()
+        data = json.loads(body) if body else None
+        if endpoint == "login":
+            return self.__login(data)
+
+        username = self._keys.get(request.query.get("_k"))
+        if username is None:
+            return web.Response(status=401, text="Session is invalid")
+        beds = [self.beds[bed_id] for bed_id in self._account_beds[username]]
+        if endpoint == "bed":
+            return self.__json(request, {"beds": [bed.bed for bed in beds]})
+        if endpoint == "bed/familyStatus":
+            return self.__json(request, {"beds": [bed.family_status() for bed in beds]})
+        if endpoint == "sleeper":
+            return self.__json(
+                request, {"sleepers": [sleeper for bed in beds for sleeper in bed.sleepers.values()]}
+            )
+
+        parts = endpoint.split("/", 2)
+        if len(parts) < 3 or parts[0] != "bed" or parts[1] not in self._account_beds[username]:
+            return web.Response(status=404, text="Not found")
+        result = self.__bed_endpoint(self.beds[parts[1]], parts[2], request, data)
+        if isinstance(result, web.Response):
+            return result
+        return self.__json(request, result)
+
+    def __login(self, data: Dict[str, Any]) -> web.Response:
+        """ Issue a new session key """
+        username = data.get("login")
+        if username not in self._passwords or self._passwords[username] != data.get("password"):
+            return web.Response(status=401, text="Incorrect username or password")
+        self.logins += 1
+        key = f"key-{self.logins}"
+        # A new login replaces the account's previous key
+        self._keys = {old: user for old, user in self._keys.items() if user != username}
+        self._keys[key] = username
+        return web.json_response({"key": key, "userId": username, "registrationState": 13})
+
+    @staticmethod
+    def __json(request: web.Request, data: Any) -> web.Response:
+        """ A JSON response with an ETag, or a 304 when the client has it already """
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        if request.method == "GET" and request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    @staticmethod
+    def __bed_endpoint(bed: FakeBed, path: str, request: web.Request, data: Any):
+        """ Read or change the state of a bed """
+        write = request.method == "PUT"
+        if path == "foundation/system":
+            if write:
+                bed.system.update(data)
+            return bed.system
+        if path == "foundation/status":
+            return bed.status
+        if path == "foundation/outlet":
+            if write:
+                outlet = int(data["outletId"])
+            else:
+                outlet = int(request.query.get("outletId", 0))
+            if outlet not in bed.outlets:
+                return web.Response(status=404, text="Outlet not found")
+            if write:
+                bed.outlets[outlet] = int(data["setting"])
+                return {}
+            return {"bedId": bed.bed_id, "outlet": outlet, "setting": bed.outlets[outlet], "timer": ""}
+        if path == "foundation/underbedLight":
+            if write:
+                bed.underbed_light.update(data)
+            return bed.underbed_light
+        if path == "foundation/footwarming":
+            if write:
+                for side in ("Left", "Right"):
+                    if f"footWarmingTemp{side}" in data:
+                        bed.foot_warming[f"footWarmingStatus{side}"] = data[f"footWarmingTemp{side}"]
+                        bed.foot_warming[f"footWarmingTimer{side}"] = data[f"footWarmingTimer{side}"]
+            return bed.foot_warming
+        if path == "foundation/adjustment/micro":
+            side = "Left" if data["side"] == "L" else "Right"
+            actuator = "Head" if data["actuator"] == "H" else "Foot"
+            bed.status[f"fs{side}{actuator}Position"] = f"{int(data['position']):02x}"
+            return {}
+        if path == "foundation/preset":
+            return {}
+        if path == "responsiveAir":
+            if write:
+                bed.responsive_air.update(data)
+            return bed.responsive_air
+        if path == "pauseMode":
+            if write:
+                bed.pause_mode = request.query.get("mode", bed.pause_mode)
+            return {"accountId": bed.account_id, "bedId": bed.bed_id, "pauseMode": bed.pause_mode}
+        if path == "sleepNumber":
+            if write:
+                side = "left" if data["side"] == "L" else "right"
+                bed.sides[side]["sleepNumber"] = int(data["sleepNumber"])
+                return {}
+            side = "left" if request.query.get("side") == "L" else "right"
+            return {"sleepNumber": bed.sides[side]["sleepNumber"]}
+        if path == "sleepNumberFavorite":
+            if write:
+                side = "left" if data["side"] == "L" else "right"
+                bed.favorites[side] = int(data["sleepNumberFavorite"])
+                return {}
+            return {
+                "bedId": bed.bed_id,
+                "sleepNumberFavoriteLeft": bed.favorites["left"],
+                "sleepNumberFavoriteRight": bed.favorites["right"],
+            }
+        return web.Response(status=404, text="Not found")
@@ -0,0 +1,214 @@
+""" Many accounts and beds for Sleepi """
+import asyncio
+import logging
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+import aiohttp
+from aiohttp import ClientSession
+
+from .metrics import Metrics
+from .models import Bed
+from .sleepiq import DEFAULT_MAX_CONCURRENT_REQUESTS, SUBSYSTEMS, SleepIQ
+from .watch import Change
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+
+
+class BedResult(NamedTuple):
+    """ The outcome of refreshing one bed of a fleet """
+    username: str
+    bed: Bed
+    changes: List[Change]
+    error: Optional[Exception]
+
+
+def tuned_connector(limit: int = DEFAULT_MAX_CONNECTIONS) -> aiohttp.TCPConnector:
+    """ A connector for many concurrent requests to the SleepIQ servers
+
+    Every request goes to the same host, so the per host limit is the
+    global one. Connections are kept alive between polls and DNS answers
+    are cached.
+    """
+    return aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit,
+        ttl_dns_cache=DEFAULT_DNS_CACHE_TTL,
+        keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+    )
+
+
+class SleepIQFleet:
+    """ Many SleepIQ accounts and every bed they have, sharing one connection pool
+
+    max_connections caps the requests in flight across the fleet when the
+    fleet creates its own session, a given websession keeps the limits of
+    its connector. max_account_requests caps those of each account. Every
+    account records its requests in the same metrics. Other keyword
+    arguments are passed to every account's SleepIQ, a session the fleet
+    creates also records the request phases of a tracer given that way.
+    """
+    def __init__(
+        self,
+        websession: Optional[ClientSession] = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_account_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        metrics: Optional[Metrics] = None,
+        **client_options,
+        ):
+        """ Initialize """
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        self._websession = websession
+        self._owns_websession = websession is None
+        self._max_connections = max_connections
+        self._max_account_requests = max_account_requests
+        self._client_options = client_options
+        self.metrics = metrics or Metrics()
+        self._passwords: Dict[str, str] = {}
+        self._clients: Dict[str, SleepIQ] = {}
+        # Beds by id, along with the account each one belongs to
+        self._beds: Dict[str, Bed] = {}
+        self._bed_accounts: Dict[str, str] = {}
+        self._discovered: Set[str] = set()
+        # Accounts whose beds couldn't be listed, with the reason
+        self.account_errors: Dict[str, Exception] = {}
+
+    @property
+    def beds(self) -> Dict[str, Bed]:
+        """ The latest state of every known bed, keyed by bed id """
+        return dict(self._beds)
+
+    @property
+    def accounts(self) -> List[str]:
+        """ Usernames of the accounts in the fleet """
+        return list(self._passwords)
+
+    def add_account(self, username: str, password: str):
+        """ Add an account, its beds are found on the next refresh """
+        if username in self._passwords:
+            raise ValueError(f"Account {username} is already in the fleet")
+        self._passwords[username] = password
+
+    async def remove_account(self, username: str):
+        """ Remove an account and forget its beds """
+        del self._passwords[username]
+        self._discovered.discard(username)
+        self.account_errors.pop(username, None)
+        for bed_id in self.__account_beds(username):
+            del self._beds[bed_id]
+            del self._bed_accounts[bed_id]
+        client = self._clients.pop(username, None)
+        if client is not None:
+            await client.close()
+
+    def client(self, username: str) -> SleepIQ:
+        """ The SleepIQ client of an account """
+        if username not in self._clients:
+            if username not in self._passwords:
+                raise KeyError(f"Account {username} is not in the fleet")
+            self._clients[username] = SleepIQ(
+                username,
+                self._passwords[username],
+                self.__get_websession(),
+                max_concurrent_requests=self._max_account_requests,
+                metrics=self.metrics,
+                **self._client_options,
+            )
+        return self._clients[username]
+
+    def owner(self, bed_id: str) -> str:
+        """ Username of the account a bed belongs to """
+        return self._bed_accounts[bed_id]
+
+    def __get_websession(self) -> ClientSession:
+        """ The session shared by every account """
+        # Created lazily so it binds to the loop that actually runs the requests
+        if self._websession is None:
+            tracer = self._client_options.get("tracer")
+            self._websession = ClientSession(
+                connector=tuned_connector(self._max_connections),
+                trace_configs=[tracer.trace_config()] if tracer is not None else None,
+            )
+        return self._websession
+
+    def __account_beds(self, username: str) -> List[str]:
+        """ Ids of the known beds of an account """
+        return [bed_id for bed_id, owner in self._bed_accounts.items() if owner == username]
+
+    async def login(self):
+        """ Log every account in concurrently """
+        await asyncio.gather(*[self.client(username).login() for username in self._passwords])
+
+    async def discover(self, usernames: Optional[Iterable[str]] = None) -> Dict[str, Bed]:
+        """ List the beds of the given accounts, all of them by default
+
+        Accounts that fail are left out and recorded in account_errors.
+        Returns the beds found, keyed by bed id.
+        """
+        usernames = list(self._passwords if usernames is None else usernames)
+        results = await asyncio.gather(
+            *[self.client(username).get_beds() for username in usernames],
+            return_exceptions=True,
+        )
+        found: Dict[str, Bed] = {}
+        for username, beds in zip(usernames, results):
+            if isinstance(beds, asyncio.CancelledError):
+                raise beds
+            if isinstance(beds, Exception):
+                _LOGGER.warning("Listing the beds of %s failed: %s", username, beds)
+                self.account_errors[username] = beds
+                continue
+            self.account_errors.pop(username, None)
+            self._discovered.add(username)
+            for bed_id in self.__account_beds(username):
+                del self._beds[bed_id]
+                del self._bed_accounts[bed_id]
+            for bed in beds:
+                bed_id = str(bed.bedId)
+                self._beds[bed_id] = found[bed_id] = bed
+                self._bed_accounts[bed_id] = username
+        return found
+
+    async def refresh(self, subsystems: Iterable[str] = SUBSYSTEMS) -> Dict[str, BedResult]:
+        """ Refresh the given subsystems of every bed in the fleet at once
+
+        Beds of accounts added since the last refresh, or whose beds
+        couldn't be listed yet, are found first. Returns the outcome of
+        every bed keyed by bed id; a bed that failed keeps its previous
+        state and carries the error.
+        """
+        subsystems = frozenset(subsystems)
+        pending = [username for username in self._passwords if username not in self._discovered]
+        if pending:
+            await self.discover(pending)
+
+        bed_ids = list(self._beds)
+        outcomes = await asyncio.gather(
+            *[
+                self.client(self._bed_accounts[bed_id]).refresh(self._beds[bed_id], subsystems)
+                for bed_id in bed_ids
+            ],
+            return_exceptions=True,
+        )
+        results: Dict[str, BedResult] = {}
+        for bed_id, outcome in zip(bed_ids, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            username = self._bed_accounts[bed_id]
+            if isinstance(outcome, Exception):
+                _LOGGER.warning("Refreshing bed %s of %s failed: %s", bed_id, username, outcome)
+                results[bed_id] = BedResult(username, self._beds[bed_id], [], outcome)
+            else:
+                results[bed_id] = BedResult(username, self._beds[bed_id], outcome, None)
+        return results
+
+    async def close(self):
+        """ Close every account, and the session unless it was given """
+        await asyncio.gather(*[client.close() for client in self._clients.values()])
+        if self._owns_websession and self._websession is not None:
+            await self._websession.close()
+            self._websession = None
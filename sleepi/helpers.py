@@ -0,0 +1,55 @@
+""" Helpers for Sleepi """
+import json
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def endpoint_group(endpoint: str) -> str:
+    """ Return an endpoint without its bed id
+
+    "bed/1234/foundation/system" becomes "foundation/system" so settings and
+    statistics can be shared by every bed. Account level endpoints such as
+    "bed", "sleeper" and "bed/familyStatus" are returned unchanged.
+    """
+    parts = endpoint.strip("/").split("/")
+    if parts[0] == "bed" and len(parts) > 2:
+        return "/".join(parts[2:])
+    return "/".join(parts)
+
+
+# Bed type of each fsBedType value
+BED_TYPES = ("single", "splitHead", "splitKing", "easternKing")
+
+
+@lru_cache(maxsize=64)
+def foundation_features(bed_type: int, board_features: int) -> Mapping[str, bool]:
+    """ Decode a foundation's fsBedType and fsBoardFeatures into its features
+
+    Only a handful of combinations exist, so the result is shared and
+    read only.
+    """
+    data = {name: bed_type == index for index, name in enumerate(BED_TYPES)}
+    data['boardIsASingle'] = bool(board_features & 1 << 0)
+    data['hasMassageAndLight'] = bool(board_features & 1 << 1)
+    data['hasFootControl'] = bool(board_features & 1 << 2)
+    data['hasFootWarming'] = bool(board_features & 1 << 3)
+    data['hasUnderbedLight'] = bool(board_features & 1 << 4)
+
+    if data['hasMassageAndLight']:
+        data['hasUnderbedLight'] = True
+    if data['splitKing'] or data['splitHead']:
+        data['boardIsASingle'] = False
+    return MappingProxyType(data)
+
+
+def default_json_loads() -> Callable[[bytes], Any]:
+    """ The fastest JSON loader available: orjson when installed, else json """
+    if orjson is not None:
+        return orjson.loads
+    return json.loads
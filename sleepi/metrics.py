@@ -0,0 +1,279 @@
+""" Request metrics for Sleepi
+
+Every SleepIQ client records how long each HTTP request took and what came
+back, by endpoint group, along with retries, logins, cache hits and bytes
+sent and received. Read them with snapshot() or as OpenMetrics text:
+
+    api.metrics.snapshot()["endpoints"]["foundation/status"]["latency"]
+    print(api.metrics.openmetrics())
+
+One Metrics can be shared by several clients, a fleet shares one between
+all of its accounts.
+"""
+import math
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .helpers import endpoint_group
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Counted per endpoint group
+ENDPOINT_COUNTERS = {
+    "retries": "Requests sent again after a failure",
+    "cache_hits": "GETs answered from the response cache",
+    "coalesced": "GETs that joined an identical request in flight",
+    "not_modified": "GETs answered with 304 Not Modified",
+    "unchanged": "GET bodies identical to the last one, not decoded again",
+    "elided_writes": "Writes skipped because the bed was already in that state",
+}
+# Counted per client
+CLIENT_COUNTERS = {
+    "logins": "Successful logins",
+    "relogins": "Successful logins replacing a rejected or expiring session key",
+}
+
+Sample = Tuple[str, Dict[str, str], Union[int, float]]
+
+
+class Histogram:
+    """ Counts of observations by bucket """
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """ Initialize """
+        self.bounds = bounds
+        # The last count is for values above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """ Add an observation """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> Iterator[Tuple[float, int]]:
+        """ (upper bound, observations up to it) of every bucket, ending with +Inf """
+        total = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Estimate a quantile, interpolating inside its bucket """
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower = 0.0
+        below = 0
+        for bound, total in self.cumulative():
+            if total >= rank and total > below:
+                if math.isinf(bound):
+                    return lower
+                return lower + (bound - lower) * (rank - below) / (total - below)
+            lower, below = bound, total
+        return lower
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ The histogram as plain data, bucket counts are cumulative """
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {_format_value(bound): total for bound, total in self.cumulative()},
+        }
+
+
+class _Endpoint:
+    """ What was recorded for one endpoint group """
+    __slots__ = ("latency", "statuses", "counters", "received", "sent")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        """ Initialize """
+        self.latency = Histogram(bounds)
+        self.statuses: Counter = Counter()
+        self.counters: Counter = Counter()
+        self.received = 0
+        self.sent = 0
+
+
+class Metrics:
+    """ Latency histograms and counters of the requests sent to SleepIQ
+
+    Requests are recorded by endpoint group, so "bed/1234/foundation/status"
+    counts as "foundation/status" whatever the bed. A request that got no
+    response is recorded with the status "timeout", "error" or "cancelled".
+    """
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        """ Initialize """
+        self._bounds = tuple(sorted(buckets))
+        if not self._bounds:
+            raise ValueError("At least one bucket is needed")
+        self._endpoints: Dict[str, _Endpoint] = {}
+        self.counters: Counter = Counter()
+        # Seconds spent waiting on the rate limiter
+        self.rate_limit_wait = 0.0
+
+    def __endpoint(self, endpoint: str) -> _Endpoint:
+        group = endpoint_group(endpoint)
+        metrics = self._endpoints.get(group)
+        if metrics is None:
+            metrics = self._endpoints[group] = _Endpoint(self._bounds)
+        return metrics
+
+    def observe(self, endpoint: str, status: Union[int, str], seconds: float, received: int = 0, sent: int = 0):
+        """ Record a request, its status, how long it took and its size """
+        metrics = self.__endpoint(endpoint)
+        metrics.latency.observe(seconds)
+        metrics.statuses[str(status)] += 1
+        metrics.received += received
+        metrics.sent += sent
+
+    def count(self, name: str, endpoint: Optional[str] = None, amount: int = 1):
+        """ Increase a counter, of an endpoint group when given one """
+        if endpoint is None:
+            self.counters[name] += amount
+        else:
+            self.__endpoint(endpoint).counters[name] += amount
+
+    def wait(self, seconds: float):
+        """ Record time spent waiting on the rate limiter """
+        self.rate_limit_wait += seconds
+
+    def reset(self):
+        """ Forget everything recorded so far """
+        self._endpoints.clear()
+        self.counters.clear()
+        self.rate_limit_wait = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ Everything recorded so far as plain data """
+        endpoints = {}
+        for group, metrics in sorted(self._endpoints.items()):
+            endpoints[group] = {
+                "latency": metrics.latency.snapshot(),
+                "statuses": dict(metrics.statuses),
+                "received_bytes": metrics.received,
+                "sent_bytes": metrics.sent,
+                **{name: metrics.counters[name] for name in ENDPOINT_COUNTERS},
+            }
+        return {
+            "endpoints": endpoints,
+            "rate_limit_wait": self.rate_limit_wait,
+            **{name: self.counters[name] for name in CLIENT_COUNTERS},
+        }
+
+    def families(self, prefix: str = "sleepi") -> List[str]:
+        """ The OpenMetrics lines of every metric family, without the EOF marker """
+        endpoints = sorted(self._endpoints.items())
+        lines = format_family(
+            f"{prefix}_request_duration_seconds",
+            "histogram",
+            "Time from sending a request to reading its body",
+            self.__latency_samples(endpoints),
+            unit="seconds",
+        )
+        lines += format_family(
+            f"{prefix}_responses",
+            "counter",
+            "Requests by endpoint and response status",
+            (
+                ("_total", {"endpoint": group, "status": status}, count)
+                for group, metrics in endpoints
+                for status, count in sorted(metrics.statuses.items())
+            ),
+        )
+        for name, attribute, help_text in (
+            ("received_bytes", "received", "Response body bytes received"),
+            ("sent_bytes", "sent", "Request body bytes sent"),
+        ):
+            lines += format_family(
+                f"{prefix}_{name}",
+                "counter",
+                help_text,
+                (("_total", {"endpoint": group}, getattr(metrics, attribute)) for group, metrics in endpoints),
+                unit="bytes",
+            )
+        for name, help_text in ENDPOINT_COUNTERS.items():
+            lines += format_family(
+                f"{prefix}_{name}",
+                "counter",
+                help_text,
+                (("_total", {"endpoint": group}, metrics.counters[name]) for group, metrics in endpoints),
+            )
+        for name, help_text in CLIENT_COUNTERS.items():
+            lines += format_family(f"{prefix}_{name}", "counter", help_text, [("_total", {}, self.counters[name])])
+        lines += format_family(
+            f"{prefix}_rate_limit_wait_seconds",
+            "counter",
+            "Time spent waiting on the rate limiter",
+            [("_total", {}, self.rate_limit_wait)],
+            unit="seconds",
+        )
+        return lines
+
+    def openmetrics(self, prefix: str = "sleepi") -> str:
+        """ Everything recorded so far in the OpenMetrics text format """
+        return "\n".join(self.families(prefix) + ["# EOF", ""])
+
+    @staticmethod
+    def __latency_samples(endpoints: List[Tuple[str, _Endpoint]]) -> Iterator[Sample]:
+        for group, metrics in endpoints:
+            histogram = metrics.latency
+            for bound, total in histogram.cumulative():
+                yield "_bucket", {"endpoint": group, "le": _format_value(bound)}, total
+            yield "_count", {"endpoint": group}, histogram.count
+            yield "_sum", {"endpoint": group}, histogram.sum
+
+
+def _format_value(value: Union[int, float]) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+    return repr(value)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_family(
+    name: str,
+    kind: str,
+    help_text: str,
+    samples: Iterable[Sample],
+    unit: Optional[str] = None,
+    ) -> List[str]:
+    """ The OpenMetrics lines of a metric family
+
+    samples are (suffix, labels, value), e.g. ("_total", {"endpoint": "bed"}, 3).
+    """
+    lines = format_header(name, kind, help_text, unit)
+    lines += [format_sample(name, *sample) for sample in samples]
+    return lines
+
+
+def format_header(name: str, kind: str, help_text: str, unit: Optional[str] = None) -> List[str]:
+    """ The TYPE, UNIT and HELP lines of a metric family """
+    lines = [f"# TYPE {name} {kind}"]
+    if unit is not None:
+        lines.append(f"# UNIT {name} {unit}")
+    lines.append(f"# HELP {name} {help_text}")
+    return lines
+
+
+def format_sample(name: str, suffix: str, labels: Dict[str, str], value: Union[int, float]) -> str:
+    """ The line of a sample of a metric family """
+    return f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}"
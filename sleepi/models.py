@@ -1,9 +1,99 @@
 """ Models for Sleepi """
 from typing import Any, Dict, List
-from attr import dataclass
 
+import attr
 
-@dataclass
+
+def _decoder(cls, frozen: bool):
+    """ Generate a from_dict for a record from its field table
+
+    Fields without a default are read from the payload, in declaration
+    order, indexing it once per field. Fields with a default can be passed
+    positionally after the payload, otherwise they keep their default.
+
+    Frozen records are filled through their slot descriptors rather than
+    their __init__, whose per field object.__setattr__ calls would make
+    them much slower to build than mutable ones. Records have no
+    validators or converters, so nothing is skipped.
+    """
+    fields = attr.fields(cls)
+    namespace = {"cls": cls, "new": object.__new__}
+    lines = [
+        "def from_dict(data, *extra):",
+        "    if data is None:",
+        "        return None",
+    ]
+    if frozen:
+        lines += ["    self = new(cls)", "    count = len(extra)"]
+        position = 0
+        for index, field in enumerate(fields):
+            namespace[f"set_{index}"] = cls.__dict__[field.name].__set__
+            if field.default is attr.NOTHING:
+                value = f"data[{field.name!r}]"
+            else:
+                if isinstance(field.default, attr.Factory):
+                    namespace[f"default_{index}"] = field.default.factory
+                    default = f"default_{index}()"
+                else:
+                    namespace[f"default_{index}"] = field.default
+                    default = f"default_{index}"
+                value = f"extra[{position}] if count > {position} else {default}"
+                position += 1
+            lines.append(f"    set_{index}(self, {value})")
+        lines.append("    return self")
+    else:
+        payload = "".join(
+            f"data[{field.name!r}], " for field in fields if field.default is attr.NOTHING
+        )
+        lines.append(f"    return cls({payload}*extra)")
+
+    exec("\n".join(lines), namespace)  # pylint: disable=exec-used
+    from_dict = namespace["from_dict"]
+    from_dict.__qualname__ = f"{cls.__name__}.from_dict"
+    from_dict.__doc__ = f""" Return a {cls.__name__} object from the SleepIQ servers """
+    return from_dict
+
+
+def record(maybe_cls=None, *, frozen: bool = True):
+    """ Make a class a slotted attrs record, immutable unless frozen=False
+
+    The record gets a generated _decode (see _decoder), which is also its
+    from_dict unless the class defines its own.
+    """
+    def wrap(cls):
+        cls = attr.s(auto_attribs=True, slots=True, frozen=frozen)(cls)
+        cls._frozen = frozen
+        cls._decode = staticmethod(_decoder(cls, frozen))
+        if "from_dict" not in cls.__dict__:
+            cls.from_dict = cls._decode
+        return cls
+
+    return wrap if maybe_cls is None else wrap(maybe_cls)
+
+
+def copy_if_mutable(value):
+    """ Copy a value that is about to be handed out again if callers could change it
+
+    Frozen records and plain values are returned as they are. Lists and
+    dicts are copied along with their items, mutable records along with
+    the lists, dicts and mutable records they hold.
+    """
+    if isinstance(value, list):
+        return [copy_if_mutable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: copy_if_mutable(item) for key, item in value.items()}
+    if getattr(value, "_frozen", True):
+        return value
+    changes = {}
+    for field in attr.fields(type(value)):
+        item = getattr(value, field.name)
+        copied = copy_if_mutable(item)
+        if copied is not item:
+            changes[field.name] = copied
+    return attr.evolve(value, **changes)
+
+
+@record
 class Sleeper:
     """ Defines a sleeper """
     firstName: str
@@ -24,47 +114,15 @@ class Sleeper:
     licenseVersion: int
     username: str
     birthMonth: int
-    birthYear: int
     sleepGoal: int
     accountId: str
     isAccountOwner: bool
     email: str
     lastLogin: str
     side: int
-    favorite: int
+    favorite: int = None
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a bed object from the SleepIQ servers """
-        return Sleeper(
-            firstName = data["firstName"],
-            active = data["active"],
-            emailValidated = data["emailValidated"],
-            gender = data["gender"],
-            isChild = data["isChild"],
-            bedId = data["bedId"],
-            birthYear = data["birthYear"],
-            zipCode = data["zipCode"],
-            timezone = data["timezone"],
-            privacyPolicyVersion = data["privacyPolicyVersion"],
-            duration = data["duration"],
-            weight = data["weight"],
-            sleeperId = data["sleeperId"],
-            firstSessionRecorded = data["firstSessionRecorded"],
-            height = data["height"],
-            licenseVersion = data["licenseVersion"],
-            username = data["username"],
-            birthMonth = data["birthMonth"],
-            sleepGoal = data["sleepGoal"],
-            accountId = data["accountId"],
-            isAccountOwner = data["isAccountOwner"],
-            email = data["email"],
-            lastLogin = data["lastLogin"],
-            side = data["side"],
-            favorite = None
-        )
-
-@dataclass
+@record
 class Side:
     """ Return a side status """
     isInBed: bool
@@ -73,69 +131,30 @@ class Side:
     alertId: int
     lastLink: str
     pressure: int
-    side: str
-    sleeper: Sleeper
+    side: str = None
+    sleeper: Sleeper = None
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any], left_or_right: str):
-        """ Return a bed object from the SleepIQ servers """
-        return Side(
-            isInBed = data["isInBed"],
-            alertDetailedMessage = data["alertDetailedMessage"],
-            sleepNumber = data["sleepNumber"],
-            alertId = data["alertId"],
-            lastLink = data["lastLink"],
-            pressure = data["pressure"],
-            side = left_or_right,
-            sleeper = None
-        )
-
-@dataclass
+@record
 class Status:
     """ The status of the bed """
     status: bool
     bedId: str
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a bed object from the SleepIQ servers """
-        return Status(
-            status = data["status"],
-            bedId = data["bedId"],
-        )
-
-@dataclass
+@record
 class SleepNumberFavorite:
     """ Familystatus """
     bedId: str
     sleepNumberFavoriteRight: int
     sleepNumberFavoriteLeft: int
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a SleepNumberFavorite object from the SleepIQ servers """
-        return SleepNumberFavorite(
-            bedId = data["bedId"],
-            SleepNumberFavoriteRight = data["SleepNumberFavoriteRight"],
-            SleepNumberFavoriteLeft = data["SleepNumberFavoriteLeft"],
-        )
-
-@dataclass
+@record
 class FamilyStatus:
     """ Familystatus """
     left_side: Side
     right_side: Side
     # bed: Status
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a FamilyStatus object from the SleepIQ servers """
-        return FamilyStatus(
-            left_side = data["left_side"],
-            right_side = data["right_side"],
-        )
-
-@dataclass
+@record
 class FootWarming:
     """ Defines a light """
     footWarmingStatusLeft: int
@@ -143,65 +162,32 @@ class FootWarming:
     footWarmingTimerLeft: int
     footWarmingTimerRight: int
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a light object from the SleepIQ servers """
-        if data is not None:
-            return FootWarming(
-                footWarmingStatusLeft = data["footWarmingStatusLeft"],
-                footWarmingStatusRight = data["footWarmingStatusRight"],
-                footWarmingTimerLeft = data["footWarmingTimerLeft"],
-                footWarmingTimerRight = data["footWarmingTimerRight"],
-            )
-
-@dataclass
+@record
 class PrivacyMode:
     """ Defines privacy  mode """
     bedId: str
     accountId: str
     pauseMode: str
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a light object from the SleepIQ servers """
-        if data is not None:
-            return PrivacyMode(
-                bedId = data["bedId"],
-                accountId = data["accountId"],
-                pauseMode = data["pauseMode"],
-            )
-
-@dataclass
+@record
 class UnderbedLight:
     """ Defines a light """
     bedId: str
     enableAuto: bool
     prefSyncState: str
-    timer: str
-    name: str
+    name: str = None
+    timer: str = None
 
-
-    @staticmethod
-    def from_dict(data: Dict[str, Any], name):
-        """ Return a light object from the SleepIQ servers """
-        if data is not None:
-            return UnderbedLight(
-                bedId = data["bedId"],
-                enableAuto = data["enableAuto"],
-                prefSyncState = data["prefSyncState"],
-            )
-
-@dataclass
+@record
 class Light:
     """ Defines a light """
     bedId: str
     outlet: int
     setting: int
     timer: str
-    name: str
-    autoEnabled: bool
-    lightLevel: str
-
+    name: str = None
+    autoEnabled: bool = None
+    lightLevel: str = None
 
     @staticmethod
     def from_dict(data: Dict[str, Any], name, lightLevel, autoEnabled):
@@ -216,18 +202,9 @@ class Light:
         else:
             lightLevel = "off"
 
-        if data is not None:
-            return Light(
-                bedId = data["bedId"],
-                outlet = data["outlet"],
-                setting = data["setting"],
-                timer = data["timer"],
-                name = name,
-                autoEnabled = autoEnabled,
-                lightLevel = lightLevel,
-            )
+        return Light._decode(data, name, autoEnabled, lightLevel)
 
-@dataclass
+@record
 class Foundation_Status:
     """ Defines a foundation status """
     fsCurrentPositionPresetRight: str
@@ -256,38 +233,7 @@ class Foundation_Status:
     fsLeftHeadActuatorMotorStatus: str
     fsLeftFootActuatorMotorStatus: str
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a foundation object from the SleepIQ servers """
-        return Foundation_Status(
-        fsCurrentPositionPresetRight = data["fsCurrentPositionPresetRight"],
-        fsNeedsHoming = data["fsNeedsHoming"],
-        fsRightFootPosition = data["fsRightFootPosition"],
-        fsLeftPositionTimerLSB = data["fsLeftPositionTimerLSB"],
-        fsTimerPositionPresetLeft = data["fsTimerPositionPresetLeft"],
-        fsCurrentPositionPresetLeft = data["fsCurrentPositionPresetLeft"],
-        fsLeftPositionTimerMSB = data["fsLeftPositionTimerMSB"],
-        fsRightFootActuatorMotorStatus = data["fsRightFootActuatorMotorStatus"],
-        fsCurrentPositionPreset = data["fsCurrentPositionPreset"],
-        fsTimerPositionPresetRight = data["fsTimerPositionPresetRight"],
-        fsType = data["fsType"],
-        fsOutletsOn = data["fsOutletsOn"],
-        fsLeftHeadPosition = data["fsLeftHeadPosition"],
-        fsIsMoving = data["fsIsMoving"],
-        fsRightHeadActuatorMotorStatus = data["fsRightHeadActuatorMotorStatus"],
-        fsStatusSummary = data["fsStatusSummary"],
-        fsTimerPositionPreset = data["fsTimerPositionPreset"],
-        fsLeftFootPosition = data["fsLeftFootPosition"],
-        fsRightPositionTimerLSB = data["fsRightPositionTimerLSB"],
-        fsTimedOutletsOn = data["fsTimedOutletsOn"],
-        fsRightHeadPosition = data["fsRightHeadPosition"],
-        fsConfigured = data["fsConfigured"],
-        fsRightPositionTimerMSB = data["fsRightPositionTimerMSB"],
-        fsLeftHeadActuatorMotorStatus = data["fsLeftHeadActuatorMotorStatus"],
-        fsLeftFootActuatorMotorStatus = data["fsLeftFootActuatorMotorStatus"],
-        )
-
-@dataclass
+@record
 class Responsive_Air:
     """ Define responsive air """
     adjustmentThreshold: int
@@ -298,20 +244,7 @@ class Responsive_Air:
     prefSyncState: str
     rightSideEnabled: bool
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a responsive air object from the SleepIQ servers """
-        return Responsive_Air(
-            adjustmentThreshold = data["adjustmentThreshold"],
-            inBedTimeout = data["inBedTimeout"],
-            leftSideEnabled = data["leftSideEnabled"],
-            outOfBedTimeout = data["outOfBedTimeout"],
-            pollFrequency = data["pollFrequency"],
-            prefSyncState = data["prefSyncState"],
-            rightSideEnabled = data["rightSideEnabled"],
-        )
-
-@dataclass
+@record(frozen=False)
 class Foundation:
     """ Defines a foundation """
     fsBedType: int
@@ -321,25 +254,10 @@ class Foundation:
     fsBoardStatus: int
     fsLeftUnderbedLightPWM: int
     fsRightUnderbedLightPWM: int
-    foundation_status: Foundation_Status
-    features: Dict
+    foundation_status: Foundation_Status = None
+    features: Dict = attr.Factory(dict)
 
-    @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a foundation object from the SleepIQ servers """
-        return Foundation(
-            fsBedType = data["fsBedType"],
-            fsBoardFaults = data["fsBoardFaults"],
-            fsBoardFeatures = data["fsBoardFeatures"],
-            fsBoardHWRevisionCode = data["fsBoardHWRevisionCode"],
-            fsBoardStatus = data["fsBoardStatus"],
-            fsLeftUnderbedLightPWM = data["fsLeftUnderbedLightPWM"],
-            fsRightUnderbedLightPWM =  data["fsRightUnderbedLightPWM"],
-            foundation_status = None,
-            features = {},
-        )
-
-@dataclass
+@record(frozen=False)
 class Bed:
     """ Defines a bed """
     registrationDate: str
@@ -364,53 +282,15 @@ class Bed:
     sku: str
     zipcode: str
     reference: str
-    left_side: Side
-    right_side: Side
-    lights: List
-    # light1: Dict 
-    # light2: Dict
-    # light3: Dict
-    # light4: Dict
-    foundation: Foundation
-    responsive_air: Responsive_Air
-    privacy_mode: PrivacyMode
-    foot_warming: FootWarming
+    left_side: Side = None
+    right_side: Side = None
+    lights: List = attr.Factory(list)
+    foundation: Foundation = None
+    responsive_air: Responsive_Air = None
+    privacy_mode: PrivacyMode = None
+    foot_warming: FootWarming = None
 
     @staticmethod
-    def from_dict(data: Dict[str, Any]):
-        """ Return a bed object from the SleepIQ servers """
-        return Bed(
-            registrationDate = data["beds"][0]["registrationDate"],
-            sleeperRightId = data["beds"][0]["sleeperRightId"],
-            base = data["beds"][0]["base"],
-            returnRequestStatus = data["beds"][0]["returnRequestStatus"],
-            size = data["beds"][0]["size"],
-            name = data["beds"][0]["name"],
-            serial = data["beds"][0]["serial"],
-            isKidsBed = data["beds"][0]["isKidsBed"],
-            dualSleep = data["beds"][0]["dualSleep"],
-            bedId = data["beds"][0]["bedId"],
-            status = data["beds"][0]["status"],
-            sleeperLeftId = data["beds"][0]["sleeperLeftId"],
-            version = data["beds"][0]["version"],
-            accountId = data["beds"][0]["accountId"],
-            timezone = data["beds"][0]["timezone"],
-            generation = data["beds"][0]["generation"],
-            model = data["beds"][0]["model"],
-            purchaseDate = data["beds"][0]["purchaseDate"],
-            macAddress = data["beds"][0]["macAddress"],
-            sku = data["beds"][0]["sku"],
-            zipcode = data["beds"][0]["zipcode"],
-            reference = data["beds"][0]["reference"],
-            left_side = None,
-            right_side = None,
-            lights = [],
-            # light1 = {},
-            # light2 = {},
-            # light3 = {},
-            # light4 = {},
-            foundation = None,
-            responsive_air = None,
-            privacy_mode =  None,
-            foot_warming = None,
-        )
+    def from_dict(data: Dict[str, Any], index: int = 0):
+        """ Return a bed object from the SleepIQ servers, the first bed unless index is given """
+        return Bed._decode(data["beds"][index])
@@ -0,0 +1,101 @@
+""" Client side rate limiting for Sleepi """
+import asyncio
+import time
+from typing import Dict, Optional
+
+DEFAULT_ACCOUNT_RATE = 5.0
+DEFAULT_ACCOUNT_BURST = 10
+
+
+class TokenBucket:
+    """ A token bucket refilled at rate tokens per second, holding up to capacity tokens
+
+    Callers that find the bucket empty reserve a future token and sleep
+    until it is due, so they are served in arrival order.
+    """
+    def __init__(self, rate: float, capacity: float):
+        """ Initialize """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def __refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """ Take a token, returns the seconds spent waiting for it """
+        self.__refill()
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+
+        wait = -self._tokens / self.rate
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # Give the reserved token back
+            self._tokens += 1
+            raise
+        return wait
+
+
+class RateLimiter:
+    """ Rate limit requests with a token bucket per account and an optional global one
+
+    Share one limiter between every SleepIQ client of a process to bound
+    the aggregate request rate. Any object with an
+    `async acquire(account) -> float` method can be used instead.
+    """
+    def __init__(
+        self,
+        account_rate: float = DEFAULT_ACCOUNT_RATE,
+        account_burst: int = DEFAULT_ACCOUNT_BURST,
+        global_rate: Optional[float] = None,
+        global_burst: Optional[int] = None,
+        ):
+        """ Initialize """
+        self._account_rate = account_rate
+        self._account_burst = account_burst
+        self._accounts: Dict[str, TokenBucket] = {}
+        self._global: Optional[TokenBucket] = None
+        if global_rate is not None:
+            self._global = TokenBucket(global_rate, global_burst or max(1, int(global_rate)))
+        self.acquired = 0
+        self.delayed = 0
+        self.wait_seconds = 0.0
+        self.account_wait_seconds: Dict[str, float] = {}
+
+    async def acquire(self, account: str) -> float:
+        """ Wait until account may send a request, returns the seconds waited """
+        bucket = self._accounts.get(account)
+        if bucket is None:
+            bucket = self._accounts[account] = TokenBucket(self._account_rate, self._account_burst)
+
+        # The account's own bucket first, so one busy account queues on its
+        # own budget instead of draining the global one
+        waited = await bucket.acquire()
+        if self._global is not None:
+            waited += await self._global.acquire()
+
+        self.acquired += 1
+        if waited > 0:
+            self.delayed += 1
+            self.wait_seconds += waited
+            self.account_wait_seconds[account] = self.account_wait_seconds.get(account, 0.0) + waited
+        return waited
+
+    def stats(self) -> dict:
+        """ Counters of the limiter """
+        return {
+            "acquired": self.acquired,
+            "delayed": self.delayed,
+            "wait_seconds": self.wait_seconds,
+            "account_wait_seconds": dict(self.account_wait_seconds),
+        }
@@ -0,0 +1,130 @@
+""" Retries and circuit breaking for Sleepi """
+import random
+import time
+from typing import Dict, Optional
+
+# How many times a response with this status is retried
+DEFAULT_RETRY_STATUSES = {
+    429: 3,  # Too many requests
+    500: 2,  # Internal server error
+    502: 2,  # Bad gateway, once a new session key didn't help
+    503: 3,  # Server error
+    504: 3,  # Gateway timeout
+}
+DEFAULT_CONNECTION_RETRIES = 2
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 8.0
+DEFAULT_DEADLINE = 30.0
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    """ When and how long to wait before sending a failed request again
+
+    The delay grows exponentially from base_delay up to max_delay and is
+    randomized by jitter (0 means none, 1 means anywhere between 0 and the
+    full delay). No retry is started that would end after the deadline,
+    counted in seconds from the first attempt.
+    """
+    def __init__(
+        self,
+        statuses: Optional[Dict[int, int]] = None,
+        connection_retries: int = DEFAULT_CONNECTION_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        jitter: float = 1.0,
+        deadline: float = DEFAULT_DEADLINE,
+        ):
+        """ Initialize """
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+        self.statuses = DEFAULT_RETRY_STATUSES if statuses is None else statuses
+        self.connection_retries = connection_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def retries(self, status: Optional[int]) -> int:
+        """ Retries allowed for an HTTP status, None stands for a connection error """
+        if status is None:
+            return self.connection_retries
+        return self.statuses.get(status, 0)
+
+    def backoff(self, retry: int) -> float:
+        """ Seconds to wait before a retry, counting from 0 """
+        delay = min(self.max_delay, self.base_delay * 2 ** retry)
+        return delay * (1 - self.jitter * random.random())
+
+
+class CircuitBreaker:
+    """ Fail fast while the SleepIQ servers are down
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests are refused for reset_timeout seconds. Then a single trial
+    request is let through (half open): if it succeeds the circuit closes,
+    otherwise it opens again. A trial that ends without an answer either
+    way must be released, one still running after reset_timeout is given
+    up on and another trial is let through.
+    """
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        ):
+        """ Initialize """
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._trial_started = 0.0
+
+    @property
+    def state(self) -> str:
+        """ closed, open or half_open """
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_running = False
+        return self._state
+
+    def allow(self) -> bool:
+        """ Whether a request may be sent now """
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN:
+            now = time.monotonic()
+            if not self._trial_running or now - self._trial_started >= self.reset_timeout:
+                self._trial_running = True
+                self._trial_started = now
+                return True
+        return False
+
+    def release(self):
+        """ A request allowed through ended without reaching the servers """
+        if self._state == HALF_OPEN:
+            self._trial_running = False
+
+    def record_success(self):
+        """ A request reached the servers and got an answer """
+        self.failures = 0
+        self._state = CLOSED
+        self._trial_running = False
+
+    def record_failure(self):
+        """ A request failed because of the servers or the connection """
+        self.failures += 1
+        if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._trial_running = False
@@ -0,0 +1,227 @@
+""" Adaptive polling for Sleepi """
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from .sleepiq import DEFAULT_STATE_UPDATE_INTERVAL, SleepIQ
+
+_LOGGER = logging.getLogger(__name__)
+
+OCCUPANCY = "occupancy"
+FOUNDATION_STATUS = "foundation_status"
+SLEEPERS = "sleepers"
+BED = "bed"
+FOUNDATION = "foundation"
+
+DEFAULT_BACKOFF = 1.5
+MOVING_INTERVAL = 1.0
+SLOW_INTERVAL = 300.0
+SLOW_MAX_INTERVAL = 1800.0
+
+
+class PollGroup:
+    """ An endpoint group polled at its own cadence
+
+    The interval starts at min_interval and grows by backoff after every
+    poll that brings no change, up to max_interval. A change, as seen by
+    the key function, brings it back to min_interval. While hot returns
+    True for the latest value the group is polled every hot_interval.
+    """
+    def __init__(
+        self,
+        name: str,
+        fetch: Callable[[], Awaitable[Any]],
+        min_interval: float,
+        max_interval: float,
+        backoff: float = DEFAULT_BACKOFF,
+        key: Optional[Callable[[Any], Any]] = None,
+        hot: Optional[Callable[[Any], bool]] = None,
+        hot_interval: Optional[float] = None,
+        ):
+        """ Initialize """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Intervals must be positive and min_interval <= max_interval")
+        self.name = name
+        self.fetch = fetch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.key = key or (lambda value: value)
+        self.hot = hot
+        self.hot_interval = hot_interval if hot_interval is not None else min_interval
+        self.interval = min_interval
+        self.value: Any = None
+        self.due = 0.0
+
+    def is_hot(self) -> bool:
+        """ Whether the latest value asks for the fastest cadence """
+        return self.hot is not None and self.value is not None and bool(self.hot(self.value))
+
+    def next_interval(self, changed: bool) -> float:
+        """ Pick the interval after a poll """
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        if self.is_hot():
+            return min(self.interval, self.hot_interval)
+        return self.interval
+
+
+def _occupancy_key(sides) -> Any:
+    """ Only getting in or out of bed counts as an occupancy change, not pressure noise """
+    return tuple((side.side, side.isInBed) for side in sides)
+
+
+def default_poll_groups(api: SleepIQ) -> List[PollGroup]:
+    """ Occupancy and foundation motion are polled fast, bed metadata slowly """
+    fast = DEFAULT_STATE_UPDATE_INTERVAL.total_seconds()
+    return [
+        PollGroup(OCCUPANCY, api.get_family_status, fast, fast * 6, key=_occupancy_key),
+        PollGroup(
+            FOUNDATION_STATUS,
+            api.get_foundation_status,
+            fast,
+            fast * 12,
+            hot=lambda status: status.fsIsMoving,
+            hot_interval=MOVING_INTERVAL,
+        ),
+        PollGroup(SLEEPERS, api.get_sleepers, SLOW_INTERVAL, SLOW_MAX_INTERVAL),
+        PollGroup(BED, api.get_bed, SLOW_INTERVAL, SLOW_MAX_INTERVAL),
+        PollGroup(FOUNDATION, api.get_foundation, SLOW_INTERVAL, SLOW_MAX_INTERVAL),
+    ]
+
+
+class PollScheduler:
+    """ Keep the groups of a SleepIQ client up to date, each at its own cadence
+
+    Every group is polled by a task of its own, so a slow poll only delays
+    its own group. on_update is called with the group name and the new
+    value whenever a poll returns something different; it may be a
+    coroutine function, which then runs in the background. A change in one
+    of the wake groups (occupancy and foundation status by default) resets
+    all of them to their fastest cadence.
+    """
+    def __init__(
+        self,
+        api: SleepIQ,
+        groups: Optional[List[PollGroup]] = None,
+        on_update: Optional[Callable[[str, Any], Any]] = None,
+        wake_groups=(OCCUPANCY, FOUNDATION_STATUS),
+        ):
+        """ Initialize """
+        self._api = api
+        self._groups: Dict[str, PollGroup] = {
+            group.name: group for group in (groups or default_poll_groups(api))
+        }
+        self._on_update = on_update
+        self._wake_groups = [name for name in wake_groups if name in self._groups]
+        self._task: Optional[asyncio.Future] = None
+        # Set to make a group's task look at its due time again
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._updates: Set[asyncio.Future] = set()
+
+    @property
+    def values(self) -> Dict[str, Any]:
+        """ The latest value of every group """
+        return {name: group.value for name, group in self._groups.items()}
+
+    def interval(self, name: str) -> float:
+        """ The current interval of a group, in seconds """
+        return self._groups[name].interval
+
+    def start(self):
+        """ Start polling in the background """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """ Stop polling """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        """ Poll until cancelled """
+        loop = asyncio.get_running_loop()
+        if self._api.bed_id is None:
+            # Every other endpoint needs the bed id
+            await self._api.get_bed()
+
+        now = loop.time()
+        for group in self._groups.values():
+            group.due = now
+        # Created here so they bind to the loop that runs the polls
+        self._wakeups = {name: asyncio.Event() for name in self._groups}
+        tasks = [asyncio.ensure_future(self.__run_group(group)) for group in self._groups.values()]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            pending = tasks + list(self._updates)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def __run_group(self, group: PollGroup):
+        """ Poll a group whenever it is due """
+        loop = asyncio.get_running_loop()
+        wakeup = self._wakeups[group.name]
+        while True:
+            delay = group.due - loop.time()
+            if delay <= 0:
+                await self.__poll(group)
+                continue
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __poll(self, group: PollGroup):
+        """ Poll a group and schedule its next poll """
+        loop = asyncio.get_running_loop()
+        try:
+            value = await group.fetch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exception:  # pylint: disable=broad-except
+            _LOGGER.warning("Polling %s failed: %s", group.name, exception)
+            group.due = loop.time() + group.next_interval(False)
+            return
+
+        previous = group.value
+        changed = previous is None or group.key(value) != group.key(previous)
+        group.value = value
+        group.due = loop.time() + group.next_interval(changed)
+
+        if changed and previous is not None and group.name in self._wake_groups:
+            self.__wake(group)
+
+        if value != previous and self._on_update is not None:
+            result = self._on_update(group.name, value)
+            if asyncio.iscoroutine(result):
+                # Not awaited, a slow handler mustn't hold back the next poll
+                update = asyncio.ensure_future(result)
+                self._updates.add(update)
+                update.add_done_callback(self.__update_done)
+
+    def __update_done(self, update: asyncio.Future):
+        """ Forget a finished on_update call, logging its error """
+        self._updates.discard(update)
+        if not update.cancelled() and update.exception() is not None:
+            _LOGGER.warning("on_update failed: %s", update.exception())
+
+    def __wake(self, changed: PollGroup):
+        """ Something happened on the bed, poll the wake groups fast again """
+        now = asyncio.get_running_loop().time()
+        for name in self._wake_groups:
+            group = self._groups[name]
+            if group is changed:
+                continue
+            group.interval = group.min_interval
+            group.due = min(group.due, now + group.min_interval)
+            self._wakeups[name].set()
@@ -0,0 +1,210 @@
+""" Multi-process polling for Sleepi """
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from multiprocessing.connection import Connection, wait
+from typing import Any, AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import codec
+from .fleet import SleepIQFleet
+from .sleepiq import SUBSYSTEMS
+from .wheel import DEFAULT_INTERVAL, WheelScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.1
+STOP_TIMEOUT = 10.0
+
+
+class Delta(NamedTuple):
+    """ The fields of a bed that changed in one poll, as (path, new value) pairs """
+    shard: int
+    bed_id: str
+    changes: List[Tuple[str, Any]]
+
+
+def shard_of(account: str, shards: int) -> int:
+    """ The shard an account belongs to, always the same for the same account """
+    # crc32 spreads similar usernames unevenly, blake2b doesn't
+    return int.from_bytes(hashlib.blake2b(account.encode(), digest_size=8).digest(), "little") % shards
+
+
+def _run_shard(
+    shard: int,
+    conn: Connection,
+    accounts: List[Tuple[str, str]],
+    interval: float,
+    subsystems: frozenset,
+    flush_interval: float,
+    fleet_options: Dict[str, Any],
+    ):
+    """ Entry point of a worker process """
+    try:
+        asyncio.run(_shard_main(shard, conn, accounts, interval, subsystems, flush_interval, fleet_options))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+async def _shard_main(
+    shard: int,
+    conn: Connection,
+    accounts: List[Tuple[str, str]],
+    interval: float,
+    subsystems: frozenset,
+    flush_interval: float,
+    fleet_options: Dict[str, Any],
+    ):
+    """ Poll the beds of a shard's accounts and send their changes to the parent """
+    loop = asyncio.get_running_loop()
+    # [bed_id, [[path, new value], ...]] of every poll that changed something
+    pending: List[list] = []
+
+    def on_result(bed_id, changes):
+        if changes:
+            pending.append([bed_id, [[change.path, change.new] for change in changes]])
+
+    fleet = SleepIQFleet(**fleet_options)
+    for username, password in accounts:
+        fleet.add_account(username, password)
+    wheel = WheelScheduler(interval, on_result=on_result)
+    try:
+        await fleet.discover()
+        wheel.add_fleet(fleet, subsystems=subsystems)
+        wheel.start()
+        next_discovery = loop.time() + interval
+        while True:
+            if pending:
+                # One send per flush rather than one per bed, as a codec snapshot
+                # which is smaller than a pickle and about as quick to read back
+                batch, pending = codec.encode(pending), []
+                await loop.run_in_executor(None, conn.send_bytes, batch)
+            if conn.poll():
+                # The parent only ever sends the stop message
+                break
+            if fleet.account_errors and loop.time() >= next_discovery:
+                await fleet.discover(list(fleet.account_errors))
+                wheel.add_fleet(fleet, subsystems=subsystems)
+                next_discovery = loop.time() + interval
+            await asyncio.sleep(flush_interval)
+    finally:
+        await wheel.stop()
+        await fleet.close()
+
+
+class ShardedRunner:
+    """ Poll many accounts from several processes
+
+    Accounts are split across processes by a hash of their username. Each
+    process runs its own event loop, session and SleepIQFleet, polls its
+    beds on a WheelScheduler and sends the changes of each poll back in
+    batches over a pipe, encoded with sleepi.codec, see deltas. Other
+    keyword arguments are passed to every process's SleepIQFleet and must
+    be picklable.
+    """
+    def __init__(
+        self,
+        accounts: Iterable[Tuple[str, str]],
+        processes: Optional[int] = None,
+        interval: float = DEFAULT_INTERVAL,
+        subsystems: Iterable[str] = SUBSYSTEMS,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        start_method: str = "spawn",
+        **fleet_options,
+        ):
+        """ Initialize """
+        self._processes = processes or os.cpu_count() or 1
+        if self._processes < 1:
+            raise ValueError("processes must be at least 1")
+        self._shards: List[List[Tuple[str, str]]] = [[] for _ in range(self._processes)]
+        for username, password in accounts:
+            self._shards[shard_of(username, self._processes)].append((username, password))
+        self._interval = interval
+        self._subsystems = frozenset(subsystems)
+        self._flush_interval = flush_interval
+        self._context = multiprocessing.get_context(start_method)
+        self._fleet_options = fleet_options
+        self._workers: List[multiprocessing.process.BaseProcess] = []
+        self._conns: List[Connection] = []
+        self._reading = False
+        # Deltas received from each shard
+        self.received = [0] * self._processes
+
+    def shard(self, index: int) -> List[str]:
+        """ Usernames of the accounts of a shard """
+        return [username for username, _ in self._shards[index]]
+
+    def start(self):
+        """ Start the worker processes """
+        if self._workers:
+            return
+        for index, accounts in enumerate(self._shards):
+            parent, child = self._context.Pipe()
+            worker = self._context.Process(
+                target=_run_shard,
+                args=(
+                    index,
+                    child,
+                    accounts,
+                    self._interval,
+                    self._subsystems,
+                    self._flush_interval,
+                    self._fleet_options,
+                ),
+                name=f"sleepi-shard-{index}",
+                daemon=True,
+            )
+            worker.start()
+            child.close()
+            self._workers.append(worker)
+            self._conns.append(parent)
+
+    async def deltas(self) -> AsyncIterator[Delta]:
+        """ Iterate over the changes the workers send, until they all stop """
+        loop = asyncio.get_running_loop()
+        shards = {conn: shard for shard, conn in enumerate(self._conns)}
+        open_conns = list(self._conns)
+        self._reading = True
+        try:
+            while open_conns:
+                # One thread waits on every pipe, off the event loop
+                ready = await loop.run_in_executor(None, wait, open_conns, self._flush_interval)
+                for conn in ready:
+                    try:
+                        batch = conn.recv_bytes()
+                    except (EOFError, OSError):
+                        # The worker stopped
+                        open_conns.remove(conn)
+                        conn.close()
+                        continue
+                    shard = shards[conn]
+                    for bed_id, changes in codec.decode(batch):
+                        self.received[shard] += 1
+                        yield Delta(shard, bed_id, [(path, new) for path, new in changes])
+        finally:
+            self._reading = False
+
+    async def stop(self, timeout: float = STOP_TIMEOUT):
+        """ Ask the workers to stop, terminating those that don't in time """
+        loop = asyncio.get_running_loop()
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        deadline = loop.time() + timeout
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.join, max(deadline - loop.time(), 0))
+            if worker.is_alive():
+                _LOGGER.warning("Terminating %s", worker.name)
+                worker.terminate()
+                await loop.run_in_executor(None, worker.join)
+        if not self._reading:
+            # Otherwise deltas closes them once it has read what is left
+            for conn in self._conns:
+                conn.close()
+        self._workers = []
+        self._conns = []
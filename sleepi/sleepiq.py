@@ -1,22 +1,58 @@
 """ Define the Sleepi API """
 import asyncio
+import hashlib
+import json
 import logging
+import os
+import time
 import aiohttp
+import attr
 
+from .cache import ResponseCache
+from .commands import CommandCoalescer
 from .const import (
     BED_LIGHTS,
+    OUTLET_FEATURES,
 )
-from .exceptions import SleepiConnectionError, SleepiError, SleepiGenericError
-from .models import Bed, FamilyStatus, FootWarming, Foundation, Foundation_Status, Light, PrivacyMode, Responsive_Air, Side, Sleeper
+from .helpers import default_json_loads, foundation_features
+from .metrics import Metrics
+from .tracing import HTTP, NO_SPAN, PHASE, Tracer, traced
+from .exceptions import SleepiCircuitOpenError, SleepiConnectionError, SleepiError, SleepiGenericError
+from .ratelimit import RateLimiter
+from .retry import CircuitBreaker, RetryPolicy
+from .watch import DEFAULT_QUEUE_SIZE, DROP_OLDEST, Change, Watcher, diff
+from .models import Bed, FootWarming, Foundation, Foundation_Status, Light, PrivacyMode, Responsive_Air, Side, Sleeper, UnderbedLight, copy_if_mutable
 
 from aiohttp import ClientSession
-from aiohttp.client_exceptions import ClientError
+from concurrent.futures import Executor
 from datetime import timedelta
-from typing import Dict, Optional
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+from yarl import URL
 
 
 BASE_URL = "https://prod-api.sleepiq.sleepnumber.com/rest"
 DEFAULT_STATE_UPDATE_INTERVAL = timedelta(seconds=5)
+DEFAULT_MAX_CONCURRENT_REQUESTS = 6
+DEFAULT_OFFLOAD_THRESHOLD = 64 * 1024
+DEFAULT_SESSION_LIFETIME = timedelta(hours=1)
+DEFAULT_SESSION_REFRESH_MARGIN = timedelta(minutes=5)
+SESSION_RETRY_DELAY = timedelta(seconds=30)
+LOGIN_ATTEMPTS = 3
+# Responses that mean the session key is no longer accepted
+SESSION_ERRORS = {
+    401: "Unauthorized",
+    404: "Not found",
+    502: "Session is invalid",
+}
+HTTP_ERRORS = {
+    400: "Bad request",
+    429: "Too many requests",
+    500: "Internal server error",
+    503: "Server error",
+    504: "Gateway timeout",
+    **SESSION_ERRORS,
+}
 DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/28.0.1500.95 Safari/537.36'}
 _LOGGER = logging.getLogger(__name__)
 
@@ -36,6 +72,35 @@ FLAT = 4
 ZERO_G = 5
 SNORE = 6
 
+# Underbed light PWM of each brightness
+UNDERBED_LIGHT_PWM = {
+    "high": 100,
+    "medium": 30,
+    "med": 30,
+    "low": 1,
+    "off": 0,
+}
+
+# Parts of a bed refresh() can update on their own
+OCCUPANCY = "occupancy"
+SLEEPERS = "sleepers"
+FOUNDATION = "foundation"
+LIGHTS = "lights"
+RESPONSIVE_AIR = "responsive_air"
+PRIVACY = "privacy"
+FOOT_WARMING = "foot_warming"
+FAVORITES = "favorites"
+SUBSYSTEMS = frozenset([
+        OCCUPANCY,
+        SLEEPERS,
+        FOUNDATION,
+        LIGHTS,
+        RESPONSIVE_AIR,
+        PRIVACY,
+        FOOT_WARMING,
+        FAVORITES,
+    ])
+
 BED_PRESETS = [
         FAVORITE,
         READ,
@@ -45,135 +110,660 @@ BED_PRESETS = [
         SNORE
     ]
 
+class _Decoded(NamedTuple):
+    """ The last response of a GET """
+    digest: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    value: Any
+
+
+def _sleepers_from_dict(data: Dict[str, Any]) -> List[Sleeper]:
+    """ Sleepers of a sleeper response """
+    return [Sleeper.from_dict(sleeper) for sleeper in data["sleepers"]]
+
+
+def _beds_from_dict(data: Dict[str, Any]) -> List[Bed]:
+    """ Every bed of a bed response """
+    return [Bed.from_dict(data, index) for index in range(len(data["beds"]))]
+
+
+def _family_statuses_from_dict(data: Dict[str, Any]) -> Dict[str, List[Side]]:
+    """ Sides of every bed of a familyStatus response, keyed by bed id """
+    return {
+        str(bed["bedId"]): [
+            Side.from_dict(bed["leftSide"], "left"),
+            Side.from_dict(bed["rightSide"], "right"),
+        ]
+        for bed in data["beds"]
+    }
+
+
 class SleepIQ:
     """ Define a class for interacting with the SleepIQ REST APIs """
     def __init__(
         self,
         username: str,
         password: str,
-        websession: ClientSession
+        websession: ClientSession,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        cache: Optional[ResponseCache] = None,
+        coalesce_requests: bool = True,
+        token_file: Optional[str] = None,
+        session_lifetime: timedelta = DEFAULT_SESSION_LIFETIME,
+        session_refresh_margin: timedelta = DEFAULT_SESSION_REFRESH_MARGIN,
+        auto_refresh_session: bool = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        json_loads: Optional[Callable[[bytes], Any]] = None,
+        offload_threshold: Optional[int] = DEFAULT_OFFLOAD_THRESHOLD,
+        executor: Optional[Executor] = None,
+        skip_unchanged: bool = True,
+        coalesce_window: Optional[timedelta] = None,
+        elide_writes: bool = True,
+        base_url: str = BASE_URL,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
         ):
         """ Initialize """
+        if max_concurrent_requests < 1:
+            raise ValueError("max_concurrent_requests must be at least 1")
         self._username = username
         self._password = password
         self._websession = websession
+        self._base_url = base_url.rstrip("/")
         self._bedId: str = None
         self._key = None
-
+        self._key_issued: float = 0
+        self._token_file = token_file
+        self._session_lifetime = session_lifetime
+        self._session_refresh_margin = session_refresh_margin
+        self._auto_refresh_session = auto_refresh_session
+        self._login_lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Future] = None
+        self._max_concurrent_requests = max_concurrent_requests
+        self._request_slots: Optional[asyncio.Semaphore] = None
+        self._missing_outlets: Dict[str, Set[int]] = {}
+        self._cache = cache
+        self._coalesce_requests = coalesce_requests
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._retry_policy = retry_policy or RetryPolicy()
+        # One breaker per account, share it between clients of the same account
+        self._circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._rate_limiter = rate_limiter
+        # Seconds this client spent waiting on the rate limiter
+        self.rate_limit_wait = 0.0
+        self._watcher: Optional[Watcher] = None
+        # Bodies of offload_threshold bytes or more are parsed off the event loop
+        self._json_loads = json_loads or default_json_loads()
+        self._offload_threshold = offload_threshold
+        self._executor = executor
+        # The last decoded response per GET, reused while the body stays the same
+        self._skip_unchanged = skip_unchanged
+        self._decoded: Dict[Hashable, _Decoded] = {}
+        self.decode_stats = {"hits": 0, "misses": 0, "not_modified": 0}
+        # Rapid position, sleep number and brightness writes only send the latest value
+        self._commands: Optional[CommandCoalescer] = None
+        if coalesce_window is not None:
+            self._commands = CommandCoalescer(coalesce_window.total_seconds())
+        # Last known underbed light PWM, auto light and outlet settings per bed,
+        # light writes that would not change them are skipped
+        self._elide_writes = elide_writes
+        self._last_state: Dict[Tuple[str, Hashable], Any] = {}
+        self.elided_writes = 0
+        # Features of each bed's foundation, endpoints it lacks aren't polled
+        self._capabilities: Dict[str, Mapping[str, bool]] = {}
+        # Latency, statuses, retries, logins and cache hits of the requests sent
+        self.metrics = metrics or Metrics()
+        # Spans of the calls and requests, when tracing
+        self._tracer = tracer
+
+    @property
+    def bed_id(self) -> Optional[str]:
+        """ Id of the bed this client talks to, known once the bed has been fetched """
+        return self._bedId
+
+    def __get_request_slots(self) -> asyncio.Semaphore:
+        """ Semaphore capping the number of requests in flight """
+        # Created lazily so it binds to the loop that actually runs the requests
+        if self._request_slots is None:
+            self._request_slots = asyncio.Semaphore(self._max_concurrent_requests)
+        return self._request_slots
+
+    def __span(self, name: str, category: str, **args):
+        """ A span of the tracer, one recording nothing when not tracing """
+        if self._tracer is None:
+            return NO_SPAN
+        return self._tracer.span(name, category, **args)
+
+    def __get_login_lock(self) -> asyncio.Lock:
+        """ Lock making sure only one login runs at a time """
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        return self._login_lock
+
+    @traced
     async def login(self):
-        """ Log into the API """
+        """ Log into the API
+
+        A session saved to the token file is reused when there is no key
+        yet. Concurrent callers share one login.
+        """
         if not self._username or not self._password:
             raise ValueError("username/password not set")
-        
-        data = {'login': self._username, 'password': self._password}
-        response = await self._websession.put(
-            BASE_URL+'/login',
-            json=data,
-            headers=DEFAULT_HEADERS
-            )
+        if self._key is None:
+            return await self.__start_session()
+        return await self.__renew_session(self._key)
+
+    async def __aenter__(self) -> "SleepIQ":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """ Send pending writes and stop refreshing the session in the background
+
+        Call it once done with a client that refreshes its session or
+        coalesces writes, or use the client as an async context manager.
+        """
+        if self._commands is not None:
+            await self._commands.drain()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def __start_session(self) -> bool:
+        """ Get a first key, from the token file if possible """
+        async with self.__get_login_lock():
+            if self._key is not None:
+                return True
+            if await self.__load_session():
+                return True
+            return await self.__login()
+
+    async def __renew_session(self, stale_key: Optional[str]) -> bool:
+        """ Replace a key SleepIQ rejected or that is about to expire """
+        async with self.__get_login_lock():
+            if self._key is not None and self._key != stale_key:
+                # Someone else logged in while we were waiting
+                return True
+            return await self.__login()
+
+    async def __get_key(self) -> str:
+        """ The key to send with a request, logging in when needed """
+        if self._key is None:
+            if not await self.__start_session():
+                raise SleepiGenericError("There is no token attached to this request")
+        elif time.time() >= self._key_issued + self._session_lifetime.total_seconds():
+            await self.__renew_session(self._key)
+        return self._key
 
-        if response.status == 401:
-            raise ValueError("HTTP Error 401: Incorect username or password")
-        elif response.status == 502:  # 502 Session Invalid
-            await self.login()
-            _LOGGER.error("HTTP error 502: Session is invalid") 
-        elif response.status == 503:  # 503 Server Error
-            await response.raise_for_status()
-            _LOGGER.error("HTTP error 503: Server error") 
-        elif response.status == 400:  # 400 bad request
-            await response.raise_for_status()
-            _LOGGER.error("HTTP error 400: Bad request") 
-        
-        json_response = await response.json()
+    async def __login(self) -> bool:
+        """ Log in, the caller holds the login lock """
+        if not self._username or not self._password:
+            raise ValueError("username/password not set")
 
-        if json_response["key"] is not None:
-            self._key = json_response["key"]
-            # await self.get_bed_id()
-            return True
+        data = {'login': self._username, 'password': self._password}
+        for attempt in range(LOGIN_ATTEMPTS):
+            await self.__wait_for_rate_limit()
+            try:
+                started = time.perf_counter()
+                with self.__span("PUT login", HTTP) as span:
+                    response = await self._websession.put(
+                        self._base_url + '/login',
+                        json=data,
+                        headers=DEFAULT_HEADERS
+                        )
+                    span.set(status=response.status)
+                self.metrics.observe(
+                    "login", response.status, time.perf_counter() - started, response.content_length or 0
+                )
+                if response.status == 401:
+                    raise ValueError("HTTP Error 401: Incorect username or password")
+                elif response.status == 502:  # 502 Session Invalid
+                    _LOGGER.error("HTTP error 502: Session is invalid")
+                    response.release()
+                    await asyncio.sleep(self._retry_policy.backoff(attempt))
+                    continue
+                elif response.status == 503:  # 503 Server Error
+                    _LOGGER.error("HTTP error 503: Server error")
+                    response.raise_for_status()
+                elif response.status == 400:  # 400 bad request
+                    _LOGGER.error("HTTP error 400: Bad request")
+                    response.raise_for_status()
+
+                json_response = await response.json()
+            except asyncio.TimeoutError as exception:
+                raise SleepiConnectionError(
+                    "Timeout occurred while connecting to the SleepIQ servers"
+                ) from exception
+            except aiohttp.ClientError as exception:
+                raise SleepiConnectionError(
+                    "Error occurred while logging into the SleepIQ servers"
+                ) from exception
+            break
         else:
+            raise SleepiConnectionError("The SleepIQ servers kept rejecting the login")
+
+        if json_response["key"] is None:
             return False
 
+        self.metrics.count("logins")
+        if self._key is not None:
+            self.metrics.count("relogins")
+        self._key = json_response["key"]
+        self._key_issued = time.time()
+        # await self.get_bed_id()
+        await self.__save_session()
+        self.__schedule_refresh()
+        return True
+
+    async def __load_session(self) -> bool:
+        """ Reuse the key saved by an earlier process if it is still valid """
+        if self._token_file is None:
+            return False
+        loop = asyncio.get_running_loop()
+        session = await loop.run_in_executor(None, self.__read_token_file)
+        if (
+            not session
+            or session.get("username") != self._username
+            or session.get("issued", 0) + self._session_lifetime.total_seconds() <= time.time()
+        ):
+            return False
+
+        self._key = session["key"]
+        self._key_issued = session["issued"]
+        cookies = session.get("cookies")
+        if cookies and self._websession is not None:
+            self._websession.cookie_jar.update_cookies(cookies, URL(self._base_url))
+        _LOGGER.debug("Reusing the SleepIQ session saved in %s", self._token_file)
+        self.__schedule_refresh()
+        return True
+
+    async def __save_session(self):
+        """ Save the key so the next process doesn't have to log in """
+        if self._token_file is None:
+            return
+        cookies = {}
+        if self._websession is not None:
+            cookies = {
+                name: morsel.value
+                for name, morsel in self._websession.cookie_jar.filter_cookies(URL(self._base_url)).items()
+            }
+        session = {
+            "username": self._username,
+            "key": self._key,
+            "issued": self._key_issued,
+            "cookies": cookies,
+        }
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.__write_token_file, session)
+
+    def __read_token_file(self) -> Optional[dict]:
+        try:
+            with open(self._token_file, encoding="utf-8") as token_file:
+                return json.load(token_file)
+        except (OSError, ValueError) as exception:
+            _LOGGER.debug("Could not read %s: %s", self._token_file, exception)
+            return None
+
+    def __write_token_file(self, session: dict):
+        try:
+            # The key is a credential, keep it private to the user
+            fd = os.open(self._token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, "w", encoding="utf-8") as token_file:
+                json.dump(session, token_file)
+        except OSError as exception:
+            _LOGGER.warning("Could not save the SleepIQ session to %s: %s", self._token_file, exception)
+
+    def __schedule_refresh(self):
+        """ Start renewing the key in the background, if enabled """
+        if self._auto_refresh_session and self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self.__refresh_session())
+
+    async def __refresh_session(self):
+        """ Renew the key shortly before it expires so requests never wait on a login """
+        while not self._websession.closed:
+            delay = (
+                self._key_issued
+                + self._session_lifetime.total_seconds()
+                - self._session_refresh_margin.total_seconds()
+                - time.time()
+            )
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await self.__renew_session(self._key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:  # pylint: disable=broad-except
+                _LOGGER.warning("Could not refresh the SleepIQ session: %s", exception)
+                await asyncio.sleep(SESSION_RETRY_DELAY.total_seconds())
+
     async def __request(
         self,
         endpointName: str,
-        params: Optional[dict] = {},
+        params: Optional[dict] = None,
         method: Optional[str] = None,
         data: Optional[dict] = None,
+        build: Optional[Callable[[Any], Any]] = None,
         ):
-        """ Send a REST call to the SleepIQ instance """
+        """ Send a REST call to the SleepIQ instance
+
+        A GET returns build(response) when build is given, e.g. a model's
+        from_dict. Identical GETs running at the same time share one HTTP
+        request. With a response cache configured, GETs are answered from
+        it while fresh and a PUT drops the cached responses of its endpoint.
+        Mutable models are copied so callers never share one.
+        """
         method = "GET" if data is None else "PUT"
-        url = BASE_URL + "/" + endpointName
-        headers = DEFAULT_HEADERS
+        if method == "PUT":
+            response = await self.__send(method, endpointName, params, data)
+            if self._cache is not None:
+                self._cache.invalidate(endpointName)
+            return response
+
+        key = ResponseCache.key(endpointName, params) + (build,)
+        if self._cache is not None:
+            found, response = self._cache.get(key)
+            if found:
+                self.metrics.count("cache_hits", endpointName)
+                return copy_if_mutable(response)
+
+        if not self._coalesce_requests:
+            return copy_if_mutable(await self.__get(key, endpointName, params, build))
+
+        request = self._in_flight.get(key)
+        if request is None:
+            request = asyncio.ensure_future(self.__get(key, endpointName, params, build))
+            self._in_flight[key] = request
+            request.add_done_callback(partial(self.__request_done, key))
+        else:
+            self.metrics.count("coalesced", endpointName)
+        # Shielded so a cancelled waiter doesn't cancel the request for the others
+        return copy_if_mutable(await asyncio.shield(request))
+
+    def __request_done(self, key, request: asyncio.Future):
+        """ Forget a finished shared request """
+        if self._in_flight.get(key) is request:
+            del self._in_flight[key]
+        if not request.cancelled():
+            # Mark the error as retrieved, every waiter got it already
+            request.exception()
+
+    async def __get(self, key, endpointName: str, params: Optional[dict], build):
+        """ Send a GET and cache its response, unless a PUT invalidated it meanwhile """
+        generation = self._cache.generation(endpointName) if self._cache is not None else None
+        response = await self.__send("GET", endpointName, params, None, key, build)
+        if self._cache is not None and self._cache.generation(endpointName) == generation:
+            self._cache.put(key, response)
+        return response
+
+    async def __send(
+        self,
+        method: str,
+        endpointName: str,
+        params: Optional[dict],
+        data: Optional[dict],
+        key: Optional[Hashable] = None,
+        build: Optional[Callable[[Any], Any]] = None,
+        ):
+        """ Send a REST call to the SleepIQ servers
+
+        A rejected session key is renewed once and the call sent again.
+        Transient failures are retried according to the retry policy, and
+        nothing is sent while the circuit breaker is open. GETs with a key
+        are conditional when SleepIQ gave validators for the last response.
+        """
+        url = self._base_url + "/" + endpointName
+        params = dict(params) if params else {}
 
         if self._websession is None:
             raise(SleepiGenericError("Generic error"))
 
-        if self._key is None:
-            login = await self.login()
-            if login:
-                if '_k' not in params:
-                    params["_k"] = self._key
-            else:
-                raise SleepiGenericError("There is no token attached to this request")
-        else:
-            params["_k"] = self._key
-
-        print(f"Querying {url} with key: {self._key}")
-
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._retry_policy.deadline
+        breaker = self._circuit_breaker
+        retries = 0
+        renewed = False
+        # Whether the breaker let this request through and hasn't heard how it went
+        permitted = False
         try:
-            response = await self._websession.request(
-                method,
-                url,
-                json=data,
-                headers=headers,
-                params=params
-            )
-            if response.status == 404: # 404 page not found
-                if "foundation/outlet" in url:
-                    return None
+            while True:
+                if not permitted:
+                    if not breaker.allow():
+                        raise SleepiCircuitOpenError(
+                            "The SleepIQ servers keep failing, not sending requests for now"
+                        )
+                    permitted = True
+                params["_k"] = await self.__get_key()
+                await self.__wait_for_rate_limit()
+
+                status = None
+                try:
+                    status, headers, body = await self.__send_once(
+                        method, endpointName, url, params, data, self.__conditional_headers(key)
+                    )
+                except asyncio.TimeoutError as exception:
+                    breaker.record_failure()
+                    permitted = False
+                    error = SleepiConnectionError(
+                        "Timeout occurred while connecting to the SleepIQ servers"
+                    )
+                    error.__cause__ = exception
+                except aiohttp.ClientError as exception:
+                    breaker.record_failure()
+                    permitted = False
+                    error = SleepiConnectionError(
+                        "Error occurred while communicating with the SleepIQ servers"
+                    )
+                    error.__cause__ = exception
                 else:
-                    await self.login()
-                    _LOGGER.error("Http error 404: Not found") 
-            if response.status == 401: # 401 Unauthorized
-                _LOGGER.error("HTTP error 401: Unauthorized") 
-                await self.login()
-            elif response.status == 502:  # 502 Session Invalid
-                await self.login()
-                _LOGGER.error("HTTP error 502: Session is invalid") 
-            elif response.status == 503:  # 503 Server Error
-                await response.raise_for_status()
-                _LOGGER.error("HTTP error 503: Server error") 
-            elif response.status == 400:  # 400 bad request
-                _LOGGER.error("HTTP error 400: Bad request")
-                await response.raise_for_status()
-        except asyncio.TimeoutError as exception:
-            raise SleepiConnectionError(
-                "Timeout occurred while connecting to the SleepIQ servers"
-            ) from exception
-        except (
-            aiohttp.ClientError,
-            aiohttp.ClientResponseError,
-        ) as exception:
-            raise SleepiConnectionError(
-                "Error occurred while communicating with the SleepIQ servers"
-            )
-
-        content_type = response.headers.get("Content-Type", "")
+                    if status in SESSION_ERRORS and not renewed and not (
+                        status == 404 and "foundation/outlet" in url
+                    ):
+                        # The permit is kept for the request sent with the new key
+                        _LOGGER.error("HTTP error %s: %s", status, SESSION_ERRORS[status])
+                        renewed = True
+                        await self.__renew_session(params["_k"])
+                        continue
+
+                    if status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    permitted = False
+                    if status < 400:
+                        return await self.__materialize(key, build, status, headers, body)
+                    if status == 404 and "foundation/outlet" in url:
+                        # 404 page not found, the foundation has no such outlet
+                        return None
+
+                    _LOGGER.error("HTTP error %s: %s", status, HTTP_ERRORS.get(status, "Request failed"))
+                    error = SleepiConnectionError(
+                        f"HTTP error {status} while communicating with the SleepIQ servers"
+                    )
+
+                delay = self._retry_policy.backoff(retries)
+                if retries >= self._retry_policy.retries(status) or loop.time() + delay > deadline:
+                    raise error
+                retries += 1
+                self.metrics.count("retries", endpointName)
+                _LOGGER.debug("Retrying %s %s in %.2f seconds (retry %s)", method, url, delay, retries)
+                await asyncio.sleep(delay)
+        finally:
+            # Logging in failed, the request was cancelled or it never got an answer
+            if permitted:
+                breaker.release()
+
+    async def __write(self, key: Hashable, send: Callable[[], Awaitable[Any]]):
+        """ Send a write, or let the coalescer send only the latest one when enabled """
+        if self._commands is None:
+            return await send()
+        return await self._commands.submit(key, send)
+
+    def __remember(self, state: Hashable, value: Any, bed_id: str):
+        """ Record the last known state of part of a bed """
+        self._last_state[(bed_id, state)] = value
+
+    async def __put_state(self, state: Hashable, value: Any, endpoint: str, data: dict, force: bool):
+        """ PUT a change unless the bed is already known to be in that state """
+        key = (self._bedId, state)
+        if self._elide_writes and not force and self._last_state.get(key, None) == value:
+            _LOGGER.debug("Skipping %s, %s is already %s", endpoint, state, value)
+            self.elided_writes += 1
+            self.metrics.count("elided_writes", endpoint)
+            return
+        # Until the PUT succeeds the bed may or may not have changed
+        self._last_state.pop(key, None)
+        await self.__request(endpoint, data=data)
+        self._last_state[key] = value
+
+    async def __wait_for_rate_limit(self):
+        """ Queue locally until the rate limiter lets a request through """
+        if self._rate_limiter is None:
+            return
+        started = time.perf_counter()
+        waited = await self._rate_limiter.acquire(self._username)
+        if waited:
+            if self._tracer is not None:
+                self._tracer.add("wait for rate limit", PHASE, started, time.perf_counter())
+            self.rate_limit_wait += waited
+            self.metrics.wait(waited)
+            _LOGGER.debug("Rate limited for %.3f seconds", waited)
+
+    def __conditional_headers(self, key: Optional[Hashable]) -> dict:
+        """ Request headers, asking for a 304 if the last response is still current """
+        decoded = self._decoded.get(key) if key is not None else None
+        if decoded is None or not (decoded.etag or decoded.last_modified):
+            return DEFAULT_HEADERS
+        headers = dict(DEFAULT_HEADERS)
+        if decoded.etag:
+            headers["If-None-Match"] = decoded.etag
+        if decoded.last_modified:
+            headers["If-Modified-Since"] = decoded.last_modified
+        return headers
+
+    async def __send_once(
+        self,
+        method: str,
+        endpointName: str,
+        url: str,
+        params: dict,
+        data: Optional[dict],
+        headers: dict,
+        ) -> Tuple[int, Any, Optional[bytes]]:
+        """ Send a request once, returns its status, headers and body """
+        async with self.__get_request_slots():
+            # Only the time on the wire is measured, not the wait for a slot
+            started = time.perf_counter()
+            outcome: Any = "error"
+            received = 0
+            try:
+                with self.__span(f"{method} {endpointName}", HTTP) as span:
+                    response = await self._websession.request(
+                        method,
+                        url,
+                        json=data,
+                        headers=headers,
+                        params=params
+                    )
+                    try:
+                        if response.status >= 400 or response.status == 304:
+                            body = None
+                            received = response.content_length or 0
+                        else:
+                            with self.__span("read body", PHASE):
+                                body = await response.read()
+                            received = len(body)
+                        outcome = response.status
+                        span.set(status=outcome, bytes=received)
+                        return response.status, response.headers, body
+                    finally:
+                        response.release()
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                # json.dumps escapes everything outside ASCII, its length is the byte count
+                sent = len(json.dumps(data)) if data is not None else 0
+                self.metrics.observe(endpointName, outcome, time.perf_counter() - started, received, sent)
+
+    async def __materialize(
+        self,
+        key: Optional[Hashable],
+        build: Optional[Callable[[Any], Any]],
+        status: int,
+        headers,
+        body: Optional[bytes],
+        ) -> Any:
+        """ Decode and build a response, reusing the last result if the body didn't change """
+        decoded = self._decoded.get(key) if key is not None else None
+        if status == 304:
+            if decoded is None:
+                raise SleepiError("Unexpected 304 Not Modified from the SleepIQ servers")
+            self.decode_stats["not_modified"] += 1
+            self.metrics.count("not_modified", key[0])
+            return decoded.value
+
+        content_type = headers.get("Content-Type", "")
         if "application/json" not in content_type:
-            text = await response.text()
             raise SleepiError(
                 "Unexpected response from the SleepIQ servers",
-                {"Content-Type": content_type, "response": text},
+                {"Content-Type": content_type, "response": body.decode("utf-8", "replace")},
             )
 
-        return await response.json()
-
-    async def get_privacy_mode(self):
+        if key is None or not self._skip_unchanged:
+            value = await self.__decode(body)
+            return self.__build(build, value) if build is not None else value
+
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        if decoded is not None and decoded.digest == digest:
+            self.decode_stats["hits"] += 1
+            self.metrics.count("unchanged", key[0])
+            return decoded.value
+
+        self.decode_stats["misses"] += 1
+        value = await self.__decode(body)
+        if build is not None:
+            value = self.__build(build, value)
+        self._decoded[key] = _Decoded(
+            digest, headers.get("ETag"), headers.get("Last-Modified"), value
+        )
+        return value
+
+    async def __decode(self, body: bytes) -> Any:
+        """ Parse a JSON body, in the executor when it is large """
+        if not body.strip():
+            return None
+        with self.__span("decode", PHASE, bytes=len(body)):
+            if self._offload_threshold is not None and len(body) >= self._offload_threshold:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, self._json_loads, body)
+            return self._json_loads(body)
+
+    def __build(self, build: Callable[[Any], Any], value: Any) -> Any:
+        """ Build the models of a decoded response """
+        with self.__span("build", PHASE, model=getattr(build, "__qualname__", None)):
+            return build(value)
+
+    @traced
+    async def get_privacy_mode(self, bed_id: Optional[str] = None):
         """ Get the status of privacy mode """
-        endpoint = "bed/" + self._bedId + "/pauseMode"
-        data = await self.__request(endpoint)
-        return PrivacyMode.from_dict(data)
+        endpoint = "bed/" + (bed_id or self._bedId) + "/pauseMode"
+        return await self.__request(endpoint, build=PrivacyMode.from_dict)
 
+    @traced
     async def turn_on_privacy_mode(self):
         """ Get the status of privacy mode """
         endpoint = "bed/" + self._bedId + "/pauseMode"
@@ -181,6 +771,7 @@ class SleepIQ:
         params = {"mode": "on"}
         return await self.__request(endpoint, data=data, params=params)
 
+    @traced
     async def turn_off_privacy_mode(self):
         """ Get the status of privacy mode """
         endpoint = "bed/" + self._bedId + "/pauseMode"
@@ -188,12 +779,13 @@ class SleepIQ:
         params = {"mode": "off"}
         return await self.__request(endpoint, data=data, params=params)
 
-    async def get_responsive_air(self):
+    @traced
+    async def get_responsive_air(self, bed_id: Optional[str] = None):
         """ Responsive air status """
-        endpoint = "bed/" + self._bedId + "/responsiveAir"
-        data = await self.__request(endpoint)
-        return Responsive_Air.from_dict(data)
+        endpoint = "bed/" + (bed_id or self._bedId) + "/responsiveAir"
+        return await self.__request(endpoint, build=Responsive_Air.from_dict)
 
+    @traced
     async def turn_on_responsive_air(self, side: str):
         """ Set responsive air """
         data = None
@@ -205,6 +797,7 @@ class SleepIQ:
         endpoint = "bed/" + self._bedId + "/responsiveAir"
         return await self.__request(endpoint, data=data)
 
+    @traced
     async def turn_off_responsive_air(self, side: str):
         """ Set responsive air """
         data = None
@@ -216,20 +809,24 @@ class SleepIQ:
         endpoint = "bed/" + self._bedId + "/responsiveAir"
         return await self.__request(endpoint, data=data)
 
+    @traced
     async def get_sleepers(self):
         """ Sleepers """
-        sleepers = []
-        data = await self.__request("sleeper")
-        for side in data["sleepers"]:
-            sleepers.append(Sleeper.from_dict(side))
-        return sleepers
+        return await self.__request("sleeper", build=_sleepers_from_dict)
 
-    async def get_footwarming(self):
+    @traced
+    async def get_footwarming(self, bed_id: Optional[str] = None):
         """ Foot warming """
-        endpoint = "bed/" + self._bedId + "/foundation/footwarming"
-        data = await self.__request(endpoint)
-        return FootWarming.from_dict(data)
+        endpoint = "bed/" + (bed_id or self._bedId) + "/foundation/footwarming"
+        return await self.__request(endpoint, build=FootWarming.from_dict)
+
+    async def __get_footwarming(self, capabilities: Optional[Mapping[str, bool]], bed_id: str):
+        """ Foot warming, unless the foundation is known not to have it """
+        if capabilities is not None and not capabilities['hasFootWarming']:
+            return None
+        return await self.get_footwarming(bed_id)
 
+    @traced
     async def turn_on_foot_warming(self, side, setting, timer=120):
         """ Foot warming """
         data = None
@@ -252,6 +849,7 @@ class SleepIQ:
         endpoint = "bed/" + self._bedId + "/foundation/footwarming"
         return await self.__request(endpoint, data=data)
 
+    @traced
     async def turn_off_foot_warming(self, side):
         """ Foot warming """
         data = None
@@ -263,88 +861,163 @@ class SleepIQ:
         endpoint = "bed/" + self._bedId + "/foundation/footwarming"
         return await self.__request(endpoint, data=data)
 
-    async def get_foundation_underbed_light(self):
+    @traced
+    async def get_foundation_underbed_light(self, bed_id: Optional[str] = None):
         """ Foundations """
-        endpoint = "bed/" + self._bedId + "/foundation/underbedLight"
-        data = await self.__request(endpoint)
-        return Foundation.from_dict(data)
-
-    async def get_foundation(self):
+        bed_id = bed_id or self._bedId
+        endpoint = "bed/" + bed_id + "/foundation/underbedLight"
+        light = await self.__request(endpoint, build=UnderbedLight.from_dict)
+        if light is not None:
+            self.__remember("autoLight", light.enableAuto, bed_id)
+        return light
+
+    @traced
+    async def get_foundation(self, bed_id: Optional[str] = None):
         """ Foundations """
-        endpoint = "bed/" + self._bedId + "/foundation/system"
-        data = await self.__request(endpoint)
-        return Foundation.from_dict(data)
+        bed_id = bed_id or self._bedId
+        endpoint = "bed/" + bed_id + "/foundation/system"
+        foundation = await self.__request(endpoint, build=Foundation.from_dict)
+        if foundation is not None:
+            self._capabilities[bed_id] = foundation_features(
+                foundation.fsBedType, foundation.fsBoardFeatures
+            )
+            self.__remember(
+                "underbedLightPWM",
+                (foundation.fsLeftUnderbedLightPWM, foundation.fsRightUnderbedLightPWM),
+                bed_id,
+            )
+        return foundation
 
-    async def get_foundation_status(self):
+    @traced
+    async def get_foundation_status(self, bed_id: Optional[str] = None):
         """ Foundations """
-        endpoint = "bed/" + self._bedId + "/foundation/status"
-        data = await self.__request(endpoint)
-        return Foundation_Status.from_dict(data)
-
-    async def get_family_status(self):
-        """ Family status """
-        family_status = []
-        data: FamilyStatus = await self.__request("bed/familyStatus")
-        family_status.append(Side.from_dict(data["beds"][0]["leftSide"], "left"))
-        family_status.append(Side.from_dict(data["beds"][0]["rightSide"], "right"))
-        return family_status
-
-    async def set_light_brightness(self, lightLevel: str):
-        """ """
-        if lightLevel.lower() == "high":
-            endpoint = "bed/" + self._bedId + "/foundation/system"
-            data = {"fsLeftUnderbedLightPWM": 100, "fsRightUnderbedLightPWM": 100}
-            await self.__request(endpoint, data=data)
-            await self.turn_off_auto_light()
-        elif lightLevel.lower() in ('medium', 'med'):
-            endpoint = "bed/" + self._bedId + "/foundation/system"
-            data = {"fsLeftUnderbedLightPWM": 30, "fsRightUnderbedLightPWM": 30}
-            await self.__request(endpoint, data=data)
-            await self.turn_off_auto_light()
-        elif lightLevel.lower() == "low":
+        endpoint = "bed/" + (bed_id or self._bedId) + "/foundation/status"
+        return await self.__request(endpoint, build=Foundation_Status.from_dict)
+
+    @traced
+    async def get_family_status(self, bed_id: Optional[str] = None):
+        """ Family status, of the account's first bed while no bed id is known """
+        statuses = await self.__request("bed/familyStatus", build=_family_statuses_from_dict)
+        bed_id = bed_id or self._bedId
+        if bed_id is None:
+            return list(next(iter(statuses.values())))
+        return list(statuses[bed_id])
+
+    @traced
+    async def set_light_brightness(self, lightLevel: str, force: bool = False):
+        """ Set the underbed light brightness and turn off the auto light
+
+        Writes that would not change the last polled or written state are
+        skipped unless force is set.
+        """
+        if lightLevel.lower() in UNDERBED_LIGHT_PWM:
+            pwm = UNDERBED_LIGHT_PWM[lightLevel.lower()]
             endpoint = "bed/" + self._bedId + "/foundation/system"
-            data = {"fsLeftUnderbedLightPWM": 1, "fsRightUnderbedLightPWM": 1}
-            await self.__request(endpoint, data=data)
-            await self.turn_off_auto_light()
-        elif lightLevel.lower() == "off":
-            self.turn_off_light()
+            data = {"fsLeftUnderbedLightPWM": pwm, "fsRightUnderbedLightPWM": pwm}
 
-    async def turn_on_auto_light(self):
+            async def send():
+                await self.__put_state("underbedLightPWM", (pwm, pwm), endpoint, data, force)
+                await self.turn_off_auto_light(force)
+
+            await self.__write(("brightness", self._bedId), send)
+
+    @traced
+    async def turn_on_auto_light(self, force: bool = False):
         """ """
         endpoint = "bed/" + self._bedId + "/foundation/underbedLight"
         data = {"enableAuto": True}
-        await self.__request(endpoint, data=data)
+        await self.__put_state("autoLight", True, endpoint, data, force)
 
-    async def turn_off_auto_light(self):
+    @traced
+    async def turn_off_auto_light(self, force: bool = False):
         """ """
         endpoint = "bed/" + self._bedId + "/foundation/underbedLight"
         data = {"enableAuto": False}
-        await self.__request(endpoint, data=data)
+        await self.__put_state("autoLight", False, endpoint, data, force)
 
+    @traced
     async def turn_on_light(
         self,
         outletID: int,
-        lightLevel: str = ""
+        lightLevel: str = "",
+        force: bool = False,
         ):
         """ Turn on a light """
         if lightLevel.lower() == "auto":
-            await self.turn_on_auto_light()
+            await self.turn_on_auto_light(force)
         else:
-            await self.set_light_brightness(lightLevel)
+            await self.set_light_brightness(lightLevel, force)
 
         endpoint = "bed/" + self._bedId + "/foundation/outlet"
         data = {"outletId": outletID, "setting": 1}
-        await self.__request(endpoint, data=data)
+        await self.__put_state(("outlet", outletID), 1, endpoint, data, force)
 
+    @traced
     async def turn_off_light(
         self,
         outletID: int,
+        force: bool = False,
         ):
         """ Turn off a light """
         endpoint = "bed/" + self._bedId + "/foundation/outlet"
         data = {"outletId": outletID, "setting": 0}
-        await self.__request(endpoint, data=data)
-
+        await self.__put_state(("outlet", outletID), 0, endpoint, data, force)
+
+    async def __get_outlets(self, outlet_ids, bed_id: str) -> Dict[int, dict]:
+        """ Read the raw status of several outlets concurrently """
+        endpoint = "bed/" + bed_id + "/foundation/outlet"
+        missing = self._missing_outlets.setdefault(bed_id, set())
+        outlet_ids = [outlet for outlet in outlet_ids if outlet not in missing]
+        results = await self.__gather(
+            *[self.__request(endpoint, {"outletId": outlet}) for outlet in outlet_ids]
+        )
+
+        outlets = {}
+        for outlet, data in zip(outlet_ids, results):
+            if data is None:
+                # A 404 means this foundation has no such outlet
+                _LOGGER.debug("Outlet %s not found on bed %s", outlet, bed_id)
+                missing.add(outlet)
+            else:
+                outlets[outlet] = data
+                self.__remember(("outlet", outlet), data["setting"], bed_id)
+        return outlets
+
+    def __build_lights(self, outlets: Dict[int, dict], lightLevelData: int) -> Dict[int, Light]:
+        """ Turn raw outlet data into lights """
+        return {
+            outlet: Light.from_dict(data, f"Sleep Number light {outlet}", lightLevelData, True)
+            for outlet, data in outlets.items()
+        }
+
+    @traced
+    async def get_lights(
+        self,
+        outlet_ids=BED_LIGHTS,
+        lightLevelData: int = 0,
+        bed_id: Optional[str] = None,
+        ) -> Dict[int, Light]:
+        """ Get the status of several lights at once, keyed by outlet id
+
+        Outlets that SleepIQ reported as missing on an earlier call are
+        skipped, see reset_missing_outlets.
+        """
+        for outlet in outlet_ids:
+            if outlet not in BED_LIGHTS:
+                raise ValueError(f"Invalid outlet {outlet}. It must be one of {BED_LIGHTS}")
+        outlets = await self.__get_outlets(outlet_ids, bed_id or self._bedId)
+        return self.__build_lights(outlets, lightLevelData)
+
+    def reset_missing_outlets(self):
+        """ Forget which outlets were missing so the next poll asks for all of them again
+
+        The foundation features are forgotten too, until the foundation is
+        fetched again refresh asks for every outlet and for foot warming.
+        """
+        self._missing_outlets.clear()
+        self._capabilities.clear()
+
+    @traced
     async def get_light_status(
         self,
         outletID: int = 0,
@@ -353,22 +1026,15 @@ class SleepIQ:
         """ Get the status of a light """
         # endpoint = "bed/" + self._bedId + "/foundation/system"
         # lightLevelData = await self.__request(endpoint)
-        lights = []
-
-        endpoint = "bed/" + self._bedId + "/foundation/outlet"
         if outletID == 0:
-            for light in range(1, 5):
-                params = {"outletId": light}
-                data = await self.__request(endpoint, params)
-                name = f"Sleep Number light {light}"
-                lights.append(Light.from_dict(data, name, lightLevelData, True))
-        else:
-                params = {"outletId": outletID}
-                data = await self.__request(endpoint, params)
-                name = f"Sleep Number light {outletID}"
-                lights.append(Light.from_dict(data, name, lightLevelData, True))
+            lights = await self.get_lights(lightLevelData=lightLevelData)
+            return list(lights.values())
 
-        return lights
+        endpoint = "bed/" + self._bedId + "/foundation/outlet"
+        params = {"outletId": outletID}
+        data = await self.__request(endpoint, params)
+        name = f"Sleep Number light {outletID}"
+        return [Light.from_dict(data, name, lightLevelData, True)]
 
 
         # endpoint = "bed/" + self._bedId + "/foundation/outlet"
@@ -390,17 +1056,40 @@ class SleepIQ:
 
         # return Light.from_dict(data, name, lightLevelData["fsLeftUnderbedLightPWM"], True)
 
+    @traced
     async def get_bed_id(self) -> str:
-        data = await self.__request("bed")
-        self._bedId = str(data["beds"][0]["bedId"])
-        return str(data["beds"][0]["bedId"])
+        """ Id of the account's first bed, which becomes the bed this client talks to """
+        beds = await self.get_beds()
+        if not beds:
+            raise SleepiGenericError("No bed found")
+        self._bedId = str(beds[0].bedId)
+        return self._bedId
+
+    @traced
+    async def get_bed(self, bed_id: Optional[str] = None) -> Bed:
+        """ Get the latest bed information from SleepIQ
+
+        Without a bed id this is the account's first bed, which becomes the
+        bed this client talks to.
+        """
+        if bed_id is not None:
+            for bed in await self.get_beds():
+                if str(bed.bedId) == bed_id:
+                    return bed
+            raise SleepiGenericError(f"Bed {bed_id} not found")
+        bed = await self.__request("bed", build=Bed.from_dict)
+        self._bedId = str(bed.bedId)
+        return bed
 
-    async def get_bed(self) -> Bed:
-        """ Get the latest bed information from SleepIQ """
-        data = await self.__request("bed")
-        self._bedId = str(data["beds"][0]["bedId"])
-        return Bed.from_dict(data)
+    @traced
+    async def get_beds(self) -> List[Bed]:
+        """ Get the latest information of every bed of the account """
+        beds = await self.__request("bed", build=_beds_from_dict)
+        if beds and self._bedId is None:
+            self._bedId = str(beds[0].bedId)
+        return beds
 
+    @traced
     async def set_preset_foundation_position(self, preset: int, side: str, slowSpeed = False):
         """ Set a specific side to a preset foundation position """
         # preset 1-6
@@ -421,6 +1110,7 @@ class SleepIQ:
         else:
             raise ValueError("Invalid preset")
 
+    @traced
     async def set_foundation_position(self, side, actuator, position, slowSpeed=False):
         #
         # side "R" or "L"
@@ -446,8 +1136,12 @@ class SleepIQ:
 
         endpoint = "bed/" + self._bedId + "/foundation/adjustment/micro"
         data = {'position': position, 'side': side, 'actuator': actuator, 'speed': 1 if slowSpeed else 0}
-        await self.__request(endpoint, data=data)
+        await self.__write(
+            ("position", self._bedId, side, actuator),
+            partial(self.__request, endpoint, data=data),
+        )
 
+    @traced
     async def get_sleepnumber(self, side):
         """ Return the currently assigned sleep number to a specified side """
         endpoint = "bed/" + self._bedId + "/sleepNumber"
@@ -459,6 +1153,7 @@ class SleepIQ:
         data = await self.__request(endpoint, params=params)
         return data["sleepNumber"] 
 
+    @traced
     async def set_sleepnumber(self, side: str, setting: int):
 
         if not 0 <= setting <= 100:
@@ -472,12 +1167,14 @@ class SleepIQ:
         
         endpoint = "bed/" + self._bedId + "/sleepNumber"
         data = {'side': side, "sleepNumber": int(round(setting/5))*5}
-        await self.__request(endpoint, data=data)     
+        await self.__write(("sleepNumber", self._bedId, side), partial(self.__request, endpoint, data=data))     
 
-    async def get_favorite_sleepnumber(self):
-        endpoint = "bed/" + self._bedId + "/sleepNumberFavorite"
+    @traced
+    async def get_favorite_sleepnumber(self, bed_id: Optional[str] = None):
+        endpoint = "bed/" + (bed_id or self._bedId) + "/sleepNumberFavorite"
         return await self.__request(endpoint)
 
+    @traced
     async def set_favorite_sleepnumber(self, side: str, setting: int):
 
         if not 0 <= setting <= 100:
@@ -493,71 +1190,172 @@ class SleepIQ:
         data = {'side': side, "sleepNumberFavorite": int(round(setting/5))*5}
         await self.__request(endpoint, data=data)
 
-    def __feature_check(self, value, digit):
-        return ((1 << digit) & value) > 0
-
+    @traced
     async def get_foundation_features(self, bed: Bed):
         """ Foundation features """
-        foundation_features = []
-        board_features: int = bed.foundation.fsBoardFeatures
-        bed_type: int = bed.foundation.fsBedType
-        data = {}
-        if bed_type == 0:
-            data['single'] = True
-        elif bed_type == 1:
-            data['splitHead'] = True
-        elif bed_type == 2:
-            data['splitKing'] = True
-        elif bed_type == 3:
-            data['easternKing'] = True
-
-        data['boardIsASingle'] = self.__feature_check(board_features, 0)
-        data['hasMassageAndLight'] = self.__feature_check(board_features, 1)
-        data['hasFootControl'] = self.__feature_check(board_features, 2)
-        data['hasFootWarming'] = self.__feature_check(board_features, 3)
-        data['hasUnderbedLight'] = self.__feature_check(board_features, 4)
+        data = dict(foundation_features(bed.foundation.fsBedType, bed.foundation.fsBoardFeatures))
         data['leftUnderbedLightPMW'] = bed.foundation.fsLeftUnderbedLightPWM
         data['rightUnderbedLightPMW'] = bed.foundation.fsRightUnderbedLightPWM
+        return [data]
 
+    def capabilities(self, bed_id: Optional[str] = None) -> Optional[Mapping[str, bool]]:
+        """ Features of the bed's foundation, known once the foundation has been fetched """
+        return self._capabilities.get(bed_id or self._bedId)
 
-        if data['hasMassageAndLight']:
-            data['hasUnderbedLight'] = True
-        if data['splitKing'] or data['splitHead']:
-            data['boardIsASingle'] = False
+    async def __gather(self, *aws):
+        """ Run awaitables concurrently and cancel the rest if one fails """
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
 
-        foundation_features.append(data)
-        return foundation_features
-    
-    async def fetch_homeassistant_data(self) -> Bed:
-        """ Fetch the latest data from SleepIQ """
-        bed: Bed = await self.get_bed()
-        family_status: FamilyStatus = await self.get_family_status()
-        sleepers = await self.get_sleepers()
-        bed.foundation = await self.get_foundation()
-        bed.lights = await self.get_light_status(lightLevelData=bed.foundation.fsLeftUnderbedLightPWM)
-        bed.foundation.foundation_status = await self.get_foundation_status()
-        bed.foundation.features = await self.get_foundation_features(bed)
-        sleep_number_favorite = await self.get_favorite_sleepnumber()
-        bed.responsive_air = await self.get_responsive_air()
-        bed.privacy_mode = await self.get_privacy_mode()
-        bed.foot_warming = await self.get_footwarming()
-        side: Side
-        sleeper: Sleeper
+    async def watch(
+        self,
+        interval: timedelta = DEFAULT_STATE_UPDATE_INTERVAL,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        overflow: str = DROP_OLDEST,
+        ) -> AsyncIterator[List[Change]]:
+        """ Iterate over the field level changes of the bed between polls
+
+        Each item lists the changes one poll of fetch_homeassistant_data
+        brought, the first one every field of the bed. All watchers of a
+        client share one poller. When a subscriber falls more than maxsize
+        polls behind, overflow decides whether the oldest or newest batch
+        is dropped or the poller waits for it.
+        """
+        if self._watcher is None:
+            self._watcher = Watcher(self.fetch_homeassistant_data)
+        subscription = self._watcher.subscribe(interval.total_seconds(), maxsize, overflow)
+        try:
+            while True:
+                yield await subscription.get()
+        finally:
+            subscription.close()
 
-        for side in family_status:
-            if side.side == "left":
-                bed.left_side = side
-                for sleeper in sleepers:
-                    if bed.sleeperLeftId == sleeper.sleeperId:
-                        side.sleeper = sleeper
-                        side.sleeper.favorite = sleep_number_favorite['sleepNumberFavoriteLeft']
-            else:
-                bed.right_side = side
-                for sleeper in sleepers:
-                    if bed.sleeperRightId == sleeper.sleeperId:
-                        side.sleeper = sleeper
-                        side.sleeper.favorite = sleep_number_favorite['sleepNumberFavoriteRight']
+    @traced
+    async def fetch_homeassistant_data(self) -> Bed:
+        """ Fetch the latest data from SleepIQ
 
+        The bed is fetched first since every other endpoint needs its id,
+        then every subsystem is refreshed, see refresh.
+        """
+        bed: Bed = await self.get_bed()
+        await self.refresh(bed)
         return bed
 
+    @traced
+    async def refresh(self, bed: Bed, subsystems: Iterable[str] = SUBSYSTEMS) -> List[Change]:
+        """ Update only the given subsystems of a bed, in place
+
+        Returns the fields that changed. The endpoints are requested
+        concurrently, limited by max_concurrent_requests. The lights and the
+        foundation features are derived from the foundation system data so
+        they wait for it, although the outlets themselves are read in
+        parallel with it.
+
+        Once the foundation's features are known, the foot warming and the
+        outlets it doesn't have are no longer requested.
+        """
+        subsystems = set(subsystems)
+        unknown = subsystems - SUBSYSTEMS
+        if unknown:
+            raise ValueError(f"Invalid subsystems {sorted(unknown)}. They must be in {sorted(SUBSYSTEMS)}")
+        bed_id = str(bed.bedId)
+        if self._bedId is None:
+            self._bedId = bed_id
+        old = attr.evolve(bed)
+        capabilities = self.capabilities(bed_id)
+
+        jobs: Dict[str, Awaitable] = {}
+        if FOUNDATION in subsystems or LIGHTS in subsystems:
+            foundation = asyncio.ensure_future(self.get_foundation(bed_id))
+            jobs[FOUNDATION] = foundation
+        if FOUNDATION in subsystems:
+            jobs["foundation_status"] = self.get_foundation_status(bed_id)
+        if LIGHTS in subsystems:
+            outlet_ids = BED_LIGHTS
+            if capabilities is not None:
+                outlet_ids = [
+                    outlet for outlet in BED_LIGHTS
+                    if outlet not in OUTLET_FEATURES or capabilities[OUTLET_FEATURES[outlet]]
+                ]
+
+            async def get_lights():
+                # The outlets are read alongside the foundation, only building
+                # the lights has to wait for its PWM level. Shielded so a failing
+                # outlet read doesn't cancel the shared task.
+                outlets = await self.__get_outlets(outlet_ids, bed_id)
+                system = await asyncio.shield(foundation)
+                lights = self.__build_lights(outlets, system.fsLeftUnderbedLightPWM)
+                return list(lights.values())
+
+            jobs[LIGHTS] = get_lights()
+        if OCCUPANCY in subsystems:
+            jobs[OCCUPANCY] = self.get_family_status(bed_id)
+        if SLEEPERS in subsystems:
+            jobs[SLEEPERS] = self.get_sleepers()
+        if FAVORITES in subsystems:
+            jobs[FAVORITES] = self.get_favorite_sleepnumber(bed_id)
+        if RESPONSIVE_AIR in subsystems:
+            jobs[RESPONSIVE_AIR] = self.get_responsive_air(bed_id)
+        if PRIVACY in subsystems:
+            jobs[PRIVACY] = self.get_privacy_mode(bed_id)
+        if FOOT_WARMING in subsystems:
+            jobs[FOOT_WARMING] = self.__get_footwarming(capabilities, bed_id)
+        results = dict(zip(jobs, await self.__gather(*jobs.values())))
+
+        if FOUNDATION in subsystems:
+            bed.foundation = results[FOUNDATION]
+            bed.foundation.foundation_status = results["foundation_status"]
+            bed.foundation.features = await self.get_foundation_features(bed)
+        if LIGHTS in subsystems:
+            bed.lights = results[LIGHTS]
+        if RESPONSIVE_AIR in subsystems:
+            bed.responsive_air = results[RESPONSIVE_AIR]
+        if PRIVACY in subsystems:
+            bed.privacy_mode = results[PRIVACY]
+        if FOOT_WARMING in subsystems:
+            bed.foot_warming = results[FOOT_WARMING]
+        self.__update_sides(bed, results)
+
+        return diff(old, bed)
+
+    def __update_sides(self, bed: Bed, results: Dict[str, Any]):
+        """ Update the sides of a bed and their sleepers from refreshed data """
+        sides = {LEFT: bed.left_side, RIGHT: bed.right_side}
+        side: Side
+        sleeper: Sleeper
 
+        # Sides and sleepers are immutable, changes are made to copies
+        for side in results.get(OCCUPANCY, []):
+            current = sides[side.side]
+            if current is not None:
+                side = attr.evolve(side, sleeper=current.sleeper)
+            sides[side.side] = side
+
+        if SLEEPERS in results or FAVORITES in results:
+            sleeper_ids = {LEFT: bed.sleeperLeftId, RIGHT: bed.sleeperRightId}
+            favorites = {
+                LEFT: "sleepNumberFavoriteLeft",
+                RIGHT: "sleepNumberFavoriteRight",
+            }
+            for name, side in sides.items():
+                if side is None:
+                    continue
+                sleeper = side.sleeper
+                if SLEEPERS in results:
+                    sleeper = None
+                    for candidate in results[SLEEPERS]:
+                        if candidate.sleeperId == sleeper_ids[name]:
+                            sleeper = candidate
+                    if sleeper is not None and side.sleeper is not None:
+                        sleeper = attr.evolve(sleeper, favorite=side.sleeper.favorite)
+                if FAVORITES in results and sleeper is not None:
+                    sleeper = attr.evolve(sleeper, favorite=results[FAVORITES][favorites[name]])
+                sides[name] = attr.evolve(side, sleeper=sleeper)
+
+        bed.left_side = sides[LEFT]
+        bed.right_side = sides[RIGHT]
@@ -0,0 +1,262 @@
+""" Request timeline tracing for Sleepi
+
+    tracer = Tracer()
+    websession = ClientSession(trace_configs=[tracer.trace_config()])
+    api = SleepIQ(username, password, websession, tracer=tracer)
+    await api.fetch_homeassistant_data()
+    tracer.save("refresh.json")  # open in ui.perfetto.dev or chrome://tracing
+
+Spans cover the public calls of SleepIQ, every HTTP request sent and the
+reading, decoding and building of its response. The trace config adds
+waiting for a connection, DNS resolution, connecting and the time to the
+first byte. Every asyncio task gets its own track, so requests running
+concurrently show side by side.
+
+When OpenTelemetry is installed the spans are also sent to its tracer.
+"""
+import asyncio
+import functools
+import heapq
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from aiohttp import TraceConfig
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # pragma: no cover
+    otel_trace = None
+
+DEFAULT_MAX_SPANS = 100000
+# Span categories
+OPERATION = "operation"
+HTTP = "http"
+PHASE = "phase"
+
+_F = TypeVar("_F", bound=Callable[..., Awaitable[Any]])
+
+
+def _attributes(args: Dict[str, Any]) -> Dict[str, Any]:
+    """ Span arguments OpenTelemetry accepts as attributes """
+    return {
+        name: value if isinstance(value, (bool, int, float, str)) else str(value)
+        for name, value in args.items() if value is not None
+    }
+
+
+class Span:
+    """ A span being recorded, use it as a context manager """
+    __slots__ = ("_tracer", "name", "category", "args", "start", "_otel")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any]):
+        """ Initialize """
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+        self._otel = None
+
+    def set(self, **args):
+        """ Add arguments to the span """
+        self.args.update(args)
+
+    def __enter__(self) -> "Span":
+        otel = self._tracer._otel
+        if otel is not None:
+            manager = otel.start_as_current_span(self.name)
+            self._otel = (manager, manager.__enter__())
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self._tracer._record(self.name, self.category, self.start, end, self.args)
+        if self._otel is not None:
+            manager, span = self._otel
+            span.set_attributes(_attributes(self.args))
+            manager.__exit__(exc_type, exc, traceback)
+        return False
+
+
+class _NoSpan:
+    """ Stands in for a span when there is no tracer """
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """ Records spans in memory and exports them as a Chrome trace
+
+    Only the last max_spans spans are kept. With opentelemetry, spans are
+    also sent to OpenTelemetry's tracer when the package is installed.
+    """
+    def __init__(self, max_spans: int = DEFAULT_MAX_SPANS, opentelemetry: bool = True):
+        """ Initialize """
+        if max_spans < 1:
+            raise ValueError("max_spans must be at least 1")
+        self._spans: Deque[Tuple[str, str, int, float, float, Dict[str, Any]]] = deque(maxlen=max_spans)
+        self._origin = time.perf_counter()
+        # Converts perf_counter times to the epoch nanoseconds OpenTelemetry wants
+        self._epoch_ns = time.time_ns() - time.perf_counter_ns()
+        self._otel = otel_trace.get_tracer(__name__) if opentelemetry and otel_trace is not None else None
+        # Track of each running task, numbers of finished tasks are reused
+        self._tracks: Dict[asyncio.Task, int] = {}
+        self._free_tracks: List[int] = []
+        self._track_count = 0
+
+    def __len__(self):
+        return len(self._spans)
+
+    def span(self, name: str, category: str = OPERATION, **args) -> Span:
+        """ A span covering a with block """
+        return Span(self, name, category, args)
+
+    def add(self, name: str, category: str, start: float, end: float, **args):
+        """ Record a span that already ended, start and end are perf_counter times """
+        self._record(name, category, start, end, args)
+        if self._otel is not None:
+            span = self._otel.start_span(
+                name, start_time=self._epoch_ns + int(start * 1e9), attributes=_attributes(args)
+            )
+            span.end(end_time=self._epoch_ns + int(end * 1e9))
+
+    def clear(self):
+        """ Forget the spans recorded so far """
+        self._spans.clear()
+        self._origin = time.perf_counter()
+
+    def _record(self, name: str, category: str, start: float, end: float, args: Dict[str, Any]):
+        self._spans.append((name, category, self.__track(), start, end, args))
+
+    def __track(self) -> int:
+        """ Track of the running task, 0 outside of one """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            return 0
+        if task is None:
+            return 0
+        track = self._tracks.get(task)
+        if track is None:
+            if self._free_tracks:
+                track = heapq.heappop(self._free_tracks)
+            else:
+                self._track_count += 1
+                track = self._track_count
+            self._tracks[task] = track
+            task.add_done_callback(self.__release_track)
+        return track
+
+    def __release_track(self, task: asyncio.Task):
+        heapq.heappush(self._free_tracks, self._tracks.pop(task))
+
+    def trace_config(self) -> TraceConfig:
+        """ An aiohttp trace config recording the phases of every request
+
+        Give it to the ClientSession SleepIQ uses. Spans are recorded for
+        waiting on a free connection, resolving the host, connecting, and
+        from the connection being ready to the response headers.
+        """
+        config = TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.started = time.perf_counter()
+            context.ready = None
+
+        async def on_connection_queued_start(session, context, params):
+            context.queued = time.perf_counter()
+
+        async def on_connection_queued_end(session, context, params):
+            self.add("wait for connection", PHASE, context.queued, time.perf_counter())
+
+        async def on_dns_resolvehost_start(session, context, params):
+            context.resolving = time.perf_counter()
+
+        async def on_dns_resolvehost_end(session, context, params):
+            self.add("dns", PHASE, context.resolving, time.perf_counter(), host=params.host)
+
+        async def on_connection_create_start(session, context, params):
+            context.connecting = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            context.ready = time.perf_counter()
+            self.add("connect", PHASE, context.connecting, context.ready)
+
+        async def on_connection_reuseconn(session, context, params):
+            context.ready = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            start = context.ready if context.ready is not None else context.started
+            self.add("time to first byte", PHASE, start, time.perf_counter(), status=params.response.status)
+
+        config.on_request_start.append(on_request_start)
+        config.on_connection_queued_start.append(on_connection_queued_start)
+        config.on_connection_queued_end.append(on_connection_queued_end)
+        config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        config.on_connection_create_start.append(on_connection_create_start)
+        config.on_connection_create_end.append(on_connection_create_end)
+        config.on_connection_reuseconn.append(on_connection_reuseconn)
+        config.on_request_end.append(on_request_end)
+        return config
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """ The spans in the Chrome trace event format """
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = []
+        tracks = set()
+        for name, category, track, start, end, args in self._spans:
+            tracks.add(track)
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": track,
+                "args": args,
+            })
+        for track in sorted(tracks):
+            events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": track,
+                "args": {"name": f"task {track}" if track else "main"},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path: str):
+        """ Write the spans to a Chrome trace file """
+        with open(path, "w") as trace:
+            json.dump(self.chrome_trace(), trace)
+
+
+def traced(method: _F) -> _F:
+    """ Record a span around every call of a coroutine method of SleepIQ """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        tracer: Optional[Tracer] = self._tracer
+        if tracer is None:
+            return await method(self, *args, **kwargs)
+        with tracer.span(method.__name__, OPERATION):
+            return await method(self, *args, **kwargs)
+    return wrapper  # type: ignore
@@ -0,0 +1,157 @@
+""" Change streams for Sleepi """
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+import attr
+from attr import dataclass
+
+_LOGGER = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+OVERFLOW_POLICIES = [DROP_OLDEST, DROP_NEWEST, BLOCK]
+
+DEFAULT_QUEUE_SIZE = 16
+
+
+@dataclass(frozen=True)
+class Change:
+    """ A field that changed between two polls, e.g. left_side.isInBed """
+    path: str
+    old: Any
+    new: Any
+
+
+def _join(path: str, name) -> str:
+    if isinstance(name, int):
+        return f"{path}[{name}]"
+    return f"{path}.{name}" if path else name
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Change]:
+    """ List the fields that differ between two snapshots
+
+    Models, lists and dicts are compared field by field; anything else is
+    compared as a whole. With old None every field of new is reported.
+    """
+    changes: List[Change] = []
+    _diff(old, new, path, changes)
+    return changes
+
+
+def _diff(old: Any, new: Any, path: str, changes: List[Change]):
+    if old is new:
+        return
+    if attr.has(type(new)) and (old is None or type(old) is type(new)):
+        for field in attr.fields(type(new)):
+            _diff(
+                None if old is None else getattr(old, field.name),
+                getattr(new, field.name),
+                _join(path, field.name),
+                changes,
+            )
+    elif isinstance(new, list) and (old is None or isinstance(old, list)):
+        old = old or []
+        for index in range(max(len(old), len(new))):
+            _diff(
+                old[index] if index < len(old) else None,
+                new[index] if index < len(new) else None,
+                _join(path, index),
+                changes,
+            )
+    elif isinstance(new, dict) and (old is None or isinstance(old, dict)):
+        old = old or {}
+        for name in list(old) + [name for name in new if name not in old]:
+            _diff(old.get(name), new.get(name), _join(path, name), changes)
+    elif old != new:
+        changes.append(Change(path, old, new))
+
+
+class Subscription:
+    """ A subscriber's bounded queue of change batches """
+    def __init__(self, watcher: "Watcher", interval: float, maxsize: int, overflow: str):
+        """ Initialize """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self._watcher = watcher
+        self.interval = interval
+        self.overflow = overflow
+        self.queue: "asyncio.Queue[List[Change]]" = asyncio.Queue(maxsize)
+        # Batches lost to the overflow policy
+        self.dropped = 0
+
+    async def put(self, changes: List[Change]):
+        """ Queue a batch according to the overflow policy """
+        if self.overflow == BLOCK:
+            await self.queue.put(changes)
+            return
+        if self.queue.full():
+            self.dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(changes)
+
+    async def get(self) -> List[Change]:
+        """ Wait for the next batch """
+        return await self.queue.get()
+
+    def close(self):
+        """ Stop receiving changes """
+        self._watcher.unsubscribe(self)
+
+
+class Watcher:
+    """ Poll a snapshot and hand the changes between polls to every subscriber
+
+    One poller is shared by all subscribers and only runs while there is
+    at least one; it polls at the shortest interval they asked for.
+    """
+    def __init__(self, fetch: Callable[[], Awaitable[Any]]):
+        """ Initialize """
+        self._fetch = fetch
+        self._subscriptions: List[Subscription] = []
+        self._task: Optional[asyncio.Future] = None
+        self.snapshot: Any = None
+
+    def subscribe(
+        self,
+        interval: float,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        overflow: str = DROP_OLDEST,
+        ) -> Subscription:
+        """ Add a subscriber, starting the poller if needed """
+        subscription = Subscription(self, interval, maxsize, overflow)
+        if self.snapshot is not None:
+            # Late subscribers start from the current state
+            subscription.queue.put_nowait(diff(None, self.snapshot))
+        self._subscriptions.append(subscription)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.__poll())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """ Remove a subscriber, stopping the poller after the last one """
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+        if not self._subscriptions and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def __poll(self):
+        while True:
+            try:
+                snapshot = await self._fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:  # pylint: disable=broad-except
+                _LOGGER.warning("Polling for changes failed: %s", exception)
+            else:
+                changes = diff(self.snapshot, snapshot)
+                self.snapshot = snapshot
+                if changes:
+                    for subscription in list(self._subscriptions):
+                        await subscription.put(changes)
+            await asyncio.sleep(min(subscription.interval for subscription in self._subscriptions))
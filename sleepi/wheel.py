@@ -0,0 +1,246 @@
+""" Timing wheel polling for Sleepi """
+import asyncio
+import hashlib
+import logging
+import math
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from .fleet import SleepIQFleet
+from .models import Bed
+from .sleepiq import SUBSYSTEMS, SleepIQ
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60.0
+DEFAULT_TICK = 0.1
+DEFAULT_WHEEL_SIZE = 1024
+
+
+def phase_offset(key: Hashable, interval: float) -> float:
+    """ Where in its interval a key is polled, always the same for the same key
+
+    blake2b rather than hash() so the offset doesn't change between runs,
+    the same hash shard_of spreads accounts with.
+    """
+    digest = hashlib.blake2b(str(key).encode(), digest_size=8).digest()
+    # The top 53 bits, all a float holds, so the offset stays below interval
+    return (int.from_bytes(digest, "little") >> 11) / 2 ** 53 * interval
+
+
+class _Entry:
+    """ Something polled by the wheel """
+    __slots__ = ("key", "poll", "interval", "offset", "due", "tick", "task", "lag", "max_lag", "polls", "skipped")
+
+    def __init__(self, key: Hashable, poll: Callable[[], Awaitable[Any]], interval: float):
+        """ Initialize """
+        self.key = key
+        self.poll = poll
+        self.interval = interval
+        self.offset = phase_offset(key, interval)
+        self.due = 0.0
+        self.tick = 0
+        self.task: Optional[asyncio.Future] = None
+        self.lag: Optional[float] = None
+        self.max_lag = 0.0
+        self.polls = 0
+        self.skipped = 0
+
+
+class WheelScheduler:
+    """ Poll many beds on fixed intervals, spread evenly over each interval
+
+    Every bed gets a deterministic phase offset inside its interval, so
+    beds sharing an interval don't all fire at once. Due polls are kept in
+    a hashed timing wheel of wheel_size slots of tick seconds: adding a bed
+    and advancing a tick don't depend on how many beds are scheduled, only
+    on how many are due. Intervals longer than the wheel's span take more
+    than one turn.
+
+    The lag of a poll is how late it started compared to its scheduled
+    time, waiting for one of max_concurrent polls to finish included. A
+    bed whose previous poll is still running when it's due again skips
+    that poll.
+    """
+    def __init__(
+        self,
+        interval: float = DEFAULT_INTERVAL,
+        tick: float = DEFAULT_TICK,
+        wheel_size: int = DEFAULT_WHEEL_SIZE,
+        max_concurrent: Optional[int] = None,
+        on_result: Optional[Callable[[Hashable, Any], Any]] = None,
+        ):
+        """ Initialize """
+        if interval <= 0 or tick <= 0:
+            raise ValueError("interval and tick must be positive")
+        if wheel_size < 1:
+            raise ValueError("wheel_size must be at least 1")
+        self._interval = interval
+        self._tick_length = tick
+        self._slots: List[Dict[Hashable, _Entry]] = [{} for _ in range(wheel_size)]
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._max_concurrent = max_concurrent
+        self._poll_slots: Optional[asyncio.Semaphore] = None
+        self._on_result = on_result
+        self._epoch: Optional[float] = None
+        self._tick = 0
+        self._task: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: Hashable, poll: Callable[[], Awaitable[Any]], interval: Optional[float] = None):
+        """ Poll something every interval seconds, the scheduler's interval by default """
+        if key in self._entries:
+            raise ValueError(f"{key} is already scheduled")
+        entry = _Entry(key, poll, interval or self._interval)
+        self._entries[key] = entry
+        if self._epoch is not None:
+            self.__schedule_first(entry, asyncio.get_running_loop().time())
+
+    def add_bed(
+        self,
+        api: SleepIQ,
+        bed: Bed,
+        interval: Optional[float] = None,
+        subsystems: Iterable[str] = SUBSYSTEMS,
+        ):
+        """ Refresh the given subsystems of a bed every interval seconds """
+        self.add(str(bed.bedId), partial(api.refresh, bed, frozenset(subsystems)), interval)
+
+    def add_fleet(
+        self,
+        fleet: SleepIQFleet,
+        interval: Optional[float] = None,
+        subsystems: Iterable[str] = SUBSYSTEMS,
+        ):
+        """ Refresh every bed the fleet knows of, see SleepIQFleet.discover """
+        for bed_id, bed in fleet.beds.items():
+            if bed_id not in self._entries:
+                self.add_bed(fleet.client(fleet.owner(bed_id)), bed, interval, subsystems)
+
+    def remove(self, key: Hashable):
+        """ Stop polling something, a poll in progress is left to finish """
+        entry = self._entries.pop(key)
+        self._slots[entry.tick % len(self._slots)].pop(key, None)
+
+    def lag(self, key: Hashable) -> Optional[float]:
+        """ How late, in seconds, the latest poll of something started """
+        return self._entries[key].lag
+
+    @property
+    def lags(self) -> Dict[Hashable, Optional[float]]:
+        """ How late the latest poll of everything started """
+        return {key: entry.lag for key, entry in self._entries.items()}
+
+    def stats(self, key: Hashable) -> Dict[str, Any]:
+        """ Polls, skipped polls and lag of something """
+        entry = self._entries[key]
+        return {
+            "offset": entry.offset,
+            "polls": entry.polls,
+            "skipped": entry.skipped,
+            "lag": entry.lag,
+            "max_lag": entry.max_lag,
+        }
+
+    def start(self):
+        """ Start polling in the background """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """ Stop polling and cancel the polls in progress """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        tasks = [entry.task for entry in self._entries.values() if entry.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self):
+        """ Poll until cancelled """
+        loop = asyncio.get_running_loop()
+        self._epoch = loop.time()
+        self._tick = 0
+        for entry in self._entries.values():
+            self.__schedule_first(entry, self._epoch)
+        try:
+            while True:
+                now = loop.time()
+                current = int((now - self._epoch) / self._tick_length)
+                # Catch up on every tick passed since the last wake up
+                while self._tick < current:
+                    self._tick += 1
+                    self.__expire(now)
+                await asyncio.sleep(self._epoch + (self._tick + 1) * self._tick_length - loop.time())
+        finally:
+            self._epoch = None
+            for slot in self._slots:
+                slot.clear()
+
+    def __schedule_first(self, entry: _Entry, now: float):
+        """ Schedule the first poll of an entry at its phase """
+        periods = math.ceil((now - self._epoch - entry.offset) / entry.interval)
+        entry.due = self._epoch + entry.offset + max(periods, 0) * entry.interval
+        self.__insert(entry)
+
+    def __insert(self, entry: _Entry):
+        """ Put an entry in the slot of the tick it is due in """
+        tick = math.ceil((entry.due - self._epoch) / self._tick_length)
+        entry.tick = max(tick, self._tick + 1)
+        self._slots[entry.tick % len(self._slots)][entry.key] = entry
+
+    def __expire(self, now: float):
+        """ Fire the entries due in the current tick """
+        slot = self._slots[self._tick % len(self._slots)]
+        due = [entry for entry in slot.values() if entry.tick == self._tick]
+        for entry in due:
+            del slot[entry.key]
+            if entry.task is not None and not entry.task.done():
+                entry.skipped += 1
+            else:
+                entry.task = asyncio.ensure_future(self.__poll(entry, entry.due))
+            entry.due += entry.interval
+            if entry.due <= now:
+                # Stalled for longer than an interval, skip the missed polls
+                missed = math.ceil((now - entry.due) / entry.interval)
+                entry.skipped += missed
+                entry.due += missed * entry.interval
+            self.__insert(entry)
+
+    def __get_poll_slots(self) -> Optional[asyncio.Semaphore]:
+        """ Semaphore capping the number of polls in progress """
+        if self._max_concurrent is not None and self._poll_slots is None:
+            self._poll_slots = asyncio.Semaphore(self._max_concurrent)
+        return self._poll_slots
+
+    async def __poll(self, entry: _Entry, scheduled: float):
+        """ Poll an entry and record how late it started """
+        slots = self.__get_poll_slots()
+        if slots is not None:
+            await slots.acquire()
+        try:
+            entry.lag = asyncio.get_running_loop().time() - scheduled
+            entry.max_lag = max(entry.max_lag, entry.lag)
+            entry.polls += 1
+            try:
+                result = await entry.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:  # pylint: disable=broad-except
+                _LOGGER.warning("Polling %s failed: %s", entry.key, exception)
+                return
+        finally:
+            if slots is not None:
+                slots.release()
+
+        if self._on_result is not None:
+            result = self._on_result(entry.key, result)
+            if asyncio.iscoroutine(result):
+                await result
@@ -0,0 +1,45 @@
+""" Shared fixtures of the Sleepi tests """
+import asyncio
+import inspect
+from contextlib import asynccontextmanager
+
+import aiohttp
+import pytest
+
+from sleepi import SleepIQ
+from sleepi.fake import FakeSleepIQ
+
+USERNAME = "user@example.com"
+PASSWORD = "password"
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """ Run coroutine tests in an event loop of their own """
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    arguments = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    asyncio.run(pyfuncitem.obj(**arguments))
+    return True
+
+
+@asynccontextmanager
+async def _sleepiq(beds: int = 1, fake_options: dict = None, **options):
+    fake = FakeSleepIQ(**(fake_options or {}))
+    fake.add_account(USERNAME, PASSWORD, beds=beds)
+    base_url = await fake.start()
+    try:
+        async with aiohttp.ClientSession() as websession:
+            api = SleepIQ(USERNAME, PASSWORD, websession, base_url=base_url, **options)
+            try:
+                yield fake, api
+            finally:
+                await api.close()
+    finally:
+        await fake.close()
+
+
+@pytest.fixture
+def sleepiq():
+    """ async with sleepiq(**options) as (fake, api): a client of a fake with one account """
+    return _sleepiq
@@ -0,0 +1,73 @@
+""" Caching GET responses """
+import asyncio
+import time
+
+from sleepi import ResponseCache
+
+
+def test_responses_expire():
+    cache = ResponseCache(ttls={"bed": 0.05})
+    key = ResponseCache.key("bed")
+    cache.put(key, "beds")
+    assert cache.get(key) == (True, "beds")
+    time.sleep(0.06)
+    assert cache.get(key) == (False, None)
+
+
+def test_endpoints_without_a_ttl_are_not_cached():
+    cache = ResponseCache(ttls={})
+    cache.put(ResponseCache.key("bed"), "beds")
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_size=2, default_ttl=60)
+    first, second, third = (ResponseCache.key(endpoint) for endpoint in ("bed", "sleeper", "bed/familyStatus"))
+    cache.put(first, 1)
+    cache.put(second, 2)
+    cache.get(first)
+    cache.put(third, 3)
+    assert cache.get(second) == (False, None)
+    assert cache.get(first) == (True, 1)
+    assert cache.get(third) == (True, 3)
+
+
+def test_writes_invalidate_their_endpoint_and_related_groups():
+    cache = ResponseCache(default_ttl=60)
+    status = ResponseCache.key("bed/1/foundation/status")
+    system = ResponseCache.key("bed/1/foundation/system")
+    cache.put(status, "status")
+    cache.put(system, "system")
+    generation = cache.generation("bed/1/foundation/status")
+    cache.invalidate("bed/1/foundation/preset")
+    assert cache.get(status) == (False, None)
+    assert cache.get(system) == (True, "system")
+    assert cache.generation("bed/1/foundation/status") != generation
+    assert cache.generation("bed/1/foundation/system") == cache.generation("/bed/1/foundation/system/")
+
+
+async def test_gets_are_answered_from_the_cache_until_a_put(sleepiq):
+    async with sleepiq(cache=ResponseCache()) as (fake, api):
+        await api.get_bed()
+        await api.get_foundation()
+        await api.get_foundation()
+        assert fake.requests["GET foundation/system"] == 1
+        await api.set_light_brightness("high")
+        foundation = await api.get_foundation()
+        assert fake.requests["GET foundation/system"] == 2
+        assert foundation.fsLeftUnderbedLightPWM == 100
+
+
+async def test_a_get_in_flight_during_a_put_is_not_cached(sleepiq):
+    async with sleepiq(cache=ResponseCache(), coalesce_requests=False) as (fake, api):
+        await api.get_bed()
+        # The GET reads the state before the PUT but only answers after it
+        fake.delay("foundation/system", 0.2)
+        get = asyncio.ensure_future(api.get_foundation())
+        await asyncio.sleep(0.05)
+        fake.delay("foundation/system", 0)
+        await api.set_light_brightness("high")
+        stale = await get
+        assert stale.fsLeftUnderbedLightPWM != 100
+        foundation = await api.get_foundation()
+        assert foundation.fsLeftUnderbedLightPWM == 100
@@ -0,0 +1,48 @@
+""" Recording sessions and replaying them offline """
+import json
+
+import aiohttp
+
+from sleepi import SleepIQ
+from sleepi.cassette import REPLAYED_KEY, CassettePlayer, CassetteRecorder
+from sleepi.fake import FakeSleepIQ
+
+
+async def test_a_recorded_session_replays_offline(tmp_path):
+    path = str(tmp_path / "session.json")
+    fake = FakeSleepIQ()
+    fake.add_account("user@example.com", "secret password")
+    recorder = CassetteRecorder(path, upstream=await fake.start())
+    try:
+        async with aiohttp.ClientSession() as websession:
+            api = SleepIQ("user@example.com", "secret password", websession, base_url=await recorder.start())
+            try:
+                await api.login()
+                recorded = await api.fetch_homeassistant_data()
+            finally:
+                await api.close()
+    finally:
+        await recorder.close()
+        await fake.close()
+
+    with open(path) as cassette:
+        text = cassette.read()
+    interactions = json.loads(text)["interactions"]
+    assert "secret password" not in text
+    assert {interaction["endpoint"] for interaction in interactions} >= {"login", "bed"}
+    login = next(interaction for interaction in interactions if interaction["endpoint"] == "login")
+    assert json.loads(login["response"])["key"] == REPLAYED_KEY
+
+    player = CassettePlayer(path)
+    try:
+        async with aiohttp.ClientSession() as websession:
+            api = SleepIQ("user@example.com", "secret password", websession, base_url=await player.start())
+            try:
+                await api.login()
+                replayed = await api.fetch_homeassistant_data()
+            finally:
+                await api.close()
+    finally:
+        await player.close()
+    assert player.misses == []
+    assert replayed == recorded
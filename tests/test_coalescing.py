@@ -0,0 +1,58 @@
+""" Sharing identical requests and coalescing writes """
+import asyncio
+from datetime import timedelta
+
+from sleepi.commands import CommandCoalescer
+
+
+async def test_identical_gets_share_one_request(sleepiq):
+    async with sleepiq(fake_options={"latency": 0.05}) as (fake, api):
+        await api.get_bed()
+        results = await asyncio.gather(*[api.get_foundation_status() for _ in range(5)])
+        assert fake.requests["GET foundation/status"] == 1
+        assert all(result == results[0] for result in results)
+
+
+async def test_gets_are_not_shared_when_disabled(sleepiq):
+    async with sleepiq(coalesce_requests=False, fake_options={"latency": 0.05}) as (fake, api):
+        await api.get_bed()
+        await asyncio.gather(*[api.get_foundation_status() for _ in range(3)])
+        assert fake.requests["GET foundation/status"] == 3
+
+
+async def test_rapid_writes_send_the_latest(sleepiq):
+    async with sleepiq(coalesce_window=timedelta(seconds=0.05)) as (fake, api):
+        bed = await api.get_bed()
+        await asyncio.gather(*[api.set_sleepnumber("left", setting) for setting in (20, 30, 60)])
+        assert fake.requests["PUT sleepNumber"] == 1
+        assert fake.beds[str(bed.bedId)].sides["left"]["sleepNumber"] == 60
+
+
+async def test_writes_that_change_nothing_are_skipped(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.fetch_homeassistant_data()
+        await api.set_light_brightness("high")
+        sent = fake.requests["PUT foundation/system"]
+        await api.set_light_brightness("high")
+        assert fake.requests["PUT foundation/system"] == sent
+        await api.set_light_brightness("high", force=True)
+        assert fake.requests["PUT foundation/system"] > sent
+
+
+async def test_callers_of_a_cancelled_write_do_not_wait_forever():
+    coalescer = CommandCoalescer(0.01)
+    sending = asyncio.Event()
+
+    async def send():
+        sending.set()
+        await asyncio.sleep(10)
+
+    callers = [asyncio.ensure_future(coalescer.submit("light", send)) for _ in range(2)]
+    await sending.wait()
+    # As when the loop shuts down
+    for task in asyncio.all_tasks():
+        if "__send" in task.get_coro().__qualname__:
+            task.cancel()
+    done, _ = await asyncio.wait(callers, timeout=1)
+    assert len(done) == 2
+    assert all(caller.cancelled() for caller in callers)
@@ -0,0 +1,50 @@
+""" Encoding the models into snapshots """
+import tracemalloc
+
+import pytest
+
+from sleepi import codec
+
+
+async def test_round_trip(sleepiq):
+    async with sleepiq() as (fake, api):
+        bed = await api.fetch_homeassistant_data()
+        assert codec.decode(codec.encode(bed)) == bed
+        assert codec.decode(memoryview(codec.encode([bed, bed.lights]))) == [bed, bed.lights]
+
+
+def test_values():
+    value = {"small": 3, "negative": -300, "big": 2 ** 70, "float": 1.5, "text": "é" * 200, "flags": [True, None]}
+    assert codec.decode(codec.encode(value)) == value
+    assert codec.decode(codec.encode((1, "left"))) == [1, "left"]
+
+
+def test_invalid_snapshots():
+    data = codec.encode(["left", 12345])
+    with pytest.raises(ValueError):
+        codec.decode(b"XX" + data[2:])
+    with pytest.raises(ValueError):
+        codec.decode(data[:-1])
+    with pytest.raises(ValueError):
+        codec.decode(data + b"\0")
+    with pytest.raises(TypeError):
+        codec.encode(object())
+
+
+def test_decode_reads_a_memoryview_in_place():
+    value = ["left"] * 200000
+    data = codec.encode(value)
+    buffer = bytearray(b"head") + data + b"tail"
+    view = memoryview(buffer)[4:-4]
+    assert codec.decode(view) == value
+
+    def peak(snapshot):
+        tracemalloc.start()
+        try:
+            codec.decode(snapshot)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # Decoding the view allocates the list, not another copy of the snapshot
+    assert peak(view) < peak(data) + len(data) // 2
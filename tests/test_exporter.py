@@ -0,0 +1,61 @@
+""" The Prometheus exporter """
+import aiohttp
+
+from sleepi import SleepIQFleet
+from sleepi import exporter as exporter_module
+from sleepi.exporter import Exporter, bed_families
+from sleepi.fake import FakeSleepIQ
+
+
+async def test_serves_the_polled_state_without_upstream_requests():
+    fake = FakeSleepIQ()
+    (fake_bed,) = fake.add_account("user", "password")
+    fake_bed.status.update(fsLeftHeadPosition="09", fsRightHeadPosition="0c")
+    fleet = SleepIQFleet(base_url=await fake.start())
+    fleet.add_account("user", "password")
+    exporter = Exporter(fleet, interval=3600)
+    try:
+        url = await exporter.start("127.0.0.1", 0)
+        sent = sum(fake.requests.values())
+        async with aiohttp.ClientSession() as websession:
+            for _ in range(3):
+                async with websession.get(url) as response:
+                    text = await response.text()
+        assert sum(fake.requests.values()) == sent
+    finally:
+        await exporter.close()
+        await fleet.close()
+        await fake.close()
+
+    bed_id = fake_bed.bed_id
+    lines = text.splitlines()
+    assert f'sleepi_foundation_position{{bed_id="{bed_id}",side="left",actuator="head"}} 9' in lines
+    assert f'sleepi_foundation_position{{bed_id="{bed_id}",side="right",actuator="head"}} 12' in lines
+    assert f'sleepi_side_sleep_number{{bed_id="{bed_id}",side="left"}} 40' in lines
+    assert lines[-1] == "# EOF"
+
+
+async def test_scrapes_join_the_lines_rendered_when_beds_were_polled(monkeypatch):
+    fake = FakeSleepIQ()
+    fake.add_account("user", "password", beds=2)
+    fleet = SleepIQFleet(base_url=await fake.start())
+    fleet.add_account("user", "password")
+    exporter = Exporter(fleet, interval=3600)
+    try:
+        await exporter.start("127.0.0.1", 0)
+        body = exporter.render()
+        assert exporter.render() is body
+        expected = bed_families(exporter.beds, exporter._refreshed)
+
+        def bed_chunks(*args):
+            raise AssertionError("a scrape rendered a bed")
+
+        monkeypatch.setattr(exporter_module, "bed_chunks", bed_chunks)
+        # Request metrics are rendered again, the beds are not
+        exporter._rendered -= exporter_module.RENDER_MAX_AGE + 1
+        lines = exporter.render().decode().splitlines()
+        assert lines[:-1] == expected + fleet.metrics.families()
+    finally:
+        await exporter.close()
+        await fleet.close()
+        await fake.close()
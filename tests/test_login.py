@@ -0,0 +1,57 @@
+""" Logging into the fake SleepIQ servers """
+import asyncio
+
+import aiohttp
+import pytest
+
+from sleepi import SleepIQ
+
+
+async def test_login(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.login()
+        assert fake.logins == 1
+        assert (await api.get_bed()).bedId
+
+
+async def test_wrong_password(sleepiq):
+    async with sleepiq() as (fake, api):
+        async with aiohttp.ClientSession() as websession:
+            other = SleepIQ("user@example.com", "wrong", websession, base_url=fake.base_url)
+            with pytest.raises(ValueError):
+                await other.login()
+
+
+async def test_expired_session_logs_in_again(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.get_bed()
+        fake.expire_sessions()
+        assert len(await api.get_beds()) == 1
+        assert fake.logins == 2
+        assert api.metrics.snapshot()["relogins"] == 1
+
+
+async def test_concurrent_requests_share_one_login(sleepiq):
+    async with sleepiq() as (fake, api):
+        bed = await api.get_bed()
+        fake.expire_sessions()
+        await api.refresh(bed)
+        assert fake.logins == 2
+
+
+def _refreshing():
+    return [task for task in asyncio.all_tasks() if "refresh_session" in task.get_coro().__qualname__]
+
+
+async def test_no_background_task_by_default(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.login()
+        assert _refreshing() == []
+
+
+async def test_session_refresh_stops_on_close(sleepiq):
+    async with sleepiq(auto_refresh_session=True) as (fake, api):
+        await api.login()
+        assert len(_refreshing()) == 1
+        await api.close()
+        assert _refreshing() == []
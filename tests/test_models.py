@@ -0,0 +1,29 @@
+""" Copies handed out to callers """
+from sleepi.models import copy_if_mutable
+
+
+async def test_beds_are_not_shared_between_calls(sleepiq):
+    async with sleepiq(beds=2) as (fake, api):
+        first = await api.get_beds()
+        first[0].name = "mutated"
+        second = await api.get_beds()
+        assert second[0].name != "mutated"
+        assert all(a is not b for a, b in zip(first, second))
+        bed = await api.get_bed(str(second[1].bedId))
+        bed.name = "mutated"
+        assert (await api.get_bed(str(bed.bedId))).name != "mutated"
+
+
+async def test_dicts_are_not_shared_between_calls(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.get_bed()
+        favorite = await api.get_favorite_sleepnumber()
+        favorite.clear()
+        assert await api.get_favorite_sleepnumber()
+
+
+def test_nested_containers_are_copied():
+    value = {"a": [{"b": 1}]}
+    copied = copy_if_mutable(value)
+    copied["a"][0]["b"] = 2
+    assert value == {"a": [{"b": 1}]}
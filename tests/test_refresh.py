@@ -0,0 +1,94 @@
+""" Refreshing beds from the fake SleepIQ servers """
+import aiohttp
+import pytest
+
+from sleepi import SleepIQ, SleepIQFleet
+from sleepi.fake import FakeSleepIQ
+from sleepi.sleepiq import LIGHTS, OCCUPANCY
+
+
+async def test_fetch_homeassistant_data(sleepiq):
+    async with sleepiq() as (fake, api):
+        bed = await api.fetch_homeassistant_data()
+        assert bed.left_side.sleepNumber == 40
+        assert bed.right_side.sleepNumber == 50
+        assert bed.left_side.sleeper is not None
+        assert bed.foundation.foundation_status.fsType == "Split King"
+        assert len(bed.lights) == 4
+
+
+async def test_refresh_returns_the_changes(sleepiq):
+    async with sleepiq() as (fake, api):
+        bed = await api.fetch_homeassistant_data()
+        fake.beds[str(bed.bedId)].sides["left"]["isInBed"] = True
+        changes = await api.refresh(bed, {OCCUPANCY})
+        assert [(change.path, change.new) for change in changes] == [("left_side.isInBed", True)]
+        assert bed.left_side.isInBed
+
+
+async def test_partial_refresh_requests_only_its_endpoints(sleepiq):
+    async with sleepiq() as (fake, api):
+        bed = await api.fetch_homeassistant_data()
+        fake.requests.clear()
+        await api.refresh(bed, {LIGHTS})
+        assert set(fake.requests) == {"GET foundation/system", "GET foundation/outlet"}
+
+
+async def test_unknown_subsystem(sleepiq):
+    async with sleepiq() as (fake, api):
+        bed = await api.get_bed()
+        with pytest.raises(ValueError):
+            await api.refresh(bed, {"bogus"})
+
+
+async def test_fleet_refreshes_every_bed():
+    fake = FakeSleepIQ()
+    fake.add_account("one", "password", beds=2)
+    fake.add_account("two", "password")
+    fleet = SleepIQFleet(base_url=await fake.start())
+    try:
+        fleet.add_account("one", "password")
+        fleet.add_account("two", "password")
+        results = await fleet.refresh()
+        assert len(results) == 3
+        assert all(result.error is None for result in results.values())
+        assert {result.username for result in results.values()} == {"one", "two"}
+    finally:
+        await fleet.close()
+        await fake.close()
+
+
+async def test_night_stand_outlets_are_polled_whatever_the_features():
+    fake = FakeSleepIQ()
+    fake.add_account("user@example.com", "password", board_features=0, outlets=(1, 2))
+    async with aiohttp.ClientSession() as websession:
+        api = SleepIQ("user@example.com", "password", websession, base_url=await fake.start())
+        try:
+            bed = await api.fetch_homeassistant_data()
+            fake.requests.clear()
+            await api.refresh(bed, {LIGHTS})
+            # Outlets 3 and 4 need an underbed light, 1 and 2 are asked for
+            assert fake.requests["GET foundation/outlet"] == 2
+            assert [light.outlet for light in bed.lights] == [1, 2]
+
+            api.reset_missing_outlets()
+            assert api.capabilities() is None
+        finally:
+            await api.close()
+            await fake.close()
+
+
+async def test_family_status_of_a_fresh_client_is_the_first_bed(sleepiq):
+    async with sleepiq(beds=2) as (fake, api):
+        first = next(iter(fake.beds.values()))
+        first.sides["left"]["isInBed"] = True
+        left, right = await api.get_family_status()
+        assert left.isInBed
+        assert right.side == "right"
+
+
+async def test_bed_id_is_the_first_bed(sleepiq):
+    async with sleepiq(beds=2) as (fake, api):
+        bed_id = await api.get_bed_id()
+        assert bed_id == next(iter(fake.beds))
+        assert api.bed_id == bed_id
@@ -0,0 +1,115 @@
+""" Retries and the circuit breaker """
+import asyncio
+import time
+
+import pytest
+
+from sleepi import CircuitBreaker, RetryPolicy, SleepiCircuitOpenError, SleepiConnectionError
+from sleepi.retry import CLOSED, HALF_OPEN, OPEN
+
+NO_RETRIES = RetryPolicy(statuses={}, connection_retries=0)
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_released_trial_lets_the_next_one_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_stale_trial_is_given_up_on():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+async def test_retries_server_errors(sleepiq):
+    policy = RetryPolicy(base_delay=0.01, jitter=0)
+    async with sleepiq(retry_policy=policy) as (fake, api):
+        await api.get_bed()
+        fake.fail("bed", 503, 503)
+        assert len(await api.get_beds()) == 1
+        assert fake.requests["GET bed"] == 4
+        assert api.metrics.snapshot()["endpoints"]["bed"]["retries"] == 2
+
+
+async def test_gives_up_after_retries(sleepiq):
+    policy = RetryPolicy(statuses={503: 1}, base_delay=0.01, jitter=0)
+    async with sleepiq(retry_policy=policy) as (fake, api):
+        await api.get_bed()
+        fake.fail("bed", 503, 503)
+        with pytest.raises(SleepiConnectionError):
+            await api.get_beds()
+
+
+async def test_open_circuit_fails_fast(sleepiq):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    async with sleepiq(retry_policy=NO_RETRIES, circuit_breaker=breaker) as (fake, api):
+        await api.get_bed()
+        fake.fail("bed", 503, 503)
+        for _ in range(2):
+            with pytest.raises(SleepiConnectionError):
+                await api.get_beds()
+        sent = fake.requests["GET bed"]
+        with pytest.raises(SleepiCircuitOpenError):
+            await api.get_beds()
+        assert fake.requests["GET bed"] == sent
+
+
+async def test_trial_renewing_the_session_closes_the_circuit(sleepiq):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    async with sleepiq(retry_policy=NO_RETRIES, circuit_breaker=breaker) as (fake, api):
+        await api.get_bed()
+        fake.fail("bed", 503, 503)
+        for _ in range(2):
+            with pytest.raises(SleepiConnectionError):
+                await api.get_beds()
+        await asyncio.sleep(0.1)
+        fake.expire_sessions()
+        assert len(await api.get_beds()) == 1
+        assert breaker.state == CLOSED
+
+
+async def test_cancelled_trial_is_released(sleepiq):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    # Not shared, so cancelling the caller cancels the request itself
+    options = {"retry_policy": NO_RETRIES, "circuit_breaker": breaker, "coalesce_requests": False}
+    async with sleepiq(fake_options={"latency": 0.2}, **options) as (fake, api):
+        await api.get_bed()
+        fake.fail("bed", 503)
+        with pytest.raises(SleepiConnectionError):
+            await api.get_beds()
+        await asyncio.sleep(0.1)
+        trial = asyncio.ensure_future(api.get_beds())
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert len(await api.get_beds()) == 1
+        assert breaker.state == CLOSED
@@ -0,0 +1,73 @@
+""" Polling endpoint groups at their own cadence """
+import asyncio
+
+from sleepi import PollGroup, PollScheduler
+
+
+async def test_slow_group_does_not_hold_back_fast_ones(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.get_bed()
+        polls = {"fast": 0, "slow": 0}
+
+        async def fetch(name, duration):
+            polls[name] += 1
+            await asyncio.sleep(duration)
+            return polls[name]
+
+        scheduler = PollScheduler(api, [
+            PollGroup("fast", lambda: fetch("fast", 0), 0.02, 0.02),
+            PollGroup("slow", lambda: fetch("slow", 10), 0.02, 0.02),
+        ])
+        scheduler.start()
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        assert polls["slow"] == 1
+        assert polls["fast"] >= 5
+
+
+async def test_slow_on_update_does_not_hold_back_polls(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.get_bed()
+        polls = []
+        updates = []
+
+        async def fetch():
+            polls.append(None)
+            return len(polls)
+
+        async def on_update(name, value):
+            updates.append(value)
+            await asyncio.sleep(10)
+
+        scheduler = PollScheduler(api, [PollGroup("counter", fetch, 0.02, 0.02)], on_update=on_update)
+        scheduler.start()
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        assert len(polls) >= 5
+        assert len(updates) == len(polls)
+
+
+async def test_wake_group_change_speeds_up_the_others(sleepiq):
+    async with sleepiq() as (fake, api):
+        await api.get_bed()
+        values = iter([1, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2])
+        polls = {"quiet": 0}
+
+        async def quiet():
+            polls["quiet"] += 1
+            return 0
+
+        async def changing():
+            await asyncio.sleep(0.1)
+            return next(values)
+
+        scheduler = PollScheduler(
+            api,
+            [PollGroup("changing", changing, 0.01, 0.01), PollGroup("quiet", quiet, 0.05, 60)],
+            wake_groups=("changing", "quiet"),
+        )
+        scheduler.start()
+        await asyncio.sleep(0.35)
+        await scheduler.stop()
+        # Polled once, backed off to a minute, then woken by the change
+        assert polls["quiet"] >= 2
@@ -0,0 +1,55 @@
+""" Polling from several processes """
+import asyncio
+from collections import Counter
+
+from sleepi import ShardedRunner
+from sleepi.sharding import shard_of
+from sleepi.wheel import phase_offset
+from sleepi.fake import FakeSleepIQ
+
+ACCOUNTS = [(f"user{index}@example.com", "password") for index in range(4)]
+
+
+def test_shard_of_is_stable():
+    assert [shard_of(username, 3) for username, _ in ACCOUNTS] == [shard_of(username, 3) for username, _ in ACCOUNTS]
+    assert all(0 <= shard_of(username, 3) < 3 for username, _ in ACCOUNTS)
+
+
+def test_shard_of_spreads_similar_usernames_evenly():
+    counts = Counter(shard_of(f"user{index}@example.com", 8) for index in range(10000))
+    assert len(counts) == 8
+    assert all(1100 <= count <= 1400 for count in counts.values())
+
+
+async def test_deltas_come_back_from_every_shard():
+    fake = FakeSleepIQ()
+    for username, password in ACCOUNTS:
+        fake.add_account(username, password)
+    runner = ShardedRunner(ACCOUNTS, processes=2, interval=0.2, flush_interval=0.02, base_url=await fake.start())
+    try:
+        runner.start()
+        deltas = runner.deltas()
+        polled = set()
+        while len(polled) < len(fake.beds):
+            # The first poll of a bed fills in its sides, foundation and lights
+            delta = await asyncio.wait_for(deltas.__anext__(), 30)
+            assert delta.bed_id in fake.beds
+            polled.add(delta.bed_id)
+        for bed in fake.beds.values():
+            bed.sides["left"]["isInBed"] = True
+        changed = set()
+        while len(changed) < len(fake.beds):
+            delta = await asyncio.wait_for(deltas.__anext__(), 30)
+            if ("left_side.isInBed", True) in delta.changes:
+                changed.add(delta.bed_id)
+        assert sum(runner.received) >= 2 * len(fake.beds)
+    finally:
+        await runner.stop()
+        await fake.close()
+
+
+def test_phase_offsets_spread_similar_bed_ids_evenly():
+    counts = Counter(int(phase_offset(str(100000 + index), 60) // 6) for index in range(10000))
+    assert len(counts) == 10
+    assert all(850 <= count <= 1150 for count in counts.values())
+    assert phase_offset("100001", 60) == phase_offset("100001", 60)